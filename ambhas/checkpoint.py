@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 20:05:13 2026
+
+@author: Sat Kumar Tomer
+@website: www.ambhas.com
+@email: satkumartomer@gmail.com
+
+Checkpoints of the state of the models.
+
+The state is given by a list of the attributes of the model (e.g. the
+soil moisture ensemble, the time step, the ensemble of the soil hydraulic
+parameters). These are saved in a compressed numpy (.npz) file together
+with the state of the numpy random number generator, so that a run resumed
+from the checkpoint gives the same results as the uninterrupted run.
+The attributes which are dicts of arrays (e.g. soil_par_ens) are saved one
+item at a time.
+
+Example:
+    save_checkpoint('state.npz', model, ['t', 'theta', 'iter_dt'])
+    load_checkpoint('state.npz', model)
+"""
+
+from __future__ import division
+import os
+import numpy as np
+
+
+def save_checkpoint(fname, model, names, rng=True):
+    """
+    save the attributes of the model into the checkpoint file
+    the file is first written under a temporary name, so that a run killed
+    while writing does not leave a broken checkpoint
+
+    Input:
+        fname: name of the checkpoint file
+        model: the model
+        names: names of the attributes to be saved
+        rng: if True (default), the state of the random number generator is
+        also saved
+    """
+    arrays = {}
+    for name in names:
+        value = getattr(model, name)
+        if isinstance(value, dict):
+            for key in value:
+                arrays['%s/%s'%(name, key)] = np.asarray(value[key])
+        else:
+            arrays[name] = np.asarray(value)
+    if rng:
+        state = np.random.get_state()
+        arrays['rng/name'] = np.asarray(state[0])
+        arrays['rng/keys'] = state[1]
+        arrays['rng/pos'] = np.asarray(state[2])
+        arrays['rng/has_gauss'] = np.asarray(state[3])
+        arrays['rng/cached_gaussian'] = np.asarray(state[4])
+
+    tmp_name = fname + '.tmp'
+    with open(tmp_name, 'wb') as tmp_file:
+        np.savez_compressed(tmp_file, **arrays)
+    if os.path.exists(fname):
+        os.remove(fname)
+    os.rename(tmp_name, fname)
+
+def read_checkpoint(fname):
+    """
+    read the checkpoint file
+
+    Input:
+        fname: name of the checkpoint file
+    Output:
+        state: dict of the saved attributes, the dicts of arrays are
+        restored as dict, and the state of the random number generator is
+        given by the key 'rng'
+    """
+    state = {}
+    with np.load(fname) as data:
+        for name in data.files:
+            value = data[name]
+            if value.ndim == 0:
+                value = value.item()
+            if '/' in name:
+                name, key = name.split('/', 1)
+                state.setdefault(name, {})[key] = value
+            else:
+                state[name] = value
+    if 'rng' in state:
+        rng = state['rng']
+        state['rng'] = (str(rng['name']), rng['keys'], int(rng['pos']),
+                        int(rng['has_gauss']), float(rng['cached_gaussian']))
+    return state
+
+def load_checkpoint(fname, model, names=None, rng=True):
+    """
+    set the attributes of the model from the checkpoint file
+
+    Input:
+        fname: name of the checkpoint file
+        model: the model
+        names: names of the attributes to be set, by default all the saved
+        attributes
+        rng: if True (default), the state of the random number generator is
+        restored
+    Output:
+        state: dict of all the saved attributes, see read_checkpoint
+    """
+    state = read_checkpoint(fname)
+    if names is None:
+        names = [name for name in state if name != 'rng']
+    for name in names:
+        if name not in state:
+            raise ValueError('%s is not present in the checkpoint %s'%(name, fname))
+        setattr(model, name, state[name])
+    if rng and 'rng' in state:
+        np.random.set_state(state['rng'])
+    return state
@@ -12,15 +12,33 @@ Copuled Surface-Ground water Lumped hydrological Model
 from __future__ import division
 # import required modules
 import numpy as np
-import xlrd, xlwt
+from ambhas.xls import open_input, col_array
+from ambhas.checkpoint import save_checkpoint, load_checkpoint
+from ambhas import enkf
+from ambhas.profiler import Profiler
+from ambhas.tdma import solve_tridiag, tridiag_dot
+from ambhas.ncout import NCOutput
 import os
 import gdal
 from gdalconst import *
 from scipy.interpolate import Rbf
+from scipy.linalg import expm
 from Scientific.IO import NetCDF as nc
 import datetime
+try:
+    import xlwt
+except ImportError:
+    # the xls output is not available
+    xlwt = None
 np.seterr(all='raise')
 
+# max. no. of rows of a sheet of the xls (BIFF8) files written by xlwt, 
+# 65535 time steps of the output with the header, i.e. about 179 years of 
+# daily time steps
+XLS_MAX_ROWS = 65536
+# format of the output given by the extension of the ofile_name
+OUTPUT_FORMATS = {'.xls':'xls', '.nc':'nc', '.csv':'csv', '.npz':'npz'}
+
 class CSGLM:
     """
     This is the main class of the CGLSM.
@@ -29,16 +47,66 @@ class CSGLM:
     and then write the output files
     
     """
+    soil_scheme = 'explicit'
+    depth_scale = None
+    output_format = None
+    output_backend = 'scipy'
+    spinup_days = None
+    spinup_start = 0
+    spinup_tol = 1e-3
+    spinup_gw_tol = 1e-3
+    spinup_max_cycles = 20
+    profile = False
+    profile_output = False
+    profiler = None
+    # methods of each phase timed by the profiler, the ones not defined by
+    # a class are skipped
+    profile_phases = {'forcing':['_get_forcing', '_forcing_terms'],
+                      'perturb':['_perturb_soil_par_ens'],
+                      'interception':['_interception_fun', '_interception_ens_fun'],
+                      'runoff':['_runoff_fun', '_runoff_ens_fun'],
+                      'soil':['_soil_fun', '_soil_ens_fun'],
+                      'shp':['_shp', '_shp_ens'],
+                      'stress':['_smi_fun', '_transpiration_fun'],
+                      'surface_storage':['_surface_storage_fun', 
+                                         '_surface_storage_ens_fun'],
+                      'gw':['_gw_fun', '_gw_ens_fun'],
+                      'enkf':['_enkf_par', '_enkf_ET', '_enkf_ens_space'],
+                      'output':['_write_output'],
+                      'checkpoint':['_checkpoint']}
     
-    
-    def __init__(self, input_file):
+    def __init__(self, input_file, **kwargs):
         """
         Input:
             input_file: the file which contains all the information
             including forcing and parameters.
+            soil_scheme: integration of the soil moisture over the time 
+            step, 'explicit' (default), 'implicit' or 'expm', see 
+            _soil_step. The implicit and expm schemes are stable for long 
+            time steps
+            spinup_days: if given, the model is spun up before the run by 
+            cycling the forcing of the spinup_days time steps starting at 
+            spinup_start (default 0), until the largest change of the soil 
+            moisture profile between the ends of two cycles is less than 
+            spinup_tol (default 1e-3 v/v) and the change of the gw level 
+            less than spinup_gw_tol (default 1e-3 m), or for at most 
+            spinup_max_cycles (default 20) cycles. The run then starts from
+            the spun-up state.
+            profile: if True, the wall time and no. of calls of the phases 
+            of the run (profile_phases) are accumulated in the profiler 
+            (ambhas.profiler), e.g. print(model.profiler.summary()) 
+            (default False)
+            output_format: format of the output file, 'xls', 'nc', 'csv' or
+            'npz', by default given by the extension of the ofile_name, 
+            and 'xls' for the other extensions. The xls files can not have 
+            more than 65535 time steps. See _write_output
+            output_backend: 'scipy' (default, netcdf3) or 'netcdf4', the
+            writing of the nc output, see ambhas.ncout
         """        
         
         self.input_file = input_file
+        self._read_options(**kwargs)
+        self._init_profiler(**kwargs)
         
         # read the input data
         self._read_input()
@@ -46,6 +114,8 @@ class CSGLM:
         ################ run the model ########################
         max_t = int(self.final_time/self.dt)
         self.max_t = max_t
+        self._check_output()
+        
         # initialize required variables
         # the length of state variables (i.e. soil moisture and gw level) is
         # one more than the timesteps
@@ -60,6 +130,11 @@ class CSGLM:
         self.sm = np.empty((self.no_layer,max_t+1))
         self.sm[:,0] = self.initial_sm.flatten()
         self.surface_storage = np.zeros(max_t+1)
+        self._forcing_terms()
+        
+        # spin up the initial state
+        if self.spinup_days is not None:
+            self.spinup()
         
         for t in range(max_t):
             self.t = t
@@ -67,24 +142,123 @@ class CSGLM:
             # get forcing data at current time step        
             self._get_forcing()
             
-            # call the interception module
-            self._interception_fun()
-            
-            # call the runoff module
-            self._runoff_fun()
-            
-            # call the soil module
-            self._soil_fun()
-            
-            # call the surface storage module
-            self._surface_storage_fun()
-            
-            # call the goundwater module
-            self._gw_fun()
+            # advance the model over the time step
+            self._forecast()
         
         # write the output
         self._write_output()
+    
+    def _forecast(self):
+        """
+        advance the model over the current time step
+        """
+        # call the interception module
+        self._interception_fun()
+        
+        # call the runoff module
+        self._runoff_fun()
+        
+        # call the soil module
+        self._soil_fun()
+        
+        # call the surface storage module
+        self._surface_storage_fun()
+        
+        # call the goundwater module
+        self._gw_fun()
+    
+    def spinup(self):
+        """
+        spin up the state by cycling the forcing of the window of 
+        spinup_days time steps starting at spinup_start, until the change 
+        of the soil moisture and gw level between the ends of two cycles is
+        less than spinup_tol and spinup_gw_tol
+        the run then starts from the spun-up state at the first time step
+        
+        Output:
+            converged: True if the tolerances were met
+        the no. of cycles and the change of the soil moisture and gw level
+        after each cycle are kept in spinup_cycles and spinup_change
+        """
+        start = self.spinup_start
+        end = start+self.spinup_days
+        if start < 0 or self.spinup_days < 1 or end > self.max_t:
+            raise ValueError('The spin-up window should be within the forcing')
+        
+        converged = False
+        self.spinup_change = []
+        self._copy_state(start, 0)
+        sm, gw_level = self._spinup_state(start)
+        for cycle in range(self.spinup_max_cycles):
+            for t in range(start, end):
+                self.t = t
+                self._get_forcing()
+                self._forecast()
+            sm_end, gw_end = self._spinup_state(end)
+            change = (float(np.abs(sm_end-sm).max()), 
+                      float(np.abs(gw_end-gw_level).max()))
+            self.spinup_change.append(change)
+            sm, gw_level = sm_end, gw_end
+            self._copy_state(start, end)
+            if np.isnan(change).any():
+                raise ValueError('The state became nan during the spin-up')
+            if change[0] < self.spinup_tol and change[1] < self.spinup_gw_tol:
+                converged = True
+                break
+        self.spinup_cycles = cycle+1
+        self._copy_state(0, start)
+        self.t = 0
+        
+        if converged:
+            output_message = 'Spin-up converged after %d cycles'%self.spinup_cycles
+            self._colored_output(output_message, 32)
+        else:
+            output_message = 'Spin-up did not converge after %d cycles, the change of sm is %g and of gw level is %g'%(
+                             self.spinup_cycles, change[0], change[1])
+            self._colored_output(output_message, 31)
+        return converged
+    
+    def _spinup_state(self, t):
+        """
+        soil moisture and gw level at the time step t, compared between the
+        cycles of the spin-up
+        """
+        return self.sm[:,t].copy(), self.gw_level[t]
+    
+    def _copy_state(self, t_to, t_from):
+        """
+        copy the state at the time step t_from to t_to
+        """
+        self.sm[:,t_to] = self.sm[:,t_from]
+        self.gw_level[t_to] = self.gw_level[t_from]
+        self.surface_storage[t_to] = self.surface_storage[t_from]
+    
+    def _read_options(self, **kwargs):
+        """
+        set the options of the model given as keyword arguments, the 
+        options not given keep their default value
+        """
+        self.soil_scheme = kwargs.get('soil_scheme', self.soil_scheme)
+        if self.soil_scheme not in ['explicit', 'implicit', 'expm']:
+            raise ValueError("The soil_scheme should be one of 'explicit', 'implicit' or 'expm'")
+        self.spinup_days = kwargs.get('spinup_days', self.spinup_days)
+        self.spinup_start = kwargs.get('spinup_start', self.spinup_start)
+        self.spinup_tol = kwargs.get('spinup_tol', self.spinup_tol)
+        self.spinup_gw_tol = kwargs.get('spinup_gw_tol', self.spinup_gw_tol)
+        self.spinup_max_cycles = kwargs.get('spinup_max_cycles', self.spinup_max_cycles)
+        self.output_format = kwargs.get('output_format', self.output_format)
+        self.output_backend = kwargs.get('output_backend', self.output_backend)
 
+    def _init_profiler(self, **kwargs):
+        """
+        time the phases of the run, if profile is given
+        """
+        self.profile = kwargs.get('profile', self.profile)
+        self.profile_output = kwargs.get('profile_output', self.profile_output)
+        if self.profile:
+            self.profiler = Profiler()
+            self.profiler.attach(self, self.profile_phases)
+    
     def _read_input(self):
         """
         This checks if all the required input sheets are present in the xls file,
@@ -142,6 +316,13 @@ class CSGLM:
         output_message = 'Input data reading completed sucessfully'
         self._colored_output(output_message, 32)
        
+    def _sheet(self, sheet_name):
+        """
+        get the sheet of the input file
+        the workbook is parsed only once, see ambhas.xls.open_input
+        """
+        return open_input(self.input_file).sheet_by_name(sheet_name)
+       
     def _check_sheets(self, check_sheets, check_file):
         """
         This functions check if all the sheets needed to model are present  
@@ -149,12 +330,12 @@ class CSGLM:
         
         """
         # open the xls file and get its sheets
-        foo = xlrd.open_workbook(check_file)
+        foo = open_input(check_file)
         check_sheet_names = foo.sheet_names()
         
-        for check_sheet_names in check_file:
-            if check_sheet_names not in check_file:
-                output_message = check_sheet_names + ' is missing'
+        for check_sheet in check_sheets:
+            if check_sheet not in check_sheet_names:
+                output_message = 'The sheet ' + check_sheet + ' is missing'
                 self._colored_output(output_message,31)
 
     def _read_ind(self):
@@ -163,12 +344,11 @@ class CSGLM:
         legend stores the information about the indices of other properties,
         which would be used by all other properties reading functions
         """
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('ind')
+        sheet = self._sheet('ind')
         # dont read the first line of the xls file
         ind = {}
-        for i in range(sheet.nrows-1):
-            ind[str(sheet.cell_value(i+1,0))] = int(sheet.cell_value(i+1,1))
+        for key, value in zip(sheet.col_values(0,1), sheet.col_values(1,1)):
+            ind[str(key)] = int(value)
                 
         self.ind = ind
 
@@ -176,8 +356,7 @@ class CSGLM:
         """
         Read the spatial info
         """
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('spatial_info')
+        sheet = self._sheet('spatial_info')
         # get the row number from the ind
         j = self.ind['spatial_info']
         no_layer = int(sheet.cell_value(j,1))
@@ -198,8 +377,7 @@ class CSGLM:
         """
         Read the temporal info
         """
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('temporal_info')
+        sheet = self._sheet('temporal_info')
         #get the row number from the ind
         j = self.ind['temporal_info']
         dt = sheet.cell_value(j,1)
@@ -212,8 +390,7 @@ class CSGLM:
         """
         read the root distribution factors
         """
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('root_info')
+        sheet = self._sheet('root_info')
         #get the row number from the ind
         j = self.ind['root_info']
         self.ndvi_max = sheet.cell_value(j,1)
@@ -228,13 +405,12 @@ class CSGLM:
         """
         read the units of the forcing data
         """
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('units')
+        sheet = self._sheet('units')
         #get the row number from the ind
         j = self.ind['units']
         forcing_units = {}
-        for i in range(sheet.ncols-1):
-            forcing_units[str(sheet.cell_value(0,i+1))] = str(sheet.cell_value(j,i+1))
+        for key, value in zip(sheet.row_values(0,1), sheet.row_values(j,1)):
+            forcing_units[str(key)] = str(value)
         self.forcing_units = forcing_units
     
     def _read_initial_condition(self):
@@ -244,8 +420,7 @@ class CSGLM:
         #get the row number from the ind
         j = self.ind['initial_condition']
         
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('initial_condition')
+        sheet = self._sheet('initial_condition')
         theta_0 = sheet.row_values(j,2)
         self.initial_gwl = sheet.cell_value(j,1)
         self.initial_sm = np.array(theta_0)
@@ -263,8 +438,7 @@ class CSGLM:
         #get the row number from the ind
         j = self.ind['soil_hyd_par']
         
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('soil_hyd_par')
+        sheet = self._sheet('soil_hyd_par')
         soil_par = {}
         soil_par['qr'] = sheet.cell_value(j,1)
         soil_par['f'] = sheet.cell_value(j,2)
@@ -306,8 +480,7 @@ class CSGLM:
         #get the row number from the ind
         j = self.ind['runoff_par']
         
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('runoff_par')
+        sheet = self._sheet('runoff_par')
         runoff_par = {}
         for i in range(sheet.ncols-1):
             runoff_par[str(sheet.cell_value(0,i+1))] = float(sheet.cell_value(j,i+1))
@@ -320,8 +493,7 @@ class CSGLM:
         #get the row number from the ind
         j = self.ind['surface_storage_par']
         
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('surface_storage_par')
+        sheet = self._sheet('surface_storage_par')
         surface_storage_par = {}
         surface_storage_par['a'] = float(sheet.cell_value(j,1))
         surface_storage_par['b'] = float(sheet.cell_value(j,2))
@@ -334,8 +506,7 @@ class CSGLM:
         #get the row number from the ind
         j = self.ind['gw_par']
         
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('gw_par')
+        sheet = self._sheet('gw_par')
         gw_par = {}
         for i in range(sheet.ncols-1):
             gw_par[str(sheet.cell_value(0,i+1))] = float(sheet.cell_value(j,i+1))
@@ -370,24 +541,14 @@ class CSGLM:
         """
         read the forcing data from xls file
         """
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('forcing')
+        sheet = self._sheet('forcing')
         
-        data_len = sheet.nrows-1
-        year = np.zeros(data_len)
-        doy = np.zeros(data_len)
-        rain = np.zeros(data_len)
-        pet = np.zeros(data_len)
-        ndvi = np.zeros(data_len)
-        pumping = np.zeros(data_len)
-    
-        for i in xrange(data_len):
-            year[i] = sheet.cell_value(i+1,0)
-            doy[i] = sheet.cell_value(i+1,1)
-            rain[i] = sheet.cell_value(i+1,2)
-            pet[i] = sheet.cell_value(i+1,3)
-            ndvi[i] = sheet.cell_value(i+1,4)
-            pumping[i] = sheet.cell_value(i+1,5)
+        year = col_array(sheet, 0)
+        doy = col_array(sheet, 1)
+        rain = col_array(sheet, 2)
+        pet = col_array(sheet, 3)
+        ndvi = col_array(sheet, 4)
+        pumping = col_array(sheet, 5)
         
         self.year = year
         self.doy = doy
@@ -441,8 +602,7 @@ class CSGLM:
         """
         read the forcing data from xls file
         """
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('output_par')
+        sheet = self._sheet('output_par')
         self.ofile_name = str(sheet.cell_value(0,1))
 
 
@@ -481,13 +641,51 @@ class CSGLM:
         """
         # the PET is multiplied by crop coefficient
         self.rain_cur = self.rain[self.t]
-        self.pet_cur = self.pet[self.t]*self.kc[self.t]
+        self.pet_cur = self.forcing_terms['pet'][self.t]
         self.lai_cur = self.lai[self.t]
         self.pumping_cur = self.pumping[self.t]
         
         self.cur_year = self.year[self.t]
         self.cur_doy = self.doy[self.t]
-
+    
+    def _forcing_terms(self):
+        """
+        compute the terms which depend only on the forcing for all the time
+        steps, so that the time loop only updates the state:
+            pet: pet multiplied by the crop coefficient
+            E_In, trans, evap, net_rain: evaporation from interception, 
+            transpiration, evaporation and net rainfall, see 
+            _interception_fun
+            root_density: root density of the layers (n_time, no_layer)
+        """
+        # interception and partition of the pet
+        pet = self.pet*self.kc
+        In = self.lai*0.2/1000.0
+        soil_cover = np.exp(-0.5*self.lai)
+        veg_cover = 1 - soil_cover
+        E_In = np.minimum(np.minimum(veg_cover*self.rain, veg_cover*pet), veg_cover*In)
+        T = np.minimum(veg_cover*pet - 0.2*E_In, 1.2*pet - E_In)
+        E = np.minimum(soil_cover*pet, 1.2*pet-T-E_In)
+        self.forcing_terms = {'pet':pet, 'E_In':E_In, 'trans':T, 'evap':E, 
+                              'net_rain':self.rain-E_In}
+        
+        # root density, from the depth of the top and bottom of the layers
+        # limited by the rooting depth
+        Lrd = self.Lrd
+        Rd = np.asarray(self.Rd, dtype=float)[:,np.newaxis]
+        bottom = np.cumsum(self.z)
+        top = np.append(0, bottom[:-1])
+        z2 = np.minimum(bottom, Rd)
+        z1 = np.minimum(top, z2)
+        # there are no roots (and no transpiration) on the days with Rd = 0
+        root_density = np.zeros(z2.shape)
+        roots = Rd[:,0] > 0
+        root_density[roots] = (np.exp(-z1[roots]/Lrd) - np.exp(-z2[roots]/Lrd)) \
+                              /(1 - np.exp(-Rd[roots]/Lrd))
+        self.forcing_terms['root_density'] = root_density
+        # the thickness of the last layer changes with the gw level, its 
+        # root density is computed during the run when the roots reach it
+        self.forcing_terms['root_last'] = Rd[:,0] > top[-1]
         
     def _interception_fun(self):
         """
@@ -503,19 +701,12 @@ class CSGLM:
             net_rain_cur:   Net rainfall (precipitation-interception loss) at 
             current time step
         """
-        In = self.lai[self.t]*0.2/1000.0
-        soil_cover = np.exp(-0.5*self.lai_cur)
-        veg_cover = 1 - soil_cover
-        
-        E_In = np.min([veg_cover*self.rain_cur, veg_cover*self.pet_cur, veg_cover*In])
-        T = np.min([veg_cover*self.pet_cur - 0.2*E_In, 1.2*self.pet_cur - E_In])
-        E = np.min([soil_cover*self.pet_cur, 1.2*self.pet_cur-T-E_In])
-        net_rain_cur = self.rain_cur - E_In
-        
-        self.E_In[self.t] = E_In
-        self.trans = T
-        self.evap = E
-        self.net_rain_cur = net_rain_cur
+        # these depend only on the forcing, see _forcing_terms
+        terms = self.forcing_terms
+        self.E_In[self.t] = terms['E_In'][self.t]
+        self.trans = terms['trans'][self.t]
+        self.evap = terms['evap'][self.t]
+        self.net_rain_cur = terms['net_rain'][self.t]
     
     def _runoff_fun(self):
         """
@@ -539,7 +730,8 @@ class CSGLM:
         # chen and dudhia
         Kdt_ref = 3.0
         Kref = 2e-6
-        theta_s = self.soil_par['f']*np.exp(-self.mid_z/self.soil_par['fl'])
+        fl_scale = self._depth_scale(self.soil_par['fl'], self.soil_par['zl'])[0]
+        theta_s = self.soil_par['f']*fl_scale
         Dx = theta_s - self.sm[:,self.t]
         Dx = Dx*self.mid_z
         Dx = Dx[:3].sum()
@@ -581,19 +773,13 @@ class CSGLM:
         # initialize soil moisture at next time step        
         theta_1_mat = np.zeros(self.no_layer)
                 
-        # estimate hydraulic properties
-        K = np.zeros((self.no_layer,1))
-        D = np.zeros((self.no_layer,1))
-        for i in range(self.no_layer):
-            if i<self.no_layer-1:
-                # using the maximum value of theta
-                #K[i], D[i] = self._shp(max(self.sm[i,self.t],self.sm[i+1, self.t]),i)
-                # using the arithmatic mean of theta
-                K[i], D[i] = self._shp(0.5*(self.sm[i, self.t]+self.sm[i+1, self.t]),i)
-            else:
-                K[i], D[i] = self._shp(self.sm[i,self.t],i)
-        K = K.flatten()*np.exp(-self.mid_z/self.soil_par['zl'])
-        D = D.flatten()*np.exp(-self.mid_z/self.soil_par['zl'])
+        # estimate hydraulic properties, using the arithmatic mean of theta
+        # of the layer and the one below it
+        fl_scale, zl_scale = self._depth_scale(self.soil_par['fl'], self.soil_par['zl'])
+        sm = self.sm[:,self.t]
+        K, D = self._shp(np.append(0.5*(sm[:-1]+sm[1:]), sm[-1]))
+        K = K*zl_scale
+        D = D*zl_scale
         
         # calculate stress in soil moisture and subsequently the actual 
         # evaporation and transpiration
@@ -602,64 +788,98 @@ class CSGLM:
         self._transpiration_fun()
         AT = self.AT 
                 
-        # set up the A and U matrix
-        A = np.zeros((self.no_layer, self.no_layer))
-        U = np.zeros((self.no_layer,1))
+        # set up the tridiagonal A and U, and advance the soil moisture
         z = self.z
-        for i in range(self.no_layer):
-            if i == 0:
-                A[0,0] = -D[1]/(0.5*z[1]*(z[1]+z[2]))
-                A[0,1] = D[1]/(0.5*z[1]*(z[1]+z[2]))
-                U[0] = (-AT[0] - K[0] + self.net_rain_cur - AE - self.runoff_cur \
-                + self.pumping_cur)/z[0]
-            elif i == self.no_layer-1:
-                A[i,i] = -D[i-1]/(0.5*z[i]*(z[i-1]+z[i]))
-                A[i,i-1] = D[i-1]/(0.5*z[i]*(z[i-1]+z[i])) 
-                U[i] = (-AT[i] + K[i-1] - K[i])/z[i]
-            else:
-                A[i,i-1] = D[i-1]/(0.5*z[i]*(z[i-1]+z[i]))
-                A[i,i+1] = D[i]/(0.5*z[i]*(z[i]+z[i+1]))
-                A[i,i] = -A[i,i-1] -A[i,i+1]
-                U[i] = (-AT[i] +K[i-1] - K[i])/z[i]
-                    
-            # convert from A,U to F,G
-            F = np.eye(self.no_layer) + A*self.dt
-            #    if (F>1.4).any() | (F<0.6).any():
-            #        F = expm(A*dt)
-            G = np.dot(F,U)*self.dt
-            
-            # calculate theta for next time step
-            theta_1 = np.dot(F, self.sm[:,self.t]) + G.flatten()
-            
-            # convert recharge from L/T to L
-            Re = K[-1]*self.dt
-            
-            # remove the water as hortonian runoff, 
-            # if the soil moisture exceeds saturation
-            if theta_1[0] >= self.soil_par['f']:
-                HR = (theta_1[0]-self.soil_par['f'])*z[0]
-                theta_1[0] = self.soil_par['f']
-            else:
-                HR = 0
-
-            #check for the range of the theta
-            theta_s = self.soil_par['f']*np.exp(-self.mid_z/self.soil_par['fl'])
-            wp = self.ET_par['trans_wp']*np.exp(-self.mid_z/self.soil_par['fl'])
-            for j in range(self.no_layer):
-                if theta_1[j]>theta_s[j]:
-                    theta_1[j] = theta_s[j]
-                if theta_1[j]<wp[j]:
-                    theta_1[j] = wp[j]
-            
-            # put the result of this pixel into matrix
-            self.sm[:,self.t+1] = theta_1.flatten()
-            self.G = G
-            self.F = F
-            self.theta_1 = theta_1
-            self.recharge[self.t] = Re
-            self.actual_evap[self.t] = AE*self.dt
-            self.actual_trans[self.t] = AT.sum()*self.dt
-            self.horton_runoff[self.t] = HR
+        a, b, c, U = self._soil_operator(K, D, AT, AE)
+        theta_1 = self._soil_step(self.sm[:,self.t], a, b, c, U)
+        
+        # convert recharge from L/T to L
+        Re = K[-1]*self.dt
+        
+        # remove the water as hortonian runoff, 
+        # if the soil moisture exceeds saturation
+        if theta_1[0] >= self.soil_par['f']:
+            HR = (theta_1[0]-self.soil_par['f'])*z[0]
+            theta_1[0] = self.soil_par['f']
+        else:
+            HR = 0
+        
+        #check for the range of the theta
+        theta_s = self.soil_par['f']*fl_scale
+        wp = self.ET_par['trans_wp']*fl_scale
+        theta_1 = np.maximum(np.minimum(theta_1, theta_s), wp)
+        
+        # put the result of this pixel into matrix
+        self.sm[:,self.t+1] = theta_1
+        self.theta_1 = theta_1
+        self.recharge[self.t] = Re
+        self.actual_evap[self.t] = AE*self.dt
+        self.actual_trans[self.t] = AT.sum()*self.dt
+        self.horton_runoff[self.t] = HR
+    
+    def _soil_operator(self, K, D, AT, AE):
+        """
+        the soil moisture equation d(theta)/dt = A*theta + U, with the
+        tridiagonal A given by its diagonals (a: sub, b: main, c: super, in
+        the convention of ambhas.tdma)
+        
+        Input:
+            K, D: hydraulic conductivity and diffusivity of the layers, 
+            (no_layer,) or (n_ens, no_layer) for the members together
+            AT: actual transpiration of the layers (L/T)
+            AE: actual evaporation (L/T), scalar or (n_ens,)
+        Output:
+            a, b, c: diagonals of A, of the shape of K
+            U: source term (1/T), of the shape of K
+        """
+        n = self.no_layer
+        z = np.asarray(self.z, dtype=float)
+        a = np.zeros(K.shape)
+        c = np.zeros(K.shape)
+        
+        # flux between the layers
+        a[...,1:] = D[...,:n-1]/(0.5*z[1:n]*(z[:n-1]+z[1:n]))
+        c[...,1:n-1] = D[...,1:n-1]/(0.5*z[1:n-1]*(z[1:n-1]+z[2:n]))
+        c[...,0] = D[...,1]/(0.5*z[1]*(z[1]+z[2]))
+        b = -a-c
+        b[...,0] = -c[...,0]
+        
+        # sources and sinks
+        U = np.empty(K.shape)
+        U[...,0] = (-AT[...,0] - K[...,0] + self.net_rain_cur - AE - self.runoff_cur \
+                    + self.pumping_cur)/z[0]
+        U[...,1:] = (-AT[...,1:] + K[...,:n-1] - K[...,1:])/z[1:n]
+        return a, b, c, U
+    
+    def _soil_step(self, theta, a, b, c, U):
+        """
+        advance the soil moisture over the time step dt, with the scheme 
+        given by soil_scheme:
+            'explicit': theta_1 = F*(theta+U*dt), F = I+A*dt
+            'implicit': (I-A*dt)*theta_1 = theta+U*dt, stable for any dt
+            'expm': exact solution for constant A and U over the time step,
+            using the matrix exponential of the augmented matrix [[A, U], 
+            [0, 0]], stable for any dt but O(n^3)
+        the members (leading axis) are advanced together
+        """
+        dt = self.dt
+        if self.soil_scheme == 'explicit':
+            Fa, Fb, Fc = a*dt, 1+b*dt, c*dt
+            return tridiag_dot(Fa, Fb, Fc, theta) + tridiag_dot(Fa, Fb, Fc, U)*dt
+        elif self.soil_scheme == 'implicit':
+            return solve_tridiag(-a*dt, 1-b*dt, -c*dt, theta+U*dt)
+        elif np.ndim(theta) > 1:
+            return np.array([self._soil_step(theta[i], a[i], b[i], c[i], U[i])
+                             for i in range(len(theta))])
+        else:
+            n = self.no_layer
+            M = np.zeros((n+1, n+1))
+            M[np.arange(n), np.arange(n)] = b
+            M[np.arange(1,n), np.arange(n-1)] = a[1:]
+            M[np.arange(n-1), np.arange(1,n)] = c[:-1]
+            M[:n,n] = U
+            E = expm(M*dt)
+            return np.dot(E[:n,:n], theta) + E[:n,n]
             
     def _smi_fun(self):
         """
@@ -699,51 +919,60 @@ class CSGLM:
         """
         this function computes the actual transpiration for all the soil layers
         """
-        # root distribution
-        Lrd = self.Lrd
-        Rd = self.Rd[self.t]
-        r_density = np.empty(self.no_layer)
-        for i in range(self.no_layer):
-            if i==0:
-                z1 = 0
-            else:
-                z1 = np.sum(self.z[:i])
-            z2 = np.sum(self.z[:i+1])
-            if z2>Rd:
-                z2 = Rd
-            if z1>z2:
-                z1 = z2
-            
-            r_density[i] = np.exp(-z1/Lrd) - np.exp(-z2/Lrd)
-        r_density = r_density/( 1 - np.exp(-Rd/Lrd) )
+        # root distribution, see _forcing_terms
+        r_density = self.forcing_terms['root_density'][self.t]
+        if self.forcing_terms['root_last'][self.t]:
+            # the roots reach the last layer, whose thickness is the current
+            Lrd = self.Lrd
+            Rd = self.Rd[self.t]
+            z1 = np.sum(self.z[:-1])
+            z2 = min(np.sum(self.z), Rd)
+            z1 = min(z1, z2)
+            r_density = r_density.copy()
+            r_density[-1] = (np.exp(-z1/Lrd) - np.exp(-z2/Lrd))/(1 - np.exp(-Rd/Lrd))
         
         self.r_density = r_density
         self.AT = self.RZSMI*r_density*self.trans
     
 
-    def _shp(self, theta,i):
+    def _shp(self, theta):
         """
-        soil hydraulic properties module
-        i is the layer
-        """
-        
-        qr = self.soil_par['qr']*np.exp(-self.mid_z[i]/self.soil_par['fl'])
-        f = self.soil_par['f']*np.exp(-self.mid_z[i]/self.soil_par['fl'])
-        a = self.soil_par['a']
-        n = self.soil_par['n']
-        Ks = self.soil_par['Ks']
-        l = self.soil_par['l']
+        soil hydraulic properties module, for all the layers
         
+        Input:
+            theta: soil moisture of the layers
+        Output:
+            K, D: hydraulic conductivity and diffusivity of the layers
+        """
+        fl_scale = self._depth_scale(self.soil_par['fl'], self.soil_par['zl'])[0]
+        par = self.soil_par
+        return self._shp_vg(theta, par['qr']*fl_scale, par['f']*fl_scale, 
+                            par['a'], par['n'], par['Ks'], par['l'])
+    
+    @staticmethod
+    def _shp_vg(theta, qr, f, a, n, Ks, l):
+        """
+        van Genuchten hydraulic conductivity and diffusivity, the inputs
+        are broadcast together, e.g. (no_layer,) or (n_ens, no_layer)
+        the effective saturation is kept between 0.01 and 0.99
+        """
         m = 1-1/n
-        Se = (theta-qr)/(f - qr)
-        if Se>=0.99:
-            Se = 0.99
-        elif Se<=0.01:
-            Se = 0.01
+        Se = np.clip((theta-qr)/(f - qr), 0.01, 0.99)
         K = Ks*Se**l*(1-(1-Se**(1/m))**m)**2
         D = K/(a*(f-qr)*m*n*(Se**(1/m+1))*(Se**(-1/m)-1)**m)
         return K, D
     
+    def _depth_scale(self, fl, zl):
+        """
+        scaling of the soil hydraulic parameters with the depth of the 
+        layers, exp(-mid_z/fl) and exp(-mid_z/zl), computed once per 
+        parameter set
+        """
+        if self.depth_scale is None or self.depth_scale[0] != (fl, zl):
+            self.depth_scale = ((fl, zl), np.exp(-self.mid_z/fl), 
+                                np.exp(-self.mid_z/zl))
+        return self.depth_scale[1:]
+    
     def _surface_storage_fun(self):
         """
         this module stores the surface water
@@ -785,62 +1014,114 @@ class CSGLM:
                                    
         
         
-    def _write_output(self):
+    def _check_output(self):
         """
-        This will write the data in the xls format
-        
+        set the format of the output, and check that the output of the run
+        can be written in it, before the model is run
+        """
+        if self.output_format is None:
+            ext = os.path.splitext(self.ofile_name)[1].lower()
+            self.output_format = OUTPUT_FORMATS.get(ext, 'xls')
+        if self.output_format not in ['xls', 'nc', 'csv', 'npz']:
+            raise ValueError("The output_format should be one of 'xls', 'nc', 'csv' or 'npz'")
+        if self.output_format == 'xls':
+            if xlwt is None:
+                raise ValueError("The output_format 'xls' needs the xlwt package")
+            if self.max_t+1 > XLS_MAX_ROWS:
+                raise ValueError("The xls output can not have more than %i time steps, use the output_format 'nc', 'csv' or 'npz'"%(XLS_MAX_ROWS-1))
+    
+    def _output_columns(self):
         """
-        # open the xls workbook
-        wbk = xlwt.Workbook()
-        sheet = wbk.add_sheet('variables')
-        # write the header
-        sheet.write(0,0,'year')
-        sheet.write(0,1,'doy')
-        sheet.write(0,2,'gw level')
+        the output as columns, for the variables and flux tables
+        
+        Output:
+            variables, flux: lists of (name, label, units, values) of the 
+            columns, the values of the max_t time steps
+        """
+        n = self.max_t
+        aet = self.actual_evap+self.actual_trans+self.E_In
+        time = [('year', 'year', None, self.year[:n]),
+                ('doy', 'doy', None, self.doy[:n])]
+        variables = time + [('gw_level', 'gw level', 'm', self.gw_level[:n])]
         for i in range(self.no_layer):
-            sheet.write(0,3+i,'SM - %i'%(i+1))
-        # write the data    
-        for i in range(self.max_t):
-            sheet.write(i+1,0,self.year[i])
-            sheet.write(i+1,1,self.doy[i])
-            sheet.write(i+1,2,self.gw_level[i])
-            for j in range(self.no_layer):
-                sheet.write(i+1,3+j,self.sm[j,i])
-        
-        sheet = wbk.add_sheet('flux')
-        # write the header
-        sheet.write(0,0,'year')
-        sheet.write(0,1,'doy')
-        sheet.write(0,2,'rain')
-        sheet.write(0,3,'PET')
-        sheet.write(0,4,'lai')
-        sheet.write(0,5,'pumping')
-        sheet.write(0,6,'actual evap')
-        sheet.write(0,7,'actual trans')
-        sheet.write(0,8,'E_In')
-        sheet.write(0,9,'AET')
-        sheet.write(0,10,'recharge')
-        sheet.write(0,11,'runoff')
-        
-        # write the data    
-        for i in range(self.max_t):
-            sheet.write(i+1,0,self.year[i])
-            sheet.write(i+1,1,self.doy[i])
-            sheet.write(i+1,2,self.rain[i])
-            sheet.write(i+1,3,self.pet[i])
-            sheet.write(i+1,4,self.lai[i])
-            sheet.write(i+1,5,self.pumping[i])
-            sheet.write(i+1,6,self.actual_evap[i])
-            sheet.write(i+1,7,self.actual_trans[i])
-            sheet.write(i+1,8,self.E_In[i])
-            sheet.write(i+1,9,self.actual_evap[i]+self.actual_trans[i]+self.E_In[i])
-            sheet.write(i+1,10,self.recharge[i])
-            sheet.write(i+1,11,self.runoff[i])
-            
-        wbk.save(self.ofile_name)
+            variables.append(('sm_%i'%(i+1), 'SM - %i'%(i+1), 'v/v', self.sm[i,:n]))
+        
+        flux = time + [('rain', 'rain', 'm', self.rain[:n]),
+                       ('pet', 'PET', 'm', self.pet[:n]),
+                       ('lai', 'lai', '-', self.lai[:n]),
+                       ('pumping', 'pumping', 'm', self.pumping[:n]),
+                       ('actual_evap', 'actual evap', 'm', self.actual_evap),
+                       ('actual_trans', 'actual trans', 'm', self.actual_trans),
+                       ('E_In', 'E_In', 'm', self.E_In),
+                       ('aet', 'AET', 'm', aet),
+                       ('recharge', 'recharge', 'm', self.recharge),
+                       ('runoff', 'runoff', 'm', self.runoff)]
+        return variables, flux
+        
+    def _write_output(self):
+        """
+        This will write the data in the output_format, each column at once
+        except for the xls
+            'xls': the sheets variables and flux
+            'csv': one table of the variables and flux, with a header line
+            'npz': one array for each column
+            'nc': one variable for each column, and the soil moisture as
+            sm (depth, time)
+        """
+        variables, flux = self._output_columns()
+        if self.output_format == 'xls':
+            wbk = xlwt.Workbook()
+            self._write_xls_sheet(wbk, 'variables', variables)
+            self._write_xls_sheet(wbk, 'flux', flux)
+            wbk.save(self.ofile_name)
+        elif self.output_format == 'csv':
+            columns = variables + flux[2:]
+            np.savetxt(self.ofile_name, np.column_stack([c[3] for c in columns]),
+                       fmt='%.10g', delimiter=',', comments='',
+                       header=','.join([c[1] for c in columns]))
+        elif self.output_format == 'npz':
+            columns = variables + flux[2:]
+            np.savez(self.ofile_name, **dict((c[0], c[3]) for c in columns))
+        else:
+            self._write_nc(variables + flux[2:])
         
         output_message = 'Output data writting completed sucessfully'
         self._colored_output(output_message, 32)
+    
+    def _write_xls_sheet(self, wbk, sheet_name, columns):
+        """
+        write the columns in a new sheet of the xls workbook, one cell at a
+        time as xlwt has no bulk writing
+        """
+        sheet = wbk.add_sheet(sheet_name)
+        for j, (name, label, units, values) in enumerate(columns):
+            sheet.write(0, j, label)
+            for i, value in enumerate(values.tolist()):
+                sheet.write(i+1, j, value)
+    
+    def _write_nc(self, columns):
+        """
+        write the columns in the netcdf file, the soil moisture of the 
+        layers as one variable
+        """
+        out = NCOutput(self.ofile_name, backend=self.output_backend)
+        out.setncattr('title', 'output of the model ambhas.csglm')
+        now = datetime.datetime.now()
+        out.setncattr('description', 'The model was run at %s'%(now.ctime()))
+        out.createDimension('depth', self.no_layer)
+        out.createDimension('time', self.max_t)
+        # mid depth of the layers, the thickness of the last layer changes
+        # with the gw level, and its initial one is used
+        depth = out.createVariable('depth', ('depth',), units='m')
+        depth[:] = self.mid_z
+        for name, label, units, values in columns:
+            if name.startswith('sm_'):
+                continue
+            var = out.createVariable(name, ('time',), units=units)
+            var[:] = values
+        sm = out.createVariable('sm', ('depth','time'), units='v/v')
+        sm[:] = self.sm[:,:self.max_t]
+        out.close()
         
 
 class CSGLM_ENKF(CSGLM):
@@ -853,15 +1134,71 @@ class CSGLM_ENKF(CSGLM):
     and then write the output files
     
     """
+    # the gw level and surface storage are saved only at the current time 
+    # step (gw_level_cur, surface_storage_cur), not their full series
+    checkpoint_vars = ['t', 'sm_ens', 'gw_level_cur', 'surface_storage_cur', 
+                       'z_ens', 'soil_par_ens', 'soil_pert', 'ET_par']
+    par_keys = ['qr', 'f', 'a', 'n', 'Ks', 'l']
+    analysis = 'full'
+    inflation = 1.0
+    aet_std = 5e-4
+    n_ens = 10
     
-    def __init__(self,input_file):
+    def __init__(self, input_file, **kwargs):
         """
         Input:
             input_file: the file which contains all the information
             including forcing and parameters.
+            checkpoint_file: name of the checkpoint file (.npz), where the 
+            state of the model (soil moisture, gw level and surface storage
+            ensembles, soil hydraulic parameters ensemble, time step and 
+            the state of the random number generator) is saved every 
+            checkpoint_every time steps, and at the end of the run
+            checkpoint_every: no. of time steps between the checkpoints, if
+            0 (default) the checkpoint is saved only at the end of the run
+            restart_file: checkpoint file from which the run is resumed, 
+            the output is appended to the existing output file
+            initial_state: checkpoint file whose state is used as the 
+            initial condition of a new run from the first time step
+            n_ens: no. of ensemble members (default 10), the members are 
+            advanced together as (n_ens, ...) arrays
+            analysis: the analysis step of the filter, 'full' (default) 
+            with the covariance of the full state, separately for the 
+            surface soil moisture and the AET, or 'etkf' or 'enkf' computed
+            in the ensemble space for both the observations together (see 
+            ambhas.enkf)
+            inflation: multiplicative inflation of the forecast covariance,
+            used by the analysis 'etkf' and 'enkf' (default 1.0)
+            aet_std: error (standard deviation) of the measured AET (m), 
+            used by the analysis 'etkf' and 'enkf' (default 5e-4)
+            spinup_days, spinup_start, spinup_tol, spinup_gw_tol, 
+            spinup_max_cycles: spin-up of all the members together without 
+            the perturbation and analysis, see CSGLM. The tolerances apply 
+            to the largest change among the members. There is no spin-up 
+            when the run is restarted
+            profile: profiling of the run, see CSGLM
+            profile_output: if True, the profile is also written as the
+            attributes of the output file (default False)
+            run: if True (default), the model is run over all the time steps
         """      
         self.input_file = input_file
-        self.n_ens = 10
+        self.n_ens = int(kwargs.get('n_ens', self.n_ens))
+        if self.n_ens < 2:
+            raise ValueError('The n_ens should be at least 2')
+        self.analysis = kwargs.get('analysis', self.analysis)
+        self.inflation = kwargs.get('inflation', self.inflation)
+        self.aet_std = kwargs.get('aet_std', self.aet_std)
+        if self.analysis not in ['full', 'etkf', 'enkf']:
+            raise ValueError("The analysis should be one of 'full', 'etkf' or 'enkf'")
+        self.checkpoint_file = kwargs.get('checkpoint_file', None)
+        self.checkpoint_every = kwargs.get('checkpoint_every', 0)
+        self.restart_file = kwargs.get('restart_file', None)
+        self.initial_state = kwargs.get('initial_state', None)
+        if self.restart_file is not None and self.initial_state is not None:
+            raise ValueError('Only one of the restart_file and initial_state should be given')
+        self._read_options(**kwargs)
+        self._init_profiler(**kwargs)
+        
         # read the input data
         self._read_input()
         
@@ -869,9 +1206,14 @@ class CSGLM_ENKF(CSGLM):
         self.initialize()
         
         ################ run the model ########################
-        for t in range(self.max_t):
-            self.t = t
-              
+        if kwargs.get('run', True):
+            self.run()
+    
+    def run(self):
+        """
+        run the model over all the remaining time steps
+        """
+        while self.t < self.max_t:
             # get forcing data at current time step        
             self._get_forcing()
             
@@ -879,34 +1221,127 @@ class CSGLM_ENKF(CSGLM):
             self._perturb_soil_par_ens()
                         
             # call the unsat module with ensemble
-            for ens in range(self.n_ens):
-                self.ens = ens
-                
-                # call the interception module
-                self._interception_ens_fun()
-                
-                # call the runoff module
-                self._runoff_ens_fun()
-                
-                # call the soil module
-                self._soil_ens_fun()
-                
-                # call the surface storage module
-                self._surface_storage_ens_fun()
-                
-                # call the goundwater module
-                self._gw_ens_fun()
-        
+            self._forecast()
                 
             # ensemble kalmfan filter
-            self._enkf_par()
-
-            self._enkf_ET()
+            if self.analysis == 'full':
+                self._enkf_par()
+                self._enkf_ET()
+            else:
+                self._enkf_ens_space()
             
             self._write_output()                
-                
-                
+            
+            self.t += 1
+            self._checkpoint()
+        
+        self._write_profile()
         self.nc_file.close() # close the output file
+    
+    def _forecast(self):
+        """
+        advance all the members together over the current time step, the 
+        state and parameters of the members are (n_ens, ...) arrays
+        """
+        # call the interception module
+        self._interception_ens_fun()
+        
+        # call the runoff module
+        self._runoff_ens_fun()
+        
+        # call the soil module
+        self._soil_ens_fun()
+        
+        # call the surface storage module
+        self._surface_storage_ens_fun()
+        
+        # call the goundwater module
+        self._gw_ens_fun()
+    
+    def spinup(self):
+        """
+        spin up the state of the members, with their current soil 
+        hydraulic parameters, see CSGLM.spinup
+        """
+        par = self.soil_par_ens
+        self._set_soil_par_ens(par['qr'], par['f'], par['a'], par['n'], 
+                               par['Ks'], par['l'])
+        return CSGLM.spinup(self)
+    
+    def _spinup_state(self, t):
+        """
+        soil moisture and gw level of the members at the time step t, the 
+        soil moisture of the members is not stored for each time step, so 
+        it is the current one
+        """
+        return self.sm_ens.copy(), self.gw_level_ens[:,t].copy()
+    
+    def _copy_state(self, t_to, t_from):
+        """
+        copy the state of the members at the time step t_from to t_to
+        """
+        self.gw_level_ens[:,t_to] = self.gw_level_ens[:,t_from]
+        self.surface_storage_ens[:,t_to] = self.surface_storage_ens[:,t_from]
+    
+    def _write_profile(self):
+        """
+        write the profile as the attributes of the output file
+        """
+        if self.profiler is None or not self.profile_output:
+            return
+        for name, value in self.profiler.attributes().items():
+            setattr(self.nc_file, name, value)
+    
+    def save_checkpoint(self, fname=None):
+        """
+        save the state of the model, given by the attributes listed in 
+        checkpoint_vars, and of the random number generator
+        the output file is synchronized first
+        
+        Input:
+            fname: name of the checkpoint file, by default checkpoint_file
+        """
+        if fname is None:
+            fname = self.checkpoint_file
+        if fname is None:
+            raise ValueError('The name of the checkpoint file is not given')
+        self.nc_file.sync()
+        self.gw_level_cur = self.gw_level_ens[:,self.t]
+        self.surface_storage_cur = self.surface_storage_ens[:,self.t]
+        save_checkpoint(fname, self, self.checkpoint_vars)
+    
+    def _checkpoint(self):
+        """
+        save the checkpoint when it is due
+        """
+        if self.checkpoint_file is None:
+            return
+        if self.t == self.max_t or (self.checkpoint_every > 0 and 
+                                    self.t%self.checkpoint_every == 0):
+            self.save_checkpoint()
+    
+    def _load_state(self):
+        """
+        set the state from the restart_file, or from the initial_state 
+        in which case the time step is not changed
+        """
+        if self.restart_file is not None:
+            fname = self.restart_file
+            names = self.checkpoint_vars
+        elif self.initial_state is not None:
+            fname = self.initial_state
+            names = [name for name in self.checkpoint_vars if name != 't']
+        else:
+            return
+        shape = np.shape(self.sm_ens), (self.n_ens,)
+        load_checkpoint(fname, self, names)
+        if shape != (np.shape(self.sm_ens), np.shape(self.gw_level_cur)):
+            raise ValueError('The state in %s does not match the model'%fname)
+        self.t = int(self.t)
+        if self.t > self.max_t:
+            raise ValueError('The time step of %s is after the end of the run'%fname)
+        self.gw_level_ens[:,self.t] = self.gw_level_cur
+        self.surface_storage_ens[:,self.t] = self.surface_storage_cur
 
 
     def initialize(self):
@@ -917,6 +1352,7 @@ class CSGLM_ENKF(CSGLM):
         """
         max_t = int(self.final_time/self.dt)
         self.max_t = max_t                       
+        self.t = 0
         
         #initialize variables
         self.surface_storage_ens = np.zeros((self.n_ens, self.max_t+1))   
@@ -924,7 +1360,36 @@ class CSGLM_ENKF(CSGLM):
         
         self.gw_level_ens[:,0] = self.initial_gwl
         self.sm_ens = self.initial_sm + 0.02*np.random.normal(size=(self.n_ens,self.no_layer))
+        self._forcing_terms()
         
+        # generate soil hydraulic parameters
+        self._generate_soil_par_ens()
+        
+        # the state of the restarted run
+        self._load_state()
+        
+        if self.restart_file is None:
+            if self.spinup_days is not None:
+                self.spinup()
+            self._init_output()
+        else:
+            self._append_output()
+    
+    def _append_output(self):
+        """
+        open the output file of the interrupted run, to which the output of 
+        the resumed run is appended
+        """
+        file = nc.NetCDFFile(self.ofile_name, 'a')
+        for name in ['year', 'doy', 'sm', 'aet', 'recharge', 'gw_level_ens', 
+                     'qr', 'f', 'a', 'n', 'Ks', 'l']:
+            setattr(self, 'nc_'+name, file.variables[name])
+        self.nc_file = file
+    
+    def _init_output(self):
+        """
+        open the netcdf file for writting
+        """
         # open file for writing
         file = nc.NetCDFFile(self.ofile_name, 'w')
         setattr(file, 'title', 'output of the model ambhas.csglm_enkf')
@@ -981,10 +1446,6 @@ class CSGLM_ENKF(CSGLM):
         
         self.nc_file = file
         
-        # generate soil hydraulic parameters
-        self._generate_soil_par_ens()
-        
-        
 
     def _generate_soil_par_ens(self):
         """
@@ -1104,8 +1565,7 @@ class CSGLM_ENKF(CSGLM):
         #get the row number from the ind
         j = self.ind['initial_condition']
         
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('initial_condition')
+        sheet = self._sheet('initial_condition')
         theta_0 = sheet.row_values(j,2)
         self.initial_gwl = sheet.cell_value(j,1)
         self.initial_sm = np.array(theta_0)
@@ -1119,8 +1579,7 @@ class CSGLM_ENKF(CSGLM):
         #get the row number from the ind
         j = self.ind['soil_hyd_par']
         
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('soil_hyd_par')
+        sheet = self._sheet('soil_hyd_par')
         shp_ens = {}
         shp_ens['qr'] = sheet.cell_value(j,1)
         shp_ens['f'] = sheet.cell_value(j,2)
@@ -1181,7 +1640,14 @@ class CSGLM_ENKF(CSGLM):
         n[n<self.n_min]                 = self.n_min
         Ks[Ks<self.Ks_min]              = self.Ks_min
         l[l<self.l_min]                 = self.l_min        
-
+        
+        self._set_soil_par_ens(qr, f, a, n, Ks, l)
+    
+    def _set_soil_par_ens(self, qr, f, a, n, Ks, l):
+        """
+        set the soil hydraulic parameters ensemble, and the soil moisture 
+        limiting the evaporation and transpiration of the members
+        """
         soil_par_ens = {}
         soil_par_ens['qr'] = qr
         soil_par_ens['f'] = f
@@ -1221,16 +1687,16 @@ class CSGLM_ENKF(CSGLM):
         #F = 1 - (1- self.sm[:,self.t].mean()/Cm)**B 
         #self.runoff_cur = self.net_rain_cur*F
         #self.runoff[self.t] = self.runoff_cur
-        ens = self.ens
-        # chen and dudhia
+        # chen and dudhia, for all the members
         Kdt_ref = 3.0
         Kref = 2e-6
-        theta_s = self.soil_par_ens['f'][ens]*np.exp(-self.mid_z/self.shp_ens['fl'])
+        fl_scale = self._depth_scale(self.shp_ens['fl'], self.shp_ens['zl'])[0]
+        theta_s = self.soil_par_ens['f'][:,np.newaxis]*fl_scale
         
-        Dx = theta_s - self.sm_ens[ens]
+        Dx = theta_s - self.sm_ens
         Dx = Dx*self.mid_z
-        Dx = Dx[:3].sum()
-        Kdt = Kdt_ref*self.soil_par_ens['Ks'][ens]/Kref
+        Dx = Dx[:,:3].sum(axis=1)
+        Kdt = Kdt_ref*self.soil_par_ens['Ks']/Kref
         
         Pn = self.net_rain_cur
         Imax = Pn*(Dx*(1-np.exp(-Kdt)))/(Pn+Dx*(1-np.exp(-Kdt)))
@@ -1252,38 +1718,21 @@ class CSGLM_ENKF(CSGLM):
             net_rain_cur:   Net rainfall (precipitation-interception loss) at 
             current time step
         """
-        In = self.lai[self.t]*0.2/1000.0
-        soil_cover = np.exp(-0.5*self.lai_cur)
-        veg_cover = 1 - soil_cover
-        
-        E_In = np.min([veg_cover*self.rain_cur, veg_cover*self.pet_cur, veg_cover*In])
-        T = np.min([veg_cover*self.pet_cur - 0.2*E_In, 1.2*self.pet_cur - E_In])
-        E = np.min([soil_cover*self.pet_cur, 1.2*self.pet_cur-T-E_In])
-        net_rain_cur = self.rain_cur - E_In
-        
-        
-        self.E_In = E_In
-        self.trans = T
-        self.evap = E
-        self.net_rain_cur = net_rain_cur
+        # these depend only on the forcing, see _forcing_terms
+        terms = self.forcing_terms
+        self.E_In = terms['E_In'][self.t]
+        self.trans = terms['trans'][self.t]
+        self.evap = terms['evap'][self.t]
+        self.net_rain_cur = terms['net_rain'][self.t]
 
     def _soil_ens_fun(self):
         """
-        Input:
-            soil_par     : soil hydraulic parameters
-            z            : thicknes of layers
-            R            : runoff
-            no_layer     : no. of layers
-            theta_0      : initial soil moisture
-            root_frac    : root fraction in each layer
-            T            : transpiration
-            Pn           : net precipitation (precipitation - interception)
-            E            : soil evaporation
-            Pu           : pumping
-            dt           : time step
+        advance the soil moisture of all the members, see CSGLM._soil_fun
+        
         Output:
-            theta_1: soil moisture for next time step
-            Re: recharge (L)
+            sm_ens: soil moisture of the members for next time step
+            recharge, actual_evap, actual_trans, horton_runoff: of the 
+            members (L)
         """
         # convert the fluxes from L to L/T
         self.runoff_cur /= self.dt
@@ -1292,26 +1741,13 @@ class CSGLM_ENKF(CSGLM):
         self.net_rain_cur /= self.dt
         self.pumping_cur /= self.dt
         
-        # initialize soil moisture at next time step        
-        theta_1_mat = np.zeros(self.no_layer)
-
-        # get the information about current ensemble
-        ens = self.ens
-        sm = self.sm_ens[ens]
-        
-        # estimate hydraulic properties
-        K = np.zeros((self.no_layer,1))
-        D = np.zeros((self.no_layer,1))
-        for i in range(self.no_layer):
-            if i<self.no_layer-1:
-                # using the maximum value of theta
-                #K[i], D[i] = self._shp(max(self.sm[i,self.t],self.sm[i+1, self.t]),i)
-                # using the arithmatic mean of theta
-                K[i], D[i] = self._shp(0.5*(sm[i]+sm[i+1]),i)
-            else:
-                K[i], D[i] = self._shp(sm[i],i)
-        K = K.flatten()*np.exp(-self.mid_z/self.shp_ens['zl'])
-        D = D.flatten()*np.exp(-self.mid_z/self.shp_ens['zl'])
+        # estimate hydraulic properties, using the arithmatic mean of theta
+        # of the layer and the one below it
+        fl_scale, zl_scale = self._depth_scale(self.shp_ens['fl'], self.shp_ens['zl'])
+        sm = self.sm_ens
+        K, D = self._shp_ens(np.column_stack([0.5*(sm[:,:-1]+sm[:,1:]), sm[:,-1]]))
+        K = K*zl_scale
+        D = D*zl_scale
         
         # calculate stress in soil moisture and subsequently the actual 
         # evaporation and transpiration
@@ -1319,98 +1755,48 @@ class CSGLM_ENKF(CSGLM):
         AE = self.evap*self.SSMI
         self._transpiration_fun()
         AT = self.AT 
-                
-        # set up the A and U matrix
-        A = np.zeros((self.no_layer, self.no_layer))
-        U = np.zeros((self.no_layer,1))
+        
+        # set up the tridiagonal A and U, and advance the soil moisture
         z = self.z
-        for i in range(self.no_layer):
-            if i == 0:
-                A[0,0] = -D[1]/(0.5*z[1]*(z[1]+z[2]))
-                A[0,1] = D[1]/(0.5*z[1]*(z[1]+z[2]))
-                U[0] = (-AT[0] - K[0] + self.net_rain_cur - AE - self.runoff_cur \
-                + self.pumping_cur)/z[0]
-            elif i == self.no_layer-1:
-                A[i,i] = -D[i-1]/(0.5*z[i]*(z[i-1]+z[i]))
-                A[i,i-1] = D[i-1]/(0.5*z[i]*(z[i-1]+z[i])) 
-                U[i] = (-AT[i] + K[i-1] - K[i])/z[i]
-            else:
-                A[i,i-1] = D[i-1]/(0.5*z[i]*(z[i-1]+z[i]))
-                A[i,i+1] = D[i]/(0.5*z[i]*(z[i]+z[i+1]))
-                A[i,i] = -A[i,i-1] -A[i,i+1]
-                U[i] = (-AT[i] +K[i-1] - K[i])/z[i]
-                    
-            # convert from A,U to F,G
-            F = np.eye(self.no_layer) + A*self.dt
-            #    if (F>1.4).any() | (F<0.6).any():
-            #        F = expm(A*dt)
-            G = np.dot(F,U)*self.dt
-            
-            # calculate theta for next time step
-            theta_1 = np.dot(F, sm) + G.flatten()
-            
-            # convert recharge from L/T to L
-            Re = K[-1]*self.dt
-            
-            # remove the water as hortonian runoff, 
-            # if the soil moisture exceeds saturation
-            if theta_1[0] >= self.soil_par_ens['f'][ens]:
-                HR = (theta_1[0]-self.soil_par_ens['f'][ens])*z[0]
-                theta_1[0] = self.soil_par_ens['f'][ens]
-            else:
-                HR = 0
-
-            #check for the range of the theta
-            theta_s = self.soil_par_ens['f'][ens]*np.exp(-self.mid_z/self.shp_ens['fl'])
-            wp = self.ET_par['trans_wp'][ens]*np.exp(-self.mid_z/self.shp_ens['fl'])
-            for j in range(self.no_layer):
-                if theta_1[j]>theta_s[j]:
-                    theta_1[j] = theta_s[j]
-                if theta_1[j]<wp[j]:
-                    theta_1[j] = wp[j]
-            
-            # put the result of this pixel into matrix
-            self.sm_ens[ens] = theta_1.flatten()
-            self.G = G
-            self.F = F
-            self.theta_1 = theta_1
-            self.recharge = Re
-            self.actual_evap = AE*self.dt
-            self.actual_trans = AT.sum()*self.dt
-            self.horton_runoff = HR
+        a, b, c, U = self._soil_operator(K, D, AT, AE)
+        theta_1 = self._soil_step(sm, a, b, c, U)
+        
+        # convert recharge from L/T to L
+        Re = K[:,-1]*self.dt
+        
+        # remove the water as hortonian runoff, 
+        # if the soil moisture exceeds saturation
+        f = self.soil_par_ens['f']
+        HR = np.where(theta_1[:,0] >= f, (theta_1[:,0]-f)*z[0], 0.0)
+        theta_1[:,0] = np.minimum(theta_1[:,0], f)
+        
+        #check for the range of the theta
+        theta_s = f[:,np.newaxis]*fl_scale
+        wp = self.ET_par['trans_wp'][:,np.newaxis]*fl_scale
+        theta_1 = np.maximum(np.minimum(theta_1, theta_s), wp)
+        
+        self.sm_ens = theta_1
+        self.recharge = Re
+        self.actual_evap = AE*self.dt
+        self.actual_trans = AT.sum(axis=1)*self.dt
+        self.horton_runoff = HR
 
     def _smi_fun(self):
         """
         this module computes the surface soil moisture stress index, and root zone soil moisture 
         stress index
         """
-        ens = self.ens
-        sm = self.sm_ens[ens]
-        # calculate surface soil moisture index
-        SSMI = (sm[0] - self.soil_par_ens['evap_wp'][ens])/(
-                self.soil_par_ens['evap_fc'][ens] - self.soil_par_ens['evap_wp'][ens])
-                
-        if SSMI > 1: 
-            SSMI = 1
-        elif SSMI<0:
-            SSMI = 0
+        sm = self.sm_ens
+        # calculate surface soil moisture index of the members
+        evap_wp = self.soil_par_ens['evap_wp']
+        evap_fc = self.soil_par_ens['evap_fc']
+        SSMI = np.clip((sm[:,0] - evap_wp)/(evap_fc - evap_wp), 0, 1)
     
-        # calculate root zone soil moisture index
-        RZSMI = np.zeros((self.no_layer,))
-        mid_z = self.mid_z
-        fl = self.shp_ens['fl']
-        
-        for i in range(self.no_layer):
-            trans_wp = self.ET_par['trans_wp'][ens]*np.exp(-mid_z/fl)[i]
-            trans_fc = self.ET_par['trans_fc'][ens]*np.exp(-mid_z/fl)[i]
-            if (sm[i] < trans_wp):
-                RZSMI[i] = 0
-            elif sm[i] > trans_fc:
-                RZSMI[i] = 1
-            else:
-                
-                RZSMI[i] = (sm[i]-trans_wp)/(trans_fc - trans_wp)
-            
+        # calculate root zone soil moisture index, (n_ens, no_layer)
+        fl_scale = self._depth_scale(self.shp_ens['fl'], self.shp_ens['zl'])[0]
+        trans_wp = self.ET_par['trans_wp'][:,np.newaxis]*fl_scale
+        trans_fc = self.ET_par['trans_fc'][:,np.newaxis]*fl_scale
+        RZSMI = np.clip((sm-trans_wp)/(trans_fc - trans_wp), 0, 1)
         
         self.SSMI = SSMI
         self.RZSMI = RZSMI
@@ -1420,9 +1806,8 @@ class CSGLM_ENKF(CSGLM):
         this module stores the surface water
         and give as recharge to the groundwater model
         """
-        ens = self.ens
         # update the storage based on the surface and hortonian runoff
-        surface_storage = self.surface_storage_ens[ens,self.t] \
+        surface_storage = self.surface_storage_ens[:,self.t] \
                                             + self.runoff_cur \
                                             + self.horton_runoff
         a = 1.0*self.surface_storage_par['a']
@@ -1430,14 +1815,13 @@ class CSGLM_ENKF(CSGLM):
         Rep = a*surface_storage**b
         #print type(surface_storage)
         
-        self.surface_storage_ens[ens,self.t+1] = surface_storage - Rep
+        self.surface_storage_ens[:,self.t+1] = surface_storage - Rep
         self.Rep = Rep     
 
     def _gw_ens_fun(self):
         """
         Groundwater module
         """
-        ens = self.ens
         F = self.gw_par['F']
         G = self.gw_par['G']
         hmin = self.gw_par['hmin']
@@ -1447,18 +1831,17 @@ class CSGLM_ENKF(CSGLM):
         
         # net input = recharge - discharge
         u = self.recharge-self.pumping_cur + self.Rep
-        self.gw_level_ens[ens,self.t+1] = F*(self.gw_level_ens[ens,self.t]-hmin) + G*u + hmin
+        self.gw_level_ens[:,self.t+1] = F*(self.gw_level_ens[:,self.t]-hmin) + G*u + hmin
         
-        dzn = self.gw_level_ens[ens,self.t+1] - self.gw_level_ens[ens,self.t] 
+        dzn = self.gw_level_ens[:,self.t+1] - self.gw_level_ens[:,self.t] 
         self.discharge = u - self.sy*(dzn) # simulated discharge
-        self.z_ens[ens,-1] = self.z_ens[ens,-1] - dzn
+        self.z_ens[:,-1] = self.z_ens[:,-1] - dzn
         
     def _read_spatial(self):
         """
         Read the spatial info
         """
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('spatial_info')
+        sheet = self._sheet('spatial_info')
         # get the row number from the ind
         j = self.ind['spatial_info']
         no_layer = int(sheet.cell_value(j,1))
@@ -1493,7 +1876,7 @@ class CSGLM_ENKF(CSGLM):
         X = np.hstack([x, soil_par])
         
         # compute the covariance matrix of the state+par
-        X_bar = np.tile(X.mean(axis=0),(10,1))
+        X_bar = np.tile(X.mean(axis=0),(self.n_ens,1))
         X_X_bar = X-X_bar
         cov_XX = np.dot(X_X_bar.T,X_X_bar) + 1e-6*np.eye(self.no_layer+6)
         cov_XX = 0.5*(cov_XX + cov_XX.T)
@@ -1570,6 +1953,37 @@ class CSGLM_ENKF(CSGLM):
         self.cov_ee = cov_ee
         self.cov_XX = cov_XX
     
+    def _aet_ens(self):
+        """
+        actual evapotranspiration of each ensemble member at the current 
+        time step, given by its soil moisture
+        """
+        self._smi_fun()
+        self._transpiration_fun()
+        return self.evap*self.SSMI + self.AT.sum(axis=1) + self.E_In
+    
+    def _enkf_ens_space(self):
+        """
+        ensemble kalman filter, with the analysis computed in the ensemble
+        space (see ambhas.enkf)
+        the state contains the soil moisture at different depths and the 
+        soil parameters. The observations are the surface soil moisture 
+        and the AET at the current time step, the ones which are missing 
+        (nan) are not used.
+        """
+        X = enkf.augment(self.sm_ens, self.soil_par_ens, self.par_keys)
+        HX = np.column_stack([self.sm_ens[:,0], self._aet_ens()])
+        obs = [self.meas_sm_mean[self.t], self.meas_aet[self.t]]
+        R = [self.meas_sm_std[self.t]**2, self.aet_std**2]
+        X = enkf.analysis(X, HX, obs, R, self.analysis, self.inflation)
+        sm_ens, soil_par = enkf.split(X, self.no_layer, self.par_keys)
+        
+        # check for the range of the updated ensemble
+        self.sm_ens = np.clip(sm_ens, 0, 1)
+        for key in self.par_keys:
+            self.soil_par_ens[key] = np.clip(soil_par[key], getattr(self, key+'_min'),
+                                             getattr(self, key+'_max'))
+    
     def _enkf_ET(self):
         """
         ensemble kalman filter
@@ -1587,31 +2001,27 @@ class CSGLM_ENKF(CSGLM):
         X = np.hstack([x, soil_par])
         
         # compute the covariance matrix of the state+par
-        X_bar = np.tile(X.mean(axis=0),(10,1))
+        X_bar = np.tile(X.mean(axis=0),(self.n_ens,1))
         X_X_bar = X-X_bar
         cov_XX = np.dot(X_X_bar.T,X_X_bar) + 1e-6*np.eye(self.no_layer+6)
         cov_XX = 0.5*(cov_XX + cov_XX.T)
         
         # get the measurement of the AET at the current time
         # and use it to generate ensemble of soil moisture
-        err_aet = np.zeros(self.n_ens)
-        for ens in range(self.n_ens):
-            self.ens = ens
-            self._smi_fun()
-            AE = self.evap*self.SSMI
-            self._transpiration_fun()
-            AT = self.AT 
-            
-            err_aet[ens] = self.meas_aet[self.t] - AE - AT.sum() - self.E_In
-        err_ae = err_aet.mean()*AE/(AE+AT.sum())
-        err_at = err_aet.mean()*AT.sum()/(AE+AT.sum())
+        self._smi_fun()
+        AE = self.evap*self.SSMI
+        self._transpiration_fun()
+        AT = self.AT.sum(axis=1)
+        err_aet = self.meas_aet[self.t] - AE - AT - self.E_In
+        # the error is split between the evaporation and transpiration as 
+        # in the last member
+        err_ae = err_aet.mean()*AE[-1]/(AE[-1]+AT[-1])
+        err_at = err_aet.mean()*AT[-1]/(AE[-1]+AT[-1])
         
         e = np.zeros((self.n_ens, self.no_layer+6))
-        e[:,0] = (err_ae + err_at*self.r_density[0])/self.z[0]
-        e[:,1] = err_at*self.r_density[1]/self.z[1]
-        e[:,2] = err_at*self.r_density[2]/self.z[2]
-        e[:,3] = err_at*self.r_density[3]/self.z[3]
-        e[:,4] = err_at*self.r_density[4]/self.z[4]
+        z = np.asarray(self.z, dtype=float)
+        e[:,0] = (err_ae + err_at*self.r_density[0])/z[0]
+        e[:,1:5] = err_at*self.r_density[1:5]/z[1:5]
         v = 0.03*np.random.normal(size=(self.n_ens,self.no_layer+6))
             
         v = v-np.tile(v.mean(axis=0),(self.n_ens,1))
@@ -1682,30 +2092,17 @@ class CSGLM_ENKF(CSGLM):
         """
         read the forcing data from xls file
         """
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('forcing')
-        
-        data_len = sheet.nrows-1
-        year = np.zeros(data_len)
-        doy = np.zeros(data_len)
-        rain = np.zeros(data_len)
-        pet = np.zeros(data_len)
-        ndvi = np.zeros(data_len)
-        pumping = np.zeros(data_len)
-        meas_sm_mean = np.zeros(data_len)
-        meas_sm_std = np.zeros(data_len)
-        meas_aet = np.zeros(data_len)
-    
-        for i in xrange(data_len):
-            year[i] = sheet.cell_value(i+1,0)
-            doy[i] = sheet.cell_value(i+1,1)
-            rain[i] = sheet.cell_value(i+1,2)
-            pet[i] = sheet.cell_value(i+1,3)
-            ndvi[i] = sheet.cell_value(i+1,4)
-            pumping[i] = sheet.cell_value(i+1,5)
-            meas_sm_mean[i] = sheet.cell_value(i+1,6)
-            meas_sm_std[i] = sheet.cell_value(i+1,7)
-            meas_aet[i] = sheet.cell_value(i+1,8)/1000.0
+        sheet = self._sheet('forcing')
+        
+        year = col_array(sheet, 0)
+        doy = col_array(sheet, 1)
+        rain = col_array(sheet, 2)
+        pet = col_array(sheet, 3)
+        ndvi = col_array(sheet, 4)
+        pumping = col_array(sheet, 5)
+        meas_sm_mean = col_array(sheet, 6)
+        meas_sm_std = col_array(sheet, 7)
+        meas_aet = col_array(sheet, 8)/1000.0
         
         self.year = year
         self.doy = doy
@@ -1776,28 +2173,21 @@ class CSGLM_ENKF(CSGLM):
         self.nc_l[:,self.t] = self.soil_par_ens['l']
         #self.nc_recharge[:,self.t] = self.recharge
     
-    def _shp(self, theta,i):
-        """
-        soil hydraulic properties module
-        i is the layer
+    def _shp_ens(self, theta):
         """
-        ens = self.ens
-        qr = self.soil_par_ens['qr'][ens]*np.exp(-self.mid_z[i]/self.shp_ens['fl'])
-        f = self.soil_par_ens['f'][ens]*np.exp(-self.mid_z[i]/self.shp_ens['fl'])
-        a = self.soil_par_ens['a'][ens]
-        n = self.soil_par_ens['n'][ens]
-        Ks = self.soil_par_ens['Ks'][ens]
-        l = self.soil_par_ens['l'][ens]
+        soil hydraulic properties module, for all the layers of all the 
+        members
         
-        m = 1-1/n
-        Se = (theta-qr)/(f - qr)
-        if Se>=0.99:
-            Se = 0.99
-        elif Se<=0.01:
-            Se = 0.01
-        K = Ks*Se**l*(1-(1-Se**(1/m))**m)**2
-        D = K/(a*(f-qr)*m*n*(Se**(1/m+1))*(Se**(-1/m)-1)**m)
-        return K, D
+        Input:
+            theta: soil moisture of the members, (n_ens, no_layer)
+        Output:
+            K, D: hydraulic conductivity and diffusivity, (n_ens, no_layer)
+        """
+        fl_scale = self._depth_scale(self.shp_ens['fl'], self.shp_ens['zl'])[0]
+        par = dict((key, np.asarray(self.soil_par_ens[key], dtype=float)[:,np.newaxis])
+                   for key in self.par_keys)
+        return self._shp_vg(theta, par['qr']*fl_scale, par['f']*fl_scale,
+                            par['a'], par['n'], par['Ks'], par['l'])
 
     def _read_ET_par(self):
         """
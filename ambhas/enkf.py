@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 21:40:26 2026
+
+@author: Sat Kumar Tomer
+@website: www.ambhas.com
+@email: satkumartomer@gmail.com
+
+Analysis step of the ensemble Kalman filters, computed in the ensemble space.
+
+The ensemble is given as an array X of shape (n_ens, n_state), one row per
+member, as used in RICHARDS_1D_ENKF and CSGLM_ENKF. The parameters are
+estimated together with the state by appending them to the state vector
+(augment and split). The observations predicted by each member (HX) are
+given by an observation operator (obs_operator), which can be the indices
+of the observed state variables, a matrix, or any function of the ensemble.
+
+The gain is never formed in the state space: the analysis is solved for the
+weights of the members, so that its cost is of the order of
+n_ens**2*(n_state+n_obs) + n_ens**3, instead of n_state**3 for the inverse
+of the state covariance. The observations which are nan are not used.
+
+functions:
+    etkf:           ensemble transform Kalman filter (deterministic)
+    enkf:           ensemble Kalman filter with perturbed observations
+    analysis:       either of them, selected by the name of the method
+    obs_operator:   observations predicted by the members
+    augment:        append the parameters to the state
+    split:          separate the state and the parameters
+
+Ref:
+Hunt, B. R., Kostelich, E. J., and Szunyogh, I. (2007), Efficient data
+assimilation for spatiotemporal chaos: a local ensemble transform Kalman
+filter, Physica D, 230, 112-126.
+Evensen, G. (2003), The ensemble Kalman filter: theoretical formulation
+and practical implementation, Ocean Dynamics, 53, 343-367.
+
+Example:
+    X = augment(theta_ens, soil_par_ens, ['thetas', 'Ks'])
+    HX = obs_operator(X, [0, 1])
+    Xa = etkf(X, HX, y, obs_std**2)
+    theta_ens, par = split(Xa, no_layer, ['thetas', 'Ks'])
+"""
+
+from __future__ import division
+import numpy as np
+
+
+def augment(x, par, keys):
+    """
+    append the parameters to the state
+
+    Input:
+        x: ensemble of the state, shape (n_ens, n)
+        par: dict of the ensemble of the parameters, shape (n_ens,) each
+        keys: names of the parameters to be appended, in this order
+    Output:
+        X: augmented ensemble, shape (n_ens, n+len(keys))
+    """
+    x = np.asarray(x, dtype=float)
+    if x.ndim == 1:
+        x = x[:,np.newaxis]
+    return np.hstack([x]+[np.asarray(par[key], dtype=float)[:,np.newaxis]
+                          for key in keys])
+
+def split(X, n, keys):
+    """
+    separate the state and the parameters of the augmented ensemble
+
+    Input:
+        X: augmented ensemble, shape (n_ens, n+len(keys))
+        n: size of the state
+        keys: names of the parameters, as given to augment
+    Output:
+        x: ensemble of the state, shape (n_ens, n)
+        par: dict of the ensemble of the parameters
+    """
+    if X.shape[1] != n+len(keys):
+        raise ValueError('The size of the ensemble does not match the state and parameters')
+    par = {}
+    for i, key in enumerate(keys):
+        par[key] = X[:,n+i].copy()
+    return X[:,:n].copy(), par
+
+def obs_operator(X, H):
+    """
+    observations predicted by each member
+
+    Input:
+        X: ensemble, shape (n_ens, n_state)
+        H: observation operator, either
+            indices of the observed state variables (int or sequence)
+            matrix of shape (n_obs, n_state)
+            function of the ensemble returning an array (n_ens, n_obs)
+    Output:
+        HX: predicted observations, shape (n_ens, n_obs)
+    """
+    if callable(H):
+        HX = np.asarray(H(X), dtype=float)
+    else:
+        H = np.asarray(H)
+        if H.ndim == 2:
+            HX = np.dot(X, H.T)
+        else:
+            HX = X[:,np.atleast_1d(H).astype(int)]
+    if HX.ndim == 1:
+        HX = HX[:,np.newaxis]
+    return HX
+
+def _check(X, HX, y, R):
+    """
+    check the input, and remove the observations which are nan
+
+    Output:
+        HX, y, R: for the valid observations
+        R is returned as an array of the variances (1-D) or the covariance
+        matrix (2-D)
+    """
+    X = np.asarray(X, dtype=float)
+    HX = np.asarray(HX, dtype=float)
+    if HX.ndim == 1:
+        HX = HX[:,np.newaxis]
+    y = np.atleast_1d(np.asarray(y, dtype=float))
+    if X.ndim != 2 or HX.shape[0] != X.shape[0]:
+        raise ValueError('X and HX should have one row per ensemble member')
+    if HX.shape[1] != len(y):
+        raise ValueError('The no. of predicted observations does not match y')
+    if X.shape[0] < 2:
+        raise ValueError('The ensemble should have at least 2 members')
+
+    R = np.asarray(R, dtype=float)
+    if R.ndim == 0:
+        R = np.tile(R, len(y))
+    if R.shape not in [(len(y),), (len(y),len(y))]:
+        raise ValueError('R should be scalar, one variance per observation, or a matrix')
+
+    valid = np.isfinite(y)
+    if not np.all(valid):
+        HX, y = HX[:,valid], y[valid]
+        R = R[valid] if R.ndim == 1 else R[valid][:,valid]
+    return X, HX, y, R
+
+def _rinv(R, Y):
+    """
+    product of the inverse of R with Y, along the last axis of Y
+    """
+    if R.ndim == 1:
+        return Y/R
+    else:
+        return np.linalg.solve(R, Y.T).T
+
+def _ens_space(HX, R, inflation):
+    """
+    the terms of the analysis in the ensemble space
+
+    Output:
+        Y: anomalies of the predicted observations, shape (n_ens, n_obs)
+        RiY: Y times the inverse of R
+        s, V: eigenvalues and eigenvectors of
+        (n_ens-1)/inflation*I + Y R^-1 Y^T
+    """
+    n_ens = HX.shape[0]
+    Y = HX-HX.mean(axis=0)
+    RiY = _rinv(R, Y)
+    C = (n_ens-1)/inflation*np.eye(n_ens) + np.dot(RiY, Y.T)
+    s, V = np.linalg.eigh(0.5*(C+C.T))
+    return Y, RiY, s, V
+
+def etkf(X, HX, y, R, inflation=1.0):
+    """
+    ensemble transform Kalman filter
+    the mean is updated by the Kalman gain, and the anomalies by the
+    symmetric square root of the analysis covariance, so that no
+    perturbation of the observations is needed
+
+    Input:
+        X: forecast ensemble, shape (n_ens, n_state)
+        HX: predicted observations, shape (n_ens, n_obs)
+        y: observations, shape (n_obs,), the ones which are nan are not used
+        R: error of the observations, variance (scalar or one per
+        observation) or covariance matrix (n_obs, n_obs)
+        inflation: multiplicative inflation of the forecast covariance
+        (default 1.0, no inflation)
+    Output:
+        Xa: analysis ensemble, shape (n_ens, n_state)
+    """
+    X, HX, y, R = _check(X, HX, y, R)
+    if len(y) == 0:
+        return X.copy()
+    n_ens = X.shape[0]
+    x_mean = X.mean(axis=0)
+    A = X-x_mean
+
+    Y, RiY, s, V = _ens_space(HX, R, inflation)
+    # weights of the mean, and the transform of the anomalies
+    w_mean = np.dot(V, np.dot(V.T, np.dot(RiY, y-HX.mean(axis=0)))/s)
+    W = np.dot(V*np.sqrt((n_ens-1)/s), V.T)
+    return x_mean + np.dot(w_mean+W, A)
+
+def enkf(X, HX, y, R, inflation=1.0):
+    """
+    ensemble Kalman filter with perturbed observations
+    each member is updated with its own perturbed observations, the
+    perturbations are centered to keep the mean of the analysis unbiased
+
+    Input:
+        X, HX, y, R, inflation: see etkf
+    Output:
+        Xa: analysis ensemble, shape (n_ens, n_state)
+    """
+    X, HX, y, R = _check(X, HX, y, R)
+    if len(y) == 0:
+        return X.copy()
+    A = X-X.mean(axis=0)
+    if inflation != 1.0:
+        A = np.sqrt(inflation)*A
+        X = X.mean(axis=0) + A
+        HX = HX.mean(axis=0) + np.sqrt(inflation)*(HX-HX.mean(axis=0))
+
+    # perturbed observations
+    v = np.random.normal(size=HX.shape)
+    v = v-v.mean(axis=0)
+    if R.ndim == 1:
+        v = v*np.sqrt(R)
+    else:
+        v = np.dot(v, np.linalg.cholesky(R).T)
+    D = y+v-HX
+
+    Y, RiY, s, V = _ens_space(HX, R, 1.0)
+    # the gain A^T (Y^T Y/(n_ens-1) + R)^-1 is written in the ensemble
+    # space: A^T ((n_ens-1) I + Y R^-1 Y^T)^-1 Y R^-1
+    W = np.dot(np.dot(np.dot(D, RiY.T), V)/s, V.T)
+    return X + np.dot(W, A)
+
+def analysis(X, HX, y, R, method='etkf', inflation=1.0):
+    """
+    analysis step of the ensemble Kalman filter
+
+    Input:
+        X, HX, y, R, inflation: see etkf
+        method: 'etkf' (default) or 'enkf'
+    Output:
+        Xa: analysis ensemble, shape (n_ens, n_state)
+    """
+    if method == 'etkf':
+        return etkf(X, HX, y, R, inflation)
+    elif method == 'enkf':
+        return enkf(X, HX, y, R, inflation)
+    else:
+        raise ValueError("The method should be either 'etkf' or 'enkf'")
@@ -319,7 +319,7 @@ if __name__=='__main__':
     #print(NS(sim,obs)) 
     #print(L(sim,obs))
     #print(correlation(sim,obs))
-    print agreement_coefficient(obs*0.0, obs)
+    print(agreement_coefficient(obs*0.0, obs))
     
     #kappa_class = KAPPA(soil_sat,soil_obs)
     #kappa_mat, kappa_coeff = kappa_class.kappa_coeff()
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 14:20:05 2026
+
+@author: Sat Kumar Tomer
+@website: www.ambhas.com
+@email: satkumartomer@gmail.com
+
+Buffered writing of the netcdf output files of the models.
+
+The values written one time step at a time are kept in memory and written
+to the file in contiguous blocks of buffer_size time steps.
+
+A run resumed from a checkpoint appends to the existing file (mode='a'):
+the variables are taken from the file, and the time steps before t_start,
+which are already in the file, are not written again.
+
+Two backends are available:
+    'scipy': netcdf3 files written by scipy.io.netcdf
+    'netcdf4': netcdf4/hdf5 files written by netCDF4, with chunking,
+    compression and optionally float32 storage
+
+Example:
+    out = NCOutput('out.nc', backend='netcdf4', dtype='f')
+    out.createDimension('depth', 40)
+    out.createDimension('time', 366)
+    sm = out.createVariable('sm', ('depth','time'), units='v/v')
+    for t in range(366):
+        sm.put(t, theta)
+    out.close()
+"""
+
+from __future__ import division
+import numpy as np
+from scipy.io import netcdf as nc
+
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+
+class NCOutput():
+    """
+    netcdf output file with buffered writing along the time dimension
+    """
+
+    def __init__(self, fname, backend='scipy', buffer_size=100, dtype='d',
+                 complevel=4, time_dim='time', mode='w', t_start=0):
+        """
+        Input:
+            fname: name of the output file
+            backend: 'scipy' (default) or 'netcdf4'
+            buffer_size: no. of time steps kept in memory before writing
+            dtype: storage type of the variables, 'd' (float64) or 'f'
+            (float32)
+            complevel: compression level (0-9) of the netcdf4 backend,
+            0 means no compression
+            time_dim: name of the time dimension
+            mode: 'w' (default) to create the file, or 'a' to append to the
+            existing file
+            t_start: in the mode 'a', the first time step to be written
+        """
+        if mode not in ['w', 'a']:
+            raise ValueError("The mode should be either 'w' or 'a'")
+        if backend == 'scipy':
+            self.file = nc.NetCDFFile(fname, mode)
+        elif backend == 'netcdf4':
+            if netCDF4 is None:
+                raise ValueError("The backend 'netcdf4' needs the netCDF4 package")
+            if mode == 'w':
+                self.file = netCDF4.Dataset(fname, 'w', format='NETCDF4')
+            else:
+                self.file = netCDF4.Dataset(fname, 'a')
+        else:
+            raise ValueError("The backend should be either 'scipy' or 'netcdf4'")
+
+        self.backend = backend
+        self.buffer_size = buffer_size
+        self.dtype = dtype
+        self.complevel = complevel
+        self.time_dim = time_dim
+        self.mode = mode
+        self.t_start = t_start if mode == 'a' else 0
+        self.dimensions = {}
+        self.variables = {}
+        if mode == 'a':
+            for name, dim in self.file.dimensions.items():
+                self.dimensions[name] = dim if backend == 'scipy' else len(dim)
+
+    def setncattr(self, name, value):
+        """
+        set the global attribute of the file
+        in the mode 'a', the attributes already present are kept
+        """
+        if self.mode == 'a' and hasattr(self.file, name):
+            return
+        setattr(self.file, name, value)
+
+    def createDimension(self, name, size):
+        """
+        create the dimension
+        in the mode 'a', the dimension present in the file should be of the
+        same size
+        """
+        if self.mode == 'a' and name in self.dimensions:
+            if self.dimensions[name] != size:
+                raise ValueError('The size of the dimension %s is %s in the file, not %s'
+                                 %(name, self.dimensions[name], size))
+            return
+        self.file.createDimension(name, size)
+        self.dimensions[name] = size
+
+    def createVariable(self, name, dims, units=None, dtype=None):
+        """
+        create the variable
+
+        Input:
+            name: name of the variable
+            dims: dimensions of the variable
+            units: units of the variable
+            dtype: storage type, by default the one of the file
+        Output:
+            var: BufferedVariable
+        """
+        if dtype is None:
+            dtype = self.dtype
+
+        if self.mode == 'a' and name in self.file.variables:
+            nc_var = self.file.variables[name]
+            if tuple(nc_var.dimensions) != tuple(dims):
+                raise ValueError('The dimensions of the variable %s are not the same in the file'%name)
+            var = BufferedVariable(nc_var, dims, self.dimensions, 
+                                   self.buffer_size, self.time_dim, self.t_start)
+            self.variables[name] = var
+            return var
+        
+        if self.backend == 'scipy':
+            nc_var = self.file.createVariable(name, dtype, dims)
+        else:
+            # chunks are one time buffer long, and one member of the
+            # leading dimensions (e.g. ensemble) wide
+            chunksizes = []
+            for i, dim in enumerate(dims):
+                size = self.dimensions[dim]
+                if dim == self.time_dim:
+                    chunksizes.append(min(size, self.buffer_size))
+                elif i < len(dims)-2:
+                    chunksizes.append(1)
+                else:
+                    chunksizes.append(size)
+            zlib = self.complevel > 0
+            nc_var = self.file.createVariable(name, dtype, dims, zlib=zlib,
+                        complevel=max(self.complevel, 1), shuffle=zlib,
+                        chunksizes=chunksizes)
+        if units is not None:
+            nc_var.units = units
+
+        var = BufferedVariable(nc_var, dims, self.dimensions, self.buffer_size,
+                               self.time_dim, self.t_start)
+        self.variables[name] = var
+        return var
+
+    def flush(self):
+        """
+        write all the buffered data into the file
+        """
+        for var in self.variables.values():
+            var.flush()
+        if self.backend == 'scipy':
+            self.file.flush()
+            self.file.fp.flush()
+        else:
+            self.file.sync()
+
+    def close(self):
+        """
+        write all the buffered data and close the file
+        """
+        for var in self.variables.values():
+            var.flush()
+        self.file.close()
+
+
+class BufferedVariable():
+    """
+    variable of the NCOutput
+    the values given by put are buffered along the time dimension, while
+    the item assignment is written to the file directly
+    """
+
+    def __init__(self, nc_var, dims, dimensions, buffer_size, time_dim='time',
+                 t_start=0):
+        """
+        Input:
+            nc_var: variable of the netcdf file
+            dims: dimensions of the variable
+            dimensions: sizes of the dimensions
+            buffer_size: no. of time steps in the buffer
+            time_dim: name of the time dimension
+            t_start: the values put at the time steps before t_start are
+            not written, as these are already in the file
+        """
+        self.nc_var = nc_var
+        self.dims = dims
+        if time_dim in dims:
+            self.time_axis = list(dims).index(time_dim)
+            shape = [dimensions[dim] for dim in dims]
+            self.n_time = shape[self.time_axis]
+            shape[self.time_axis] = min(buffer_size, self.n_time)
+            self.buf = np.empty(shape)
+        else:
+            self.time_axis = None
+        self.t_start = t_start
+        self.t0 = 0
+        self.count = 0
+
+    def __setitem__(self, key, value):
+        self.nc_var[key] = value
+
+    def __getitem__(self, key):
+        self.flush()
+        return self.nc_var[key]
+
+    def _index(self, t):
+        """
+        index of the time t along the time axis
+        """
+        index = [slice(None)]*self.buf.ndim
+        index[self.time_axis] = t
+        return tuple(index)
+
+    def put(self, t, value):
+        """
+        put the value at the time t in the buffer
+        the buffer is written when it is full, or when t does not follow the
+        buffered time steps
+        """
+        if self.time_axis is None:
+            raise ValueError('The variable does not have a time dimension')
+        if t < self.t_start:
+            return
+        if self.count>0 and (t != self.t0+self.count or
+                             self.count == self.buf.shape[self.time_axis]):
+            self.flush()
+        if self.count == 0:
+            self.t0 = t
+        self.buf[self._index(self.count)] = value
+        self.count += 1
+
+    def flush(self):
+        """
+        write the buffer into the file as one contiguous block
+        """
+        if self.time_axis is None or self.count == 0:
+            return
+        self.nc_var[self._index(slice(self.t0, self.t0+self.count))] = \
+                    self.buf[self._index(slice(0, self.count))]
+        self.t0 += self.count
+        self.count = 0
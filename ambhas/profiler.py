@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 01:02:55 2026
+
+@author: Sat Kumar Tomer
+@website: www.ambhas.com
+@email: satkumartomer@gmail.com
+
+Wall time and no. of calls of the phases of a model run (e.g. the
+constitutive functions, the solution of the linear system, the analysis of
+the EnKF, the writing of the output), used by the RICHARDS_1D and CSGLM
+models when they are run with profile=True.
+
+The phases are given as a dict of the names of the methods of the model
+which belong to each phase. The profiler replaces these methods of the
+model (only of this instance) by timed ones, so that the model is not
+slowed down at all when it is not profiled. The phases can be nested: the
+total time of a phase includes the phases called from it, and its own time
+does not. Other counts (e.g. the no. of sub-steps of each day) are given to
+record.
+
+Example:
+    profiler = Profiler()
+    profiler.attach(model, {'solve':['_solve_tridiag'],
+                            'output':['_write_output']})
+    model.run()
+    print(profiler.summary())
+"""
+
+from __future__ import division
+import time
+import numpy as np
+
+# the most accurate wall clock
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class Profiler():
+    """
+    wall time and no. of calls of the phases of a model, and other counts
+    recorded during the run
+
+    Attributes:
+        total: total time of each phase (s), including the nested phases
+        own: own time of each phase (s), excluding the nested phases
+        calls: no. of calls of each phase
+        counts: dict of the lists of the recorded counts
+    """
+
+    def __init__(self):
+        self.total = {}
+        self.own = {}
+        self.calls = {}
+        self.counts = {}
+        self._stack = []
+
+    def attach(self, model, phases):
+        """
+        time the methods of the model
+
+        Input:
+            model: the model, whose methods are replaced by timed ones
+            phases: dict of the list of the names of the methods of each
+            phase, the methods which the model does not have are skipped
+        """
+        for phase in phases:
+            for name in phases[phase]:
+                method = getattr(model, name, None)
+                if method is not None:
+                    setattr(model, name, self._timed(phase, method))
+
+    def _timed(self, phase, func):
+        """
+        the function timed as the phase
+        """
+        self.total.setdefault(phase, 0.0)
+        self.own.setdefault(phase, 0.0)
+        self.calls.setdefault(phase, 0)
+        stack = self._stack
+
+        def timed(*args, **kwargs):
+            stack.append(0.0)
+            t0 = timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                dt = timer()-t0
+                nested = stack.pop()
+                self.total[phase] += dt
+                self.own[phase] += dt-nested
+                self.calls[phase] += 1
+                if stack:
+                    stack[-1] += dt
+        return timed
+
+    def record(self, name, value):
+        """
+        record a count, e.g. the no. of sub-steps of a day
+        """
+        self.counts.setdefault(name, []).append(value)
+
+    def as_dict(self):
+        """
+        the results as a dict of the phases, each with its total time, own
+        time and calls, and the sum, mean and max of the counts
+        """
+        stats = {'phases':{}, 'counts':{}}
+        for phase in self.calls:
+            stats['phases'][phase] = {'total':self.total[phase],
+                                      'own':self.own[phase],
+                                      'calls':self.calls[phase]}
+        for name in self.counts:
+            value = np.asarray(self.counts[name])
+            stats['counts'][name] = {'n':len(value), 'sum':value.sum(),
+                                     'mean':value.mean(), 'max':value.max()}
+        return stats
+
+    def attributes(self, prefix='profile_'):
+        """
+        the results as flat attributes for the output file, e.g.
+        profile_own_solve, profile_calls_solve and profile_n_sub_mean, all
+        as float as netcdf3 has no 64 bit integers
+        """
+        attrs = {}
+        stats = self.as_dict()
+        for phase in stats['phases']:
+            for key in ['total', 'own', 'calls']:
+                attrs['%s%s_%s'%(prefix, key, phase)] = float(stats['phases'][phase][key])
+        for name in stats['counts']:
+            for key in ['sum', 'mean', 'max']:
+                attrs['%s%s_%s'%(prefix, name, key)] = float(stats['counts'][name][key])
+        return attrs
+
+    def summary(self):
+        """
+        table of the phases sorted by their own time, and of the counts
+        """
+        own_sum = sum(self.own.values())
+        lines = ['%-16s %10s %10s %8s %10s %12s'%('phase', 'total(s)', 'own(s)',
+                 'own(%)', 'calls', 'per call(us)')]
+        for phase in sorted(self.own, key=self.own.get, reverse=True):
+            if self.calls[phase] == 0:
+                continue
+            lines.append('%-16s %10.3f %10.3f %8.1f %10d %12.1f'%(phase,
+                         self.total[phase], self.own[phase],
+                         100*self.own[phase]/max(own_sum, 1e-12),
+                         self.calls[phase],
+                         1e6*self.total[phase]/self.calls[phase]))
+        for name, stats in sorted(self.as_dict()['counts'].items()):
+            lines.append('%s: sum %g, mean %.2f, max %g over %d'%(name,
+                         stats['sum'], stats['mean'], stats['max'], stats['n']))
+        return '\n'.join(lines)
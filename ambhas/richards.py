@@ -9,18 +9,62 @@ Created on Mon Mar 12 17:41:54 2012
 
 from __future__ import division
 import numpy as np
-import xlrd
-from scipy.io import netcdf as nc
 import datetime
 import matplotlib.pyplot as plt
 from BIP.Bayes.lhs import lhs
+from ambhas.tdma import solve_tridiag, thomas
+from ambhas.ncout import NCOutput
+from ambhas.xls import open_input, col_array
+from ambhas.checkpoint import save_checkpoint, load_checkpoint
+from ambhas import enkf
+from ambhas import errlib
+from ambhas.streamstats import WeightedMoments, HistogramSketch
+from ambhas.profiler import Profiler
+from ambhas.vg_table import VGTableCache
 from scipy import stats
 import sys
 import logging
-import sys
+import multiprocessing
 
 #np.seterr(all='raise')
 
+def stretched_dz(depth, dz_top, ratio=1.2, dz_max=None):
+    """
+    thickness of the soil layers of a non-uniform grid, fine near the
+    surface and coarse at depth, the thickness grows by the ratio from one
+    layer to the next, and the last layer is adjusted to end at the depth
+
+    Input:
+        depth: total depth of the soil column (m)
+        dz_top: thickness of the top layer (m)
+        ratio: ratio of the thickness of two consecutive layers (>=1)
+        dz_max: maximum thickness of the layers (m), not limited by default
+    Output:
+        dz: thickness of the layers (m)
+    """
+    if dz_top <= 0 or dz_top > depth:
+        raise ValueError('dz_top should be positive and less than the depth')
+    if ratio < 1:
+        raise ValueError('The ratio should be greater than or equal to 1')
+
+    dz = []
+    z = 0.0
+    cur = dz_top
+    while z + cur < depth*(1-1e-9):
+        dz.append(cur)
+        z += cur
+        cur = cur*ratio
+        if dz_max is not None:
+            cur = min(cur, dz_max)
+    # the remaining part is merged into the last layer when it is thinner
+    # than the half of the next layer
+    rest = depth-z
+    if len(dz)>0 and rest < 0.5*cur:
+        dz[-1] += rest
+    else:
+        dz.append(rest)
+    return np.array(dz)
+
 class RICHARDS_1D():
     """
     This is the main class of the RICHARDS_1D.
@@ -31,32 +75,399 @@ class RICHARDS_1D():
     and then write the output files
     
     """
+    solver = 'loop'
+    dt_control = 'fixed'
+    theta_tol = 1e-3
+    mb_tol = 1e-6
+    dt_min = 1.0
+    dt_max = None
+    max_iter = 20
+    iter_tol = 1e-6
+    iter_psi_tol = 1e-3
+    output_backend = 'scipy'
+    output_buffer = 100
+    output_dtype = 'd'
+    output_complevel = 4
+    output_vars = ['sm', 'rain', 'aet', 'recharge', 'n_iter', 'mb_err']
+    output_depths = None
+    output_zones = None
+    output_every = 1
+    output_aggregate = 'sample'
+    kmid = 'arithmetic'
+    vg_table = False
+    vg_tol = 1e-4
+    vg_cache_size = 8
+    vg_cache = None
+    vg_last = None
+    infil_depth = None
+    checkpoint_file = None
+    checkpoint_every = 0
+    checkpoint_vars = ['t', 'theta', 'iter_dt', 'dt_sub']
+    spinup_days = None
+    spinup_start = 0
+    spinup_tol = 1e-3
+    spinup_max_cycles = 20
+    profile = False
+    profile_output = False
+    profiler = None
+    # methods of each phase timed by the profiler, the ones not defined by
+    # a class are skipped
+    profile_phases = {'forcing':['_get_forcing'],
+                      'member':['_run_member'],
+                      'unsat':['_unsat', '_unsat_ens', '_unsat_ens_batch'],
+                      'day':['_advance_day', '_advance_tile'],
+                      'step':['_richards_step_loop', '_richards_step_vec', 
+                              '_richards_step_mixed'],
+                      'constitutive':['_constitutive', '_vg_psi'],
+                      'solve':['_solve_tridiag', '_thomas'],
+                      'perturb':['_perturb_soil_par_ens'],
+                      'enkf':['_enkf_par_depth', '_enkf_ens_space'],
+                      'output':['_write_output', '_write_member', 
+                                '_write_stats', 'close'],
+                      'checkpoint':['_checkpoint']}
+    _solve_tridiag = staticmethod(solve_tridiag)
+    _thomas = staticmethod(thomas)
      
-    def __init__(self, input_file, **kwargs):
+    def __init__(self, input_file=None, **kwargs):
         """
         Input:
             input_file: the file which contains all the information
-            including forcing and parameters.
+            including forcing and parameters. If it is None, these are 
+            given as keyword arguments:
+                rain, pet: forcing at each time step (L)
+                year, doy: year and day of year of the forcing (optional)
+                forcing_units: units of the forcing, dict with the keys 
+                'rain' and 'pet', 'm' (default) or 'mm'
+                soil_par: dict of the soil hydraulic parameters, with the 
+                keys thetar, thetas, alpha, n, Ks, l, evap_0 and evap_1
+                no_layer: no. of soil layers
+                dz: thickness of the soil layers (m), scalar for the 
+                uniform grid, or one per layer for a non-uniform grid (see 
+                stretched_dz), in which case no_layer is optional. The 
+                matrix of the non-uniform grid is assembled from the fluxes
+                at the interfaces, and differs slightly from the original 
+                scheme of the scalar dz even when the layers are uniform 
+                (see _richards_step_vec)
+                theta_0: initial soil moisture, scalar or one per layer
+                dt_flux: length of the time step (default 86400 s)
+            dz: when given with the input_file, the thickness of the layers
+            replacing the ones of the spatial_info sheet
+            ofile_name: name of the output file, by default the one given
+            in the input file. When the input is given as arrays, the output
+            file is written only if ofile_name is given
+            output: if False, the output file is not written (default True)
+            run: if True (default), the model is run over all the time 
+            steps, otherwise the model is only initialized, and can be 
+            advanced by step, steps or run
+            solver: the solver for the sub-steps, 'loop' (default) or 
+            'vectorized', which linearize the richards equation once per 
+            sub-step, or 'picard' or 'newton', which solve the mixed form
+            of the richards equation by iterations (Celia et al., 1990)
+            dt_control: the control of the sub-steps, 'fixed' (default), 
+            'adaptive', or 'iterative' (only for the solvers 'picard' and 
+            'newton')
+            theta_tol: tolerance on the local error of the soil moisture 
+            in one sub-step, used by the adaptive control (default 1e-3)
+            mb_tol: maximum mass balance error (L) in one sub-step, used by
+            the adaptive control (default 1e-6)
+            dt_min: minimum length of the sub-step, used by the adaptive 
+            and iterative control (default 1.0)
+            dt_max: maximum length of the sub-step, used by the iterative
+            control (default dt_flux)
+            max_iter: maximum no. of iterations in one sub-step of the 
+            solvers 'picard' and 'newton' (default 20)
+            iter_tol: tolerance of the iterations on the mass balance error
+            of each layer in one sub-step, as soil moisture (default 1e-6)
+            iter_psi_tol: tolerance of the iterations on the change of the 
+            pressure head, relative to the pressure head when it is more 
+            than 1 m, and absolute (m) otherwise (default 1e-3)
+            output_backend: 'scipy' (default, netcdf3) or 'netcdf4' 
+            (chunked and compressed)
+            output_buffer: no. of time steps kept in memory before writing 
+            the output (default 100)
+            output_dtype: storage type of the output, 'd' (default) or 'f'
+            output_complevel: compression level of the netcdf4 output 
+            (default 4)
+            output_vars: variables written in the output file, among sm, 
+            rain, aet, recharge, n_iter and mb_err (default all), the year 
+            and doy are always written
+            output_depths: depths (m) at which the soil moisture is written,
+            the nearest layer of each depth (default all the layers)
+            output_zones: list of (top, bottom) depths (m) of the zones, 
+            e.g. the root zone, whose mean soil moisture (weighted by the 
+            thickness of the layers within the zone) is written instead of 
+            the layers, only one of output_depths and output_zones can be 
+            given
+            output_every: no. of time steps of each output period (default
+            1), the rain, aet, recharge, n_iter and mb_err are summed over 
+            the period, and year and doy are the ones of its first time step
+            output_aggregate: the soil moisture of each output period, 
+            'sample' (default) at the end of the period, or 'mean' the mean
+            of the soil moisture at the end of its time steps
+            the output options are used only by the RICHARDS_1D, the 
+            reductions are done during the run, so only the selected values
+            are kept and written
+            kmid: conductivity at the interfaces of the layers, 
+            'arithmetic' (default, mid-point value) or 'harmonic'
+            vg_table: if True, the conductivity, specific moisture capacity
+            and pressure head of the solvers 'loop' and 'vectorized' are
+            interpolated in tables (ambhas.vg_table) instead of computed by
+            theta2kr, smcf and theta2psi (default False). The tables are 
+            made once per (m, n, l) and scaled to the parameter set, and 
+            their relative error is at most vg_tol (default 1e-4)
+            vg_cache_size: no. of tables kept in memory (default 8), e.g. 
+            for the members of the RICHARDS_1D_GLUE
+            infil_depth: depth of the soil moisture controlling the 
+            infiltration (m), by default the top 10 layers for the uniform
+            grid (scalar dz), and 0.5 m when dz is given per layer
+            checkpoint_file: name of the checkpoint file (.npz), where the 
+            state of the model is saved every checkpoint_every time steps,
+            and at the end of the run
+            checkpoint_every: no. of time steps between the checkpoints, if
+            0 (default) the checkpoint is saved only at the end of the run
+            restart_file: checkpoint file from which the run is resumed, 
+            the output is appended to the existing output file
+            initial_state: checkpoint file whose state is used as the 
+            initial condition of a new run from the first time step, e.g. 
+            a spun-up state shared by many scenarios
+            spinup_days: if given, the model is spun up before the run by 
+            cycling the forcing of the spinup_days time steps starting at 
+            spinup_start (default 0), until the largest change of the soil
+            moisture profile between the ends of two cycles is less than 
+            spinup_tol (default 1e-3), or for at most spinup_max_cycles 
+            (default 20) cycles. The run then starts from the spun-up 
+            state. There is no spin-up when the run is restarted
+            profile: if True, the wall time and no. of calls of the phases 
+            of the run (profile_phases), and the no. of sub-steps of each 
+            day (n_sub) are accumulated in the profiler (ambhas.profiler), 
+            e.g. print(model.profiler.summary()) (default False)
+            profile_output: if True, the profile is also written as the
+            attributes of the output file (default False)
         """
         self.input_file = input_file
+        self._read_options(**kwargs)
         
         # read the input data
-        self._read_input(**kwargs)
+        if input_file is None:
+            self._set_input(**kwargs)
+        else:
+            self._read_input(**kwargs)
+        if not kwargs.get('output', True):
+            self.ofile_name = None
         
         # initialize the variables and output file
         self.initialize()
         
         ################ run the model ########################
-        for t in range(self.max_t):
-            self.t = t
-
+        if kwargs.get('run', True):
+            self.run()
+
+    def _read_options(self, **kwargs):
+        """
+        set the options of the model given as keyword arguments, the 
+        options not given keep their default value
+        """
+        self.solver = kwargs.get('solver', self.solver)
+        self.dt_control = kwargs.get('dt_control', self.dt_control)
+        self.theta_tol = kwargs.get('theta_tol', self.theta_tol)
+        self.mb_tol = kwargs.get('mb_tol', self.mb_tol)
+        self.dt_min = kwargs.get('dt_min', self.dt_min)
+        self.dt_max = kwargs.get('dt_max', self.dt_max)
+        self.max_iter = kwargs.get('max_iter', self.max_iter)
+        self.iter_tol = kwargs.get('iter_tol', self.iter_tol)
+        self.iter_psi_tol = kwargs.get('iter_psi_tol', self.iter_psi_tol)
+        self.output_backend = kwargs.get('output_backend', self.output_backend)
+        self.output_buffer = kwargs.get('output_buffer', self.output_buffer)
+        self.output_dtype = kwargs.get('output_dtype', self.output_dtype)
+        self.output_complevel = kwargs.get('output_complevel', self.output_complevel)
+        self.output_vars = kwargs.get('output_vars', self.output_vars)
+        self.output_depths = kwargs.get('output_depths', self.output_depths)
+        self.output_zones = kwargs.get('output_zones', self.output_zones)
+        self.output_every = int(kwargs.get('output_every', self.output_every))
+        self.output_aggregate = kwargs.get('output_aggregate', self.output_aggregate)
+        for name in self.output_vars:
+            if name not in RICHARDS_1D.output_vars:
+                raise ValueError('The output_vars should be among %s'%', '.join(RICHARDS_1D.output_vars))
+        if self.output_depths is not None and self.output_zones is not None:
+            raise ValueError('Only one of the output_depths and output_zones should be given')
+        if self.output_every < 1:
+            raise ValueError('The output_every should be at least 1')
+        if self.output_aggregate not in ['sample', 'mean']:
+            raise ValueError("The output_aggregate should be either 'sample' or 'mean'")
+        self.kmid = kwargs.get('kmid', self.kmid)
+        self.infil_depth = kwargs.get('infil_depth', self.infil_depth)
+        self.dz_input = kwargs.get('dz', None)
+        self.checkpoint_file = kwargs.get('checkpoint_file', self.checkpoint_file)
+        self.checkpoint_every = kwargs.get('checkpoint_every', self.checkpoint_every)
+        self.restart_file = kwargs.get('restart_file', None)
+        self.initial_state = kwargs.get('initial_state', None)
+        if self.restart_file is not None and self.initial_state is not None:
+            raise ValueError('Only one of the restart_file and initial_state should be given')
+        self.spinup_days = kwargs.get('spinup_days', self.spinup_days)
+        self.spinup_start = kwargs.get('spinup_start', self.spinup_start)
+        self.spinup_tol = kwargs.get('spinup_tol', self.spinup_tol)
+        self.spinup_max_cycles = kwargs.get('spinup_max_cycles', self.spinup_max_cycles)
+        if self.solver not in ['loop', 'vectorized', 'picard', 'newton']:
+            raise ValueError("The solver should be one of 'loop', 'vectorized', "
+                             "'picard' or 'newton'")
+        if self.dt_control == 'iterative' and self.solver not in ['picard', 'newton']:
+            raise ValueError("The dt_control 'iterative' needs the solver "
+                             "'picard' or 'newton'")
+        if self.kmid not in ['arithmetic', 'harmonic']:
+            raise ValueError("The kmid should be either 'arithmetic' or 'harmonic'")
+        self.vg_table = kwargs.get('vg_table', self.vg_table)
+        self.vg_tol = kwargs.get('vg_tol', self.vg_tol)
+        self.vg_cache_size = kwargs.get('vg_cache_size', self.vg_cache_size)
+        if self.vg_table and self.solver not in ['loop', 'vectorized']:
+            raise ValueError("The vg_table needs the solver 'loop' or 'vectorized'")
+        self.profile = kwargs.get('profile', self.profile)
+        self.profile_output = kwargs.get('profile_output', self.profile_output)
+        if self.profile:
+            self.profiler = Profiler()
+            self.profiler.attach(self, self.profile_phases)
+
+    def run(self):
+        """
+        run the model over all the remaining time steps
+        """
+        for state in self.steps():
+            pass
+
+    def steps(self, n=None):
+        """
+        generator advancing the model by one time step at each iteration
+        the output file is closed after the last time step
+        
+        Input:
+            n: no. of time steps, by default all the remaining time steps
+        Output:
+            state: dict with the time step (t), year, doy, soil moisture 
+            at the end of the time step (theta), rain, aet, recharge and
+            runoff (L) over the time step, no. of sub-steps (n_sub), no. of
+            solutions of the linear system (n_iter), and the mass balance 
+            error (mb_err, L) over the time step
+        """
+        t_end = self.max_t if n is None else min(self.t+n, self.max_t)
+        while self.t < t_end:
             # get forcing data at current time step
             self._get_forcing()
 
             # call the unsat module
             self._unsat()
+            
+            state = {'t':self.t, 'year':self.cur_year, 'doy':self.cur_doy, 
+                     'theta':1.0*self.theta, 'rain':self.rain[self.t], 
+                     'aet':self.aet_day, 'recharge':self.recharge_day, 
+                     'runoff':self.runoff_day, 'n_sub':self.iter_dt,
+                     'n_iter':self.n_iter_day, 'mb_err':self.mb_err_day}
+            self.t += 1
+            self._checkpoint()
+            if self.t == self.max_t:
+                self.close()
+            yield state
 
-        self.nc_file.close()  # close the output file
+    def step(self, n=1):
+        """
+        advance the model by n time steps
+        
+        Output:
+            state: the state after the last time step, see steps
+        """
+        state = None
+        for state in self.steps(n):
+            pass
+        return state
+
+    def close(self):
+        """
+        close the output file
+        """
+        if self.nc_file is not None:
+            self._write_profile()
+            self.nc_file.close()
+            self.nc_file = None
+    
+    def save_checkpoint(self, fname=None):
+        """
+        save the state of the model, given by the attributes listed in 
+        checkpoint_vars, and of the random number generator
+        the buffered output is written first, so that the output file is 
+        complete up to the checkpoint
+        
+        Input:
+            fname: name of the checkpoint file, by default checkpoint_file
+        """
+        if fname is None:
+            fname = self.checkpoint_file
+        if fname is None:
+            raise ValueError('The name of the checkpoint file is not given')
+        if self.nc_file is not None:
+            self.nc_file.flush()
+        save_checkpoint(fname, self, self.checkpoint_vars)
+    
+    def _checkpoint(self):
+        """
+        save the checkpoint when it is due
+        """
+        if self.checkpoint_file is None:
+            return
+        if self.t == self.max_t or (self.checkpoint_every > 0 and 
+                                    self.t%self.checkpoint_every == 0):
+            self.save_checkpoint()
+    
+    def _load_state(self):
+        """
+        set the state from the restart_file, or from the initial_state 
+        in which case the time step is not changed
+        """
+        if self.restart_file is not None:
+            fname = self.restart_file
+            names = self.checkpoint_vars
+        elif self.initial_state is not None:
+            fname = self.initial_state
+            names = [name for name in self.checkpoint_vars if name != 't']
+        else:
+            return
+        arrays = [name for name in names 
+                  if isinstance(getattr(self, name, None), np.ndarray)]
+        shape = [np.shape(getattr(self, name)) for name in arrays]
+        load_checkpoint(fname, self, names)
+        if shape != [np.shape(getattr(self, name)) for name in arrays]:
+            raise ValueError('The state in %s does not match the model'%fname)
+        self.t = int(self.t)
+        if self.t > self.max_t:
+            raise ValueError('The time step of %s is after the end of the run'%fname)
+    
+    def _set_input(self, **kwargs):
+        """
+        set the forcing and parameters given as arrays, instead of reading
+        them from the input file
+        """
+        for key in ['rain', 'pet', 'soil_par', 'dz', 'theta_0']:
+            if key not in kwargs:
+                raise ValueError('%s should be given when there is no input_file'%key)
+        
+        self._set_grid(kwargs['dz'], kwargs.get('no_layer', None))
+        self.dt_flux = kwargs.get('dt_flux', 86400.0)
+        
+        rain = np.asarray(kwargs['rain'], dtype=float)
+        pet = np.asarray(kwargs['pet'], dtype=float)
+        if rain.shape != pet.shape:
+            raise ValueError('The rain and pet should be of the same length')
+        self.final_time = len(rain)*self.dt_flux
+        year = kwargs.get('year', np.zeros(len(rain)))
+        doy = kwargs.get('doy', np.arange(1, len(rain)+1))
+        self.forcing_units = {'rain':'m', 'pet':'m'}
+        self.forcing_units.update(kwargs.get('forcing_units', {}))
+        self._set_forcing(np.asarray(year, dtype=float), 
+                          np.asarray(doy, dtype=float), rain, pet)
+        
+        soil_par = dict(kwargs['soil_par'])
+        soil_par['m'] = 1-1/soil_par['n']
+        self.soil_par = soil_par
+        
+        self.theta = np.zeros(self.no_layer) + kwargs['theta_0']
+        self.ofile_name = kwargs.get('ofile_name', None)
 
 
     def _read_input(self, **kwargs):
@@ -107,6 +518,13 @@ class RICHARDS_1D():
         output_message = 'Input data reading completed successfully'
         self._colored_output(output_message, 32)
 
+    def _sheet(self, sheet_name):
+        """
+        get the sheet of the input file
+        the workbook is parsed only once, see ambhas.xls.open_input
+        """
+        return open_input(self.input_file).sheet_by_name(sheet_name)
+
     def _check_sheets(self, check_sheets, check_file):
         """
         This functions check if all the sheets needed to model are present  
@@ -114,7 +532,7 @@ class RICHARDS_1D():
         
         """
         # open the xls file and get its sheets
-        foo = xlrd.open_workbook(check_file)
+        foo = open_input(check_file)
         check_sheet_names = foo.sheet_names()
         
         for check_sheet in check_sheets:
@@ -129,12 +547,11 @@ class RICHARDS_1D():
         legend stores the information about the indices of other properties,
         which would be used by all other properties reading functions
         """
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('ind')
+        sheet = self._sheet('ind')
         # does not read the first line of the xls file
         ind = {}
-        for i in range(sheet.nrows-1):
-            ind[str(sheet.cell_value(i+1,0))] = int(sheet.cell_value(i+1,1))
+        for key, value in zip(sheet.col_values(0,1), sheet.col_values(1,1)):
+            ind[str(key)] = int(value)
                 
         self.ind = ind
 
@@ -142,22 +559,81 @@ class RICHARDS_1D():
         """
         Read the spatial info
         """
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('spatial_info')
+        sheet = self._sheet('spatial_info')
         # get the row number from the ind
         j = self.ind['spatial_info']
         no_layer = int(sheet.cell_value(j,1))
         dz = sheet.cell_value(j,2)
-                
-        self.no_layer = no_layer
-        self.dz = dz
+        
+        if self.dz_input is None:
+            self._set_grid(dz, no_layer)
+        else:
+            self._set_grid(self.dz_input)
+    
+    def _set_grid(self, dz, no_layer=None):
+        """
+        set the vertical grid
+        
+        Input:
+            dz: thickness of the layers, scalar for the uniform grid, or one
+            per layer for a non-uniform grid
+            no_layer: no. of layers, needed for the uniform grid
+        """
+        if np.ndim(dz) == 0:
+            if no_layer is None:
+                raise ValueError('no_layer should be given for the uniform grid')
+            self.no_layer = int(no_layer)
+            self.dz = dz
+            self.dz_layer = np.tile(dz, self.no_layer)
+        else:
+            dz = np.asarray(dz, dtype=float)
+            if no_layer is not None and int(no_layer) != len(dz):
+                raise ValueError('The no_layer does not match the length of dz')
+            if np.any(dz<=0):
+                raise ValueError('The thickness of the layers should be positive')
+            if self._step_solver() == 'loop':
+                raise ValueError("The non-uniform grid is not supported by the solver 'loop'")
+            self.no_layer = len(dz)
+            self.dz = dz
+            self.dz_layer = dz
+        
+        # distance between the nodes at the interfaces, infinite at the 
+        # top and bottom where the flux does not depend on the gradient
+        dz = self.dz_layer
+        dz_node = np.empty(self.no_layer+1)
+        dz_node[1:-1] = 0.5*(dz[1:]+dz[:-1])
+        dz_node[[0,-1]] = np.inf
+        self.dz_node = dz_node
+        self.coef_up = 1/(dz*dz_node[:-1])
+        self.coef_down = 1/(dz*dz_node[1:])
+        # weight of the upper layer in the conductivity at the 
+        # interfaces, interpolated linearly between the nodes
+        self.w_kmid = dz[1:]/(dz[1:]+dz[:-1])
+        
+        if self.kmid != 'arithmetic' and self._step_solver() == 'loop':
+            raise ValueError("The kmid '%s' is not supported by the solver 'loop'"%self.kmid)
+        
+        # depth of the nodes, and layers controlling the infiltration
+        self.z_node = self.dz_layer.cumsum()-self.dz_layer/2
+        if self.infil_depth is None and np.ndim(self.dz) == 0:
+            self.n_infil = min(10, self.no_layer)
+            self.w_infil = None
+        else:
+            infil_depth = 0.5 if self.infil_depth is None else self.infil_depth
+            self.n_infil = max(1, int(np.sum(self.z_node<infil_depth)))
+            self.w_infil = self.dz_layer[:self.n_infil]/self.dz_layer[:self.n_infil].sum()
+    
+    def _step_solver(self):
+        """
+        the solver used for the sub-steps
+        """
+        return self.solver
     
     def _read_temporal(self):
         """
         Read the temporal info
         """
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('temporal_info')
+        sheet = self._sheet('temporal_info')
         #get the row number from the ind
         j = self.ind['temporal_info']
         dt = sheet.cell_value(j,1)
@@ -171,13 +647,12 @@ class RICHARDS_1D():
         """
         read the units of the forcing data
         """
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('units')
+        sheet = self._sheet('units')
         #get the row number from the ind
         j = self.ind['units']
         forcing_units = {}
-        for i in range(sheet.ncols-1):
-            forcing_units[str(sheet.cell_value(0,i+1))] = str(sheet.cell_value(j,i+1))
+        for key, value in zip(sheet.row_values(0,1), sheet.row_values(j,1)):
+            forcing_units[str(key)] = str(value)
         self.forcing_units = forcing_units
     
     def _read_initial_condition(self):
@@ -187,8 +662,7 @@ class RICHARDS_1D():
         #get the row number from the ind
         j = self.ind['initial_condition']
         
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('initial_condition')
+        sheet = self._sheet('initial_condition')
         theta_0 = sheet.cell_value(j,1)
         self.theta = np.tile(theta_0,self.no_layer)
         
@@ -199,8 +673,7 @@ class RICHARDS_1D():
         #get the row number from the ind
         j = self.ind['soil_hyd_par']
         
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('soil_hyd_par')
+        sheet = self._sheet('soil_hyd_par')
         soil_par = {}
         soil_par['thetar'] = sheet.cell_value(j,1)
         soil_par['thetas'] = sheet.cell_value(j,2)
@@ -218,22 +691,27 @@ class RICHARDS_1D():
         """
         read the forcing data from xls file
         """
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('forcing')
+        sheet = self._sheet('forcing')
         
-        data_len = sheet.nrows-1
-        year = np.zeros(data_len)
-        doy = np.zeros(data_len)
-        rain = np.zeros(data_len)
-        pet = np.zeros(data_len)
-            
-        for i in xrange(data_len):
-            year[i] = sheet.cell_value(i+1,0)
-            doy[i] = sheet.cell_value(i+1,1)
-            rain[i] = sheet.cell_value(i+1,2)
-            pet[i] = sheet.cell_value(i+1,3)
-                    
+        year = col_array(sheet, 0)
+        doy = col_array(sheet, 1)
+        rain = col_array(sheet, 2)
+        pet = col_array(sheet, 3)
+        self._set_forcing(year, doy, rain, pet)
+    
+    def _read_measured(self):
+        """
+        read the measured surface soil moisture (ssm) data
+        """
+        sheet = self._sheet('forcing')
         
+        j = self.ind['meas_sm']
+        self.meas_ssm = col_array(sheet, 3+j)
+    
+    def _set_forcing(self, year, doy, rain, pet):
+        """
+        set the forcing, rain and pet are converted into m
+        """
         self.year = year
         self.doy = doy
         
@@ -258,8 +736,7 @@ class RICHARDS_1D():
         """
         read the forcing data from xls file
         """
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('output_par')
+        sheet = self._sheet('output_par')
         j = self.ind['output_par']
         self.ofile_name = str(sheet.cell_value(j, 1))
 
@@ -349,6 +826,26 @@ class RICHARDS_1D():
 
         return kr
     
+    def _constitutive(self, theta, thetar, thetas, alpha, m, n, l, Ks):
+        """
+        conductivity, specific moisture capacity and pressure head at theta
+        with vg_table, the table of the parameter set is looked up in the 
+        cache only when the parameters are not the same objects as in the
+        previous call
+        """
+        if self.vg_table:
+            par = (thetar, thetas, alpha, m, n, l, Ks)
+            if self.vg_last is None or any(
+                    a is not b for a, b in zip(par, self.vg_last[0])):
+                if self.vg_cache is None:
+                    self.vg_cache = VGTableCache(self.vg_cache_size, tol=self.vg_tol)
+                self.vg_last = par, self.vg_cache.get(*par)
+            return self.vg_last[1](theta)
+        K = self.theta2kr(theta,thetar,thetas,m,l,Ks)
+        smc = self.smcf(theta,thetar,thetas,alpha,m,n)
+        psi = self.theta2psi(theta,thetar,thetas,m,n,alpha)
+        return K, smc, psi
+    
     def _infiltration(self, theta, thetas, precipitation):
         """
         computes infiltration
@@ -356,7 +853,221 @@ class RICHARDS_1D():
         Use of the Richards equation in land surface parameterizations
         """
         
-        return precipitation*(1-np.mean(theta[:10])/thetas)
+        return precipitation*(1-self._top_theta(theta)/thetas)
+    
+    def _top_theta(self, theta):
+        """
+        mean soil moisture of the layers controlling the infiltration, 
+        along the last axis of theta
+        """
+        if self.w_infil is None:
+            return theta[...,:self.n_infil].mean(axis=-1)
+        else:
+            return np.dot(theta[...,:self.n_infil], self.w_infil)
+
+    def _top_boundary(self, theta):
+        """
+        flux at the top boundary
+        
+        Output:
+            aet: actual evapotranspiration (L/T)
+            Bvalue: flux entering the soil at the top (L/T)
+            runoff: infiltration excess runoff (L/T)
+        """
+        smi = (self.theta[0]-self.soil_par['evap_0'])/(self.soil_par['evap_1']-self.soil_par['evap_0'])
+        if smi<0: smi=0
+        if smi>1: smi=1
+        aet = smi*self.pet_cur
+        net_rain = self.rain_cur-aet
+        if net_rain>0:
+            Bvalue = self._infiltration(theta, self.soil_par['thetas'], net_rain)
+        else:
+            Bvalue = net_rain
+        return aet, Bvalue, net_rain-Bvalue
+    
+    def _advance_day(self, theta):
+        """
+        advance the soil moisture over one time step of the forcing 
+        (dt_flux) using sub-steps
+        
+        dt_control = 'fixed': the no. of sub-steps is given by the rainfall
+        dt_control = 'adaptive': the length of the sub-steps is controlled
+        by the local error in the soil moisture, estimated by step doubling,
+        and the mass balance error. Sub-steps which exceed theta_tol or 
+        mb_tol are rejected and repeated with a shorter length. The length
+        is carried over to the next time step, so that it grows during the
+        dry spells and shrinks during the storms.
+        dt_control = 'iterative': the length of the sub-steps is controlled
+        by the no. of iterations of the solvers 'picard' and 'newton'. It 
+        grows when the iterations converge quickly (up to dt_max), shrinks
+        when they converge slowly, and the sub-steps which do not converge 
+        are repeated with a third of the length. The sub-steps which do not
+        converge at dt_min are accepted, and counted in n_nonconv.
+        With the solvers 'picard' and 'newton', n_nonconv also counts the 
+        sub-steps of the 'fixed' and 'adaptive' control whose iterations 
+        did not converge.
+        
+        Output:
+            theta: soil moisture at the end of the time step
+            aet_day: actual evapotranspiration (L)
+            recharge_day: recharge (L)
+        """
+        thetar = self.soil_par['thetar']
+        thetas = self.soil_par['thetas']
+        alpha = self.soil_par['alpha']
+        n = self.soil_par['n']
+        m = self.soil_par['m']
+        l = self.soil_par['l']
+        Ks = self.soil_par['Ks']
+        
+        recharge_day = 0
+        aet_day = 0
+        runoff_day = 0
+        infil_day = 0
+        storage = np.sum(theta*self.dz_layer)
+        self.n_iter_day = 0
+        
+        if self.dt_control == 'fixed':
+            iter_dt = max(24,int(np.ceil(self.rain_cur*self.dt_flux*1000/0.15)))
+            self.iter_dt = int(max(iter_dt,0.75*self.iter_dt))
+            dt = self.dt_flux/self.iter_dt
+            
+            for i in range(self.iter_dt):
+                aet, Bvalue, runoff = self._top_boundary(theta)
+                theta, J = self._richards_step(theta, Bvalue, dt, thetar, 
+                                               thetas, alpha, m, n, l, Ks)
+                aet_day += aet*dt 
+                recharge_day += J[-1]*dt
+                runoff_day += runoff*dt
+                infil_day += J[0]*dt
+                self.n_iter_day += self.n_iter
+                if not self.converged:
+                    self.n_nonconv += 1
+            
+            if np.any(np.isnan(theta)):
+                raise ValueError('The soil moisture became nan at the time step %d'%self.t)
+        
+        elif self.dt_control == 'adaptive':
+            self.iter_dt = 0
+            self.n_reject = 0
+            elapsed = 0.0
+            while elapsed < self.dt_flux:
+                dt = min(self.dt_sub, self.dt_flux-elapsed)
+                aet, Bvalue, runoff = self._top_boundary(theta)
+                
+                # the local error is estimated by comparing one full 
+                # sub-step with two half sub-steps
+                theta_a, J = self._richards_step(theta, Bvalue, dt, thetar, 
+                                                 thetas, alpha, m, n, l, Ks)
+                n_iter, converged = self.n_iter, self.converged
+                theta_h, J_h = self._richards_step(theta, Bvalue, 0.5*dt, thetar, 
+                                                   thetas, alpha, m, n, l, Ks)
+                n_iter, converged = n_iter+self.n_iter, converged and self.converged
+                aet_h, Bvalue_h, runoff_h = self._top_boundary(theta_h)
+                theta_1, J_1 = self._richards_step(theta_h, Bvalue_h, 0.5*dt, thetar, 
+                                                   thetas, alpha, m, n, l, Ks)
+                n_iter, converged = n_iter+self.n_iter, converged and self.converged
+                self.n_iter_day += n_iter
+                theta_err = np.abs(theta_1-theta_a).max()
+                
+                # mass balance error, which comes from the clipping of 
+                # the soil moisture
+                mb_err = abs(np.sum((theta_1-theta)*self.dz) 
+                             - 0.5*(J_h[0]-J_h[-1]+J_1[0]-J_1[-1])*dt)
+                
+                if np.isfinite(theta_err) and np.isfinite(mb_err):
+                    # the local error of the scheme is of second order in dt
+                    factor = 0.9*np.sqrt(min(self.theta_tol/max(theta_err, 1e-20), 
+                                             self.mb_tol/max(mb_err, 1e-20)))
+                else:
+                    factor = 0.25
+                
+                if factor < 0.9 and dt > self.dt_min:
+                    # reject the sub-step and repeat it with shorter length
+                    self.n_reject += 1
+                    self.dt_sub = max(self.dt_min, dt*max(factor, 0.1))
+                    continue
+                elif not np.isfinite(theta_err):
+                    raise ValueError('The soil moisture became nan at the time step %d'%self.t)
+                elif not converged:
+                    self.n_nonconv += 1
+                
+                # the last sub-step of the time step may be shortened, 
+                # which should not change the length of next sub-steps
+                if dt == self.dt_sub:
+                    self.dt_sub = max(self.dt_min, min(self.dt_flux, dt*min(factor, 2.0)))
+                
+                theta = theta_1
+                elapsed += dt
+                self.iter_dt += 2
+                aet_day += 0.5*(aet+aet_h)*dt 
+                recharge_day += 0.5*(J_h[-1]+J_1[-1])*dt
+                runoff_day += 0.5*(runoff+runoff_h)*dt
+                infil_day += 0.5*(J_h[0]+J_1[0])*dt
+        
+        elif self.dt_control == 'iterative':
+            dt_max = self.dt_flux if self.dt_max is None else self.dt_max
+            self.iter_dt = 0
+            self.n_reject = 0
+            elapsed = 0.0
+            while elapsed < self.dt_flux:
+                dt = min(self.dt_sub, self.dt_flux-elapsed)
+                aet, Bvalue, runoff = self._top_boundary(theta)
+                theta_1, J = self._richards_step(theta, Bvalue, dt, thetar, 
+                                                 thetas, alpha, m, n, l, Ks)
+                self.n_iter_day += self.n_iter
+                
+                if not self.converged and dt > self.dt_min:
+                    # repeat the sub-step with shorter length
+                    self.n_reject += 1
+                    self.dt_sub = max(self.dt_min, dt/3)
+                    continue
+                elif np.any(np.isnan(theta_1)):
+                    raise ValueError('The soil moisture became nan at the time step %d'%self.t)
+                elif not self.converged:
+                    self.n_nonconv += 1
+                
+                # length of the next sub-step, the thresholds on the no. of 
+                # iterations are the ones used in HYDRUS
+                if dt == self.dt_sub:
+                    if self.n_iter <= 3:
+                        self.dt_sub = min(dt_max, 1.3*dt)
+                    elif self.n_iter >= 7:
+                        self.dt_sub = max(self.dt_min, 0.7*dt)
+                
+                theta = theta_1
+                elapsed += dt
+                self.iter_dt += 1
+                aet_day += aet*dt 
+                recharge_day += J[-1]*dt
+                runoff_day += runoff*dt
+                infil_day += J[0]*dt
+        
+        else:
+            raise ValueError("The dt_control should be one of 'fixed', "
+                             "'adaptive' or 'iterative'")
+        
+        self.runoff_day = runoff_day
+        self.mb_err_day = np.sum(theta*self.dz_layer)-storage-(infil_day-recharge_day)
+        if self.profiler is not None:
+            self.profiler.record('n_sub', self.iter_dt)
+        return theta, aet_day, recharge_day
+
+    def _open_output(self):
+        """
+        open the netcdf output file, the values written at each time step
+        are buffered and written in blocks of output_buffer time steps
+        """
+        if self.restart_file is not None:
+            if self.t%self.output_every != 0:
+                raise ValueError('The run should be restarted at the end of an output period')
+            mode, t_start = 'a', self.t//self.output_every
+        else:
+            mode, t_start = 'w', 0
+        return NCOutput(self.ofile_name, backend=self.output_backend,
+                        buffer_size=self.output_buffer, dtype=self.output_dtype,
+                        complevel=self.output_complevel, mode=mode, 
+                        t_start=t_start)
 
     def initialize(self):
         """
@@ -366,49 +1077,129 @@ class RICHARDS_1D():
         max_t = int(self.final_time/self.dt_flux)
         #max_t = 56
         self.max_t = max_t
+        self.t = 0
         self.iter_dt = 1
-                        
+        self.dt_sub = self.dt_flux/24
+        self.n_iter_day = None
+        self.mb_err_day = None
+        self.n_nonconv = 0
+        self.nc_file = None
+        self._load_state()
+        if self.spinup_days is not None and self.restart_file is None:
+            self.spinup()
+        if self.ofile_name is not None:
+            self._init_output()
+    
+    def spinup(self):
+        """
+        spin up the state by cycling the forcing of the window of 
+        spinup_days time steps starting at spinup_start, until the change 
+        of the state between the ends of two cycles is less than spinup_tol
+        the run then starts from the spun-up state at the first time step
+        
+        Output:
+            converged: True if the tolerance was met
+        the no. of cycles and the change after each cycle are kept in 
+        spinup_cycles and spinup_change
+        """
+        start = self.spinup_start
+        end = start+self.spinup_days
+        if start < 0 or self.spinup_days < 1 or end > len(self.rain):
+            raise ValueError('The spin-up window should be within the forcing')
+        
+        converged = False
+        self.spinup_change = []
+        state = 1.0*self.theta
+        for cycle in range(self.spinup_max_cycles):
+            for t in range(start, end):
+                self.t = t
+                self._get_forcing()
+                self._spinup_step()
+            change = float(np.abs(self.theta-state).max())
+            self.spinup_change.append(change)
+            state = 1.0*self.theta
+            if np.isnan(change):
+                raise ValueError('The soil moisture became nan during the spin-up')
+            if change < self.spinup_tol:
+                converged = True
+                break
+        self.spinup_cycles = cycle+1
+        self.t = 0
+        
+        if converged:
+            output_message = 'Spin-up converged after %d cycles'%self.spinup_cycles
+            self._colored_output(output_message, 32)
+        else:
+            output_message = 'Spin-up did not converge after %d cycles, the change is %g'%(
+                             self.spinup_cycles, change)
+            self._colored_output(output_message, 31)
+        return converged
+    
+    def _spinup_step(self):
+        """
+        advance the state by one time step of the spin-up, without output
+        """
+        self.theta = self._advance_day(1.0*self.theta)[0]
+    
+    def _init_output(self):
+        """
+        open the netcdf file for writting
+        """
         # open file for writing
-        file = nc.NetCDFFile(self.ofile_name, 'w')
-        setattr(file, 'title', 'output of the model ambhas.richards')
+        file = self._open_output()
+        file.setncattr('title', 'output of the model ambhas.richards')
         now = datetime.datetime.now()
-        setattr(file, 'description', 'The model was run at %s'%(now.ctime()))
-        file.createDimension('depth', self.no_layer)
-        file.createDimension('time', self.max_t+1)
-        
-        # depth
-        varDims = 'depth',
-        depth = file.createVariable('depth', 'd', varDims)
-        depth.units = 'm'
-        depth[:] = np.tile(self.dz,self.no_layer).cumsum()-self.dz/2
+        file.setncattr('description', 'The model was run at %s'%(now.ctime()))
+        n_out = -(-self.max_t//self.output_every)
+        file.createDimension('time', n_out+1)
+        if self.output_every > 1:
+            file.setncattr('output_every', self.output_every)
+            file.setncattr('output_aggregate', self.output_aggregate)
+        
+        # depth, or zones
+        self._init_output_weight()
+        if self.output_zones is None:
+            file.createDimension('depth', len(self.output_z))
+            varDims = 'depth',
+            depth = file.createVariable('depth', varDims, units='m')
+            depth[:] = self.output_z
+        else:
+            file.createDimension('zone', len(self.output_zones))
+            varDims = 'zone',
+            zone_top = file.createVariable('zone_top', varDims, units='m')
+            zone_bottom = file.createVariable('zone_bottom', varDims, units='m')
+            zone_top[:] = [zone[0] for zone in self.output_zones]
+            zone_bottom[:] = [zone[1] for zone in self.output_zones]
         
         # time (year and doy)
         varDims = 'time',
-        self.nc_year = file.createVariable('year', 'd', varDims)
-        self.nc_doy = file.createVariable('doy', 'd', varDims)
+        self.nc_year = file.createVariable('year', varDims)
+        self.nc_doy = file.createVariable('doy', varDims)
         
         # soil moisture
-        varDims = 'depth','time'
-        self.nc_sm = file.createVariable('sm','d', varDims)
-        self.nc_sm.units = 'v/v'
-        self.nc_sm[:,0] = self.theta
-        
-        # rainfall, recharge and aet
+        self.nc_out = {}
+        if 'sm' in self.output_vars:
+            varDims = ('depth' if self.output_zones is None else 'zone'), 'time'
+            self.nc_out['sm'] = file.createVariable('sm', varDims, units='v/v')
+            self.nc_out['sm'].put(0, self._output_sm())
+        
+        # rainfall, recharge and aet, no. of solutions of the linear system 
+        # and mass balance error
         varDims = 'time',
-        self.nc_rain = file.createVariable('rain','d',varDims)
-        self.nc_rain.units = 'mm'
-        self.nc_aet = file.createVariable('aet','d',varDims)
-        self.nc_aet.units = 'mm'
-        self.nc_recharge = file.createVariable('recharge','d',varDims)
-        self.nc_recharge.units = 'mm'
+        units = {'rain':'mm', 'aet':'mm', 'recharge':'mm', 'n_iter':None,
+                 'mb_err':'m'}
+        for name in ['rain', 'aet', 'recharge', 'n_iter', 'mb_err']:
+            if name in self.output_vars:
+                self.nc_out[name] = file.createVariable(name, varDims, units=units[name])
+        self.output_sum = None
         
         # soil_par
-        setattr(file, 'thetar', self.soil_par['thetar'])
-        setattr(file, 'thetas', self.soil_par['thetas'])
-        setattr(file, 'alpha', self.soil_par['alpha'])
-        setattr(file, 'n', self.soil_par['n'])
-        setattr(file, 'Ks', self.soil_par['Ks'])
-        setattr(file, 'l', self.soil_par['l'])        
+        file.setncattr('thetar', self.soil_par['thetar'])
+        file.setncattr('thetas', self.soil_par['thetas'])
+        file.setncattr('alpha', self.soil_par['alpha'])
+        file.setncattr('n', self.soil_par['n'])
+        file.setncattr('Ks', self.soil_par['Ks'])
+        file.setncattr('l', self.soil_par['l'])        
         
         self.nc_file = file
                 
@@ -418,126 +1209,14 @@ class RICHARDS_1D():
         top boundary: atmoshpheric
         bottom boundary: gravity drainage
         """
-               
-        thetar = self.soil_par['thetar']
-        thetas = self.soil_par['thetas']
-        alpha = self.soil_par['alpha']
-        n = self.soil_par['n']
-        m = self.soil_par['m']
-        l = self.soil_par['l']
-        Ks = self.soil_par['Ks']
-        nz = self.no_layer
-
-        theta = 1.0*self.theta
-
-        #delta_theta = (np.abs(flux)).max()
-
-        iter_dt = max(24,int(np.ceil(self.rain_cur*self.dt_flux*1000/0.15)))
-        self.iter_dt = int(max(iter_dt,0.75*self.iter_dt))
-
-        recharge_day = 0
-        aet_day = 0
-        runoff_day = 0
-
-        # check for time step
-        for i in range(self.iter_dt):
-            dt = self.dt_flux/self.iter_dt
-            # top boundary value
-            smi = (self.theta[0]-self.soil_par['evap_0'])/(self.soil_par['evap_1']-self.soil_par['evap_0'])
-            if smi<0: smi=0
-            if smi>1: smi=1
-            aet = smi*self.pet_cur
-            net_rain = self.rain_cur-aet
-            if net_rain>0:
-                Bvalue = self._infiltration(theta, thetas, net_rain)
-                runoff_day += (net_rain - Bvalue)*dt
-            else:
-                Bvalue = net_rain
-            
-            K = self.theta2kr(theta,thetar,thetas,m,l,Ks)
-            smc = self.smcf(theta,thetar,thetas,alpha,m,n)
-            psi = self.theta2psi(theta,thetar,thetas,m,n,alpha)
-
-            #flux boundary condition at the top
-            Kmid = np.empty(nz+1)
-            Kmid[0] = 0
-            for i in range(1,nz):
-                Kmid[i] = 0.5*(K[i]+K[i-1])
-            Kmid[nz] = K[nz-1]
-
-            #Setting the coefficient for the internal nodes
-            A = np.empty(nz)
-            B = np.empty(nz)
-            C = np.empty(nz)
-            D = np.empty(nz)
-            dz = self.dz
-            dz2 = dz**2
-            
-            for i in range(nz):
-                A[i] = -(Kmid[i]/dz2)
-                B[i] = smc[i]/dt+(Kmid[i+1]+Kmid[i])/dz2
-                C[i] = A[i]
-                D[i] = smc[i]*psi[i]/dt-(Kmid[i+1]-Kmid[i])/dz
-            # setting the coefficient for the top bc (flux boundary)
-            i = 0
-            A[0] = 0
-            B[0] = smc[i]/dt+(Kmid[1])/dz2
-            D[0] = smc[i]*psi[i]/dt+(Bvalue-Kmid[1])/dz
-
-            # setting the coefficient for the bottom bc: gravity drainage
-            B[nz-1] = smc[nz-1]/dt+(Kmid[nz])/dz2
-            C[nz-1] = 0
-            D[nz-1] = smc[nz-1]*psi[nz-1]/dt-(Kmid[nz]-Kmid[nz-1])/dz
-
-            # Solving using the thomas algorithm
-            beta = np.empty(nz)
-            gamma = np.empty(nz)
-            u = np.empty(nz)
-            beta[0] = B[0]
-            gamma[0] = D[0]/beta[0]
-
-            for i in range(1,nz):
-                beta[i] = B[i]-(A[i]*C[i-1])/(beta[i-1])
-                gamma[i] = (D[i]-A[i]*gamma[i-1])/(beta[i])
-
-            u[nz-1] = gamma[nz-1]
-            for i in range(nz-2,-1,-1):
-                u[i] = gamma[i]-(C[i]*u[i+1])/beta[i]
-            #if np.any(np.isnan(u)):
-            #    print('a')
-            # flux computation between nodes
-            J = np.empty(nz+1)
-            for i in range(1,nz):
-                J[i] = Kmid[i]*(1-(u[i]-u[i-1])/dz)
-            J[0] = Bvalue
-            J[nz] = Kmid[nz]
-
-            J[nz] = J[nz]
-
-            # flux updating
-            flux = np.diff(J)*dt/dz
-            theta = theta - flux
-
-            theta[theta>thetas] = 0.99*thetas
-            theta[theta<thetar] = 1.01*thetar
-
-            aet_day += aet*dt 
-            recharge_day += J[nz]*dt
-
-                            
+        theta, aet_day, recharge_day = self._advance_day(1.0*self.theta)
         self.theta = theta
-
-
-        if np.any(np.isnan(theta)):
-            sys.exit("nan coming")
+        self.aet_day = aet_day
+        self.recharge_day = recharge_day
         
         # write the output
-        self.nc_year[self.t] = (self.cur_year)
-        self.nc_doy[self.t] = (self.cur_doy)
-        self.nc_sm[:,self.t+1] = theta
-        self.nc_recharge[self.t] = recharge_day
-        self.nc_aet[self.t] = aet_day
-        self.nc_rain[self.t] = self.rain_cur
+        if self.nc_file is not None:
+            self._write_output()
         
         # print progress
         if self.t == int(0.25*self.max_t):
@@ -557,6 +1236,418 @@ class RICHARDS_1D():
             self._colored_output(output_message, 32)
         #print self.t
 
+    def _init_output_weight(self):
+        """
+        weight of the layers for the soil moisture written in the output, 
+        (n_out, nz), None when all the layers are written
+        """
+        if self.output_depths is not None:
+            depths = np.atleast_1d(np.asarray(self.output_depths, dtype=float))
+            if depths.min() < 0 or depths.max() > self.dz_layer.sum():
+                raise ValueError('The output_depths should be within the soil column')
+            layer = np.abs(depths[:,np.newaxis]-self.z_node).argmin(axis=1)
+            self.output_weight = np.zeros((len(depths), self.no_layer))
+            self.output_weight[np.arange(len(depths)), layer] = 1.0
+            self.output_z = self.z_node[layer]
+        elif self.output_zones is not None:
+            bottom = self.dz_layer.cumsum()
+            top = bottom-self.dz_layer
+            self.output_weight = np.zeros((len(self.output_zones), self.no_layer))
+            for i, (zone_top, zone_bottom) in enumerate(self.output_zones):
+                overlap = np.minimum(bottom, zone_bottom)-np.maximum(top, zone_top)
+                overlap = np.maximum(overlap, 0)
+                if overlap.sum() <= 0:
+                    raise ValueError('The output zone (%g, %g) does not contain any layer'
+                                     %(zone_top, zone_bottom))
+                self.output_weight[i] = overlap/overlap.sum()
+            self.output_z = None
+        else:
+            self.output_weight = None
+            self.output_z = self.z_node
+    
+    def _output_sm(self):
+        """
+        soil moisture written in the output, at the selected layers or 
+        averaged over the zones
+        """
+        if self.output_weight is None:
+            return self.theta
+        return np.dot(self.output_weight, self.theta)
+    
+    def _write_output(self):
+        """
+        write the output of the current time step, or add it to the sums of
+        the output period when output_every is more than 1
+        """
+        values = {'rain':self.rain_cur, 'aet':self.aet_day, 
+                  'recharge':self.recharge_day, 'n_iter':self.n_iter_day, 
+                  'mb_err':self.mb_err_day}
+        if self.output_every == 1:
+            self.nc_year.put(self.t, self.cur_year)
+            self.nc_doy.put(self.t, self.cur_doy)
+            for name in self.nc_out:
+                if name == 'sm':
+                    self.nc_out[name].put(self.t+1, self._output_sm())
+                else:
+                    self.nc_out[name].put(self.t, values[name])
+            return
+        
+        k, i = divmod(self.t, self.output_every)
+        if i == 0:
+            self.nc_year.put(k, self.cur_year)
+            self.nc_doy.put(k, self.cur_doy)
+            self.output_sum = dict((name, 0.0) for name in self.nc_out)
+        for name in self.nc_out:
+            if name != 'sm':
+                self.output_sum[name] += np.nan if values[name] is None else values[name]
+            elif self.output_aggregate == 'mean':
+                self.output_sum[name] += self._output_sm()
+        if i == self.output_every-1 or self.t == self.max_t-1:
+            for name in self.nc_out:
+                if name != 'sm':
+                    self.nc_out[name].put(k, self.output_sum[name])
+                elif self.output_aggregate == 'mean':
+                    self.nc_out[name].put(k+1, self.output_sum[name]/(i+1))
+                else:
+                    self.nc_out[name].put(k+1, self._output_sm())
+    
+    def _write_profile(self):
+        """
+        write the profile as the attributes of the output file
+        """
+        if self.profiler is None or not self.profile_output:
+            return
+        for name, value in self.profiler.attributes().items():
+            self.nc_file.setncattr(name, value)
+    
+    def _richards_step(self, theta, Bvalue, dt, thetar, thetas, alpha, m, n, l, Ks):
+        """
+        solve the richards equation for one sub-step
+        the solver is selected by self.solver:
+            'loop': the node by node assembly and thomas algorithm
+            'vectorized': the numpy assembly and banded solver
+            'picard', 'newton': the iterations on the mixed form
+        the no. of solutions of the linear system is kept in self.n_iter, 
+        and self.converged tells whether the iterations converged
+        
+        Input:
+            theta: soil moisture at the start of the sub-step
+            Bvalue: flux at the top boundary (L/T)
+            dt: length of the sub-step
+            thetar, thetas, alpha, m, n, l, Ks: soil hydraulic parameters
+        Output:
+            theta: soil moisture at the end of the sub-step
+            J: flux at the nodes interfaces (L/T), J[-1] is the recharge
+        """
+        self.n_iter = 1
+        self.converged = True
+        if self.solver == 'loop':
+            return self._richards_step_loop(theta, Bvalue, dt, thetar, thetas,
+                                            alpha, m, n, l, Ks)
+        elif self.solver == 'vectorized':
+            return self._richards_step_vec(theta, Bvalue, dt, thetar, thetas,
+                                           alpha, m, n, l, Ks)
+        elif self.solver in ['picard', 'newton']:
+            return self._richards_step_mixed(theta, Bvalue, dt, thetar, thetas,
+                                             alpha, m, n, l, Ks)
+        else:
+            raise ValueError("The solver should be one of 'loop', 'vectorized', "
+                             "'picard' or 'newton'")
+    
+    def _richards_step_loop(self, theta, Bvalue, dt, thetar, thetas, alpha, m, n, l, Ks):
+        """
+        one sub-step of the richards equation,
+        the matrix is assembled node by node and solved by the thomas algorithm
+        """
+        nz = self.no_layer
+        
+        K, smc, psi = self._constitutive(theta, thetar, thetas, alpha, m, n, l, Ks)
+
+        #flux boundary condition at the top
+        Kmid = np.empty(nz+1)
+        Kmid[0] = 0
+        for i in range(1,nz):
+            Kmid[i] = 0.5*(K[i]+K[i-1])
+        Kmid[nz] = K[nz-1]
+
+        #Setting the coefficient for the internal nodes
+        A = np.empty(nz)
+        B = np.empty(nz)
+        C = np.empty(nz)
+        D = np.empty(nz)
+        dz = self.dz
+        dz2 = dz**2
+        
+        for i in range(nz):
+            A[i] = -(Kmid[i]/dz2)
+            B[i] = smc[i]/dt+(Kmid[i+1]+Kmid[i])/dz2
+            C[i] = A[i]
+            D[i] = smc[i]*psi[i]/dt-(Kmid[i+1]-Kmid[i])/dz
+        # setting the coefficient for the top bc (flux boundary)
+        i = 0
+        A[0] = 0
+        B[0] = smc[i]/dt+(Kmid[1])/dz2
+        D[0] = smc[i]*psi[i]/dt+(Bvalue-Kmid[1])/dz
+
+        # setting the coefficient for the bottom bc: gravity drainage
+        B[nz-1] = smc[nz-1]/dt+(Kmid[nz])/dz2
+        C[nz-1] = 0
+        D[nz-1] = smc[nz-1]*psi[nz-1]/dt-(Kmid[nz]-Kmid[nz-1])/dz
+
+        # Solving using the thomas algorithm (ambhas.tdma), node by node
+        u = self._thomas(A, B, C, D)
+        
+        # flux computation between nodes
+        J = np.empty(nz+1)
+        for i in range(1,nz):
+            J[i] = Kmid[i]*(1-(u[i]-u[i-1])/dz)
+        J[0] = Bvalue
+        J[nz] = Kmid[nz]
+
+        # flux updating
+        flux = np.diff(J)*dt/dz
+        theta = theta - flux
+
+        theta[theta>thetas] = 0.99*thetas
+        theta[theta<thetar] = 1.01*thetar
+        
+        return theta, J
+    
+    def _kmid(self, K):
+        """
+        conductivity at the interfaces between the layers, along the last 
+        axis of K
+            'arithmetic': the mid-point value, interpolated linearly between
+            the nodes
+            'harmonic': the harmonic mean weighted by the thickness of the 
+            layers
+        """
+        if self.kmid == 'arithmetic':
+            if np.ndim(self.dz) == 0:
+                return 0.5*(K[...,1:]+K[...,:-1])
+            else:
+                return self.w_kmid*K[...,:-1]+(1-self.w_kmid)*K[...,1:]
+        else:
+            dz = self.dz_layer
+            return (dz[1:]+dz[:-1])/(dz[:-1]/K[...,:-1]+dz[1:]/K[...,1:])
+    
+    def _richards_step_vec(self, theta, Bvalue, dt, thetar, thetas, alpha, m, n, l, Ks):
+        """
+        one sub-step of the richards equation,
+        the matrix is assembled with numpy array operations and solved by 
+        the banded solver
+        
+        it gives the same results as _richards_step_loop
+        
+        theta can also be a 2-D array (n_ens, nz), in which case all the 
+        columns are advanced together. The soil hydraulic parameters should
+        then be of shape (n_ens,1) and Bvalue of shape (n_ens,), and dt can 
+        be either a scalar or of shape (n_ens,1)
+        
+        for the uniform grid (scalar dz) the coefficients of the original 
+        scheme are used. For the non-uniform grid, the flux at each 
+        interface is discretized over the distance between the nodes, and 
+        the matrix is assembled from these fluxes. The original scheme 
+        takes the conductivity of the upper interface in the super diagonal
+        (C = A) and of the bottom interface in the last diagonal term, 
+        while the assembly from the fluxes takes the lower and upper one.
+        A uniform dz given per layer is therefore not the same as a scalar
+        dz, and a scalar dz should be given to reproduce the original 
+        scheme.
+        """
+        dz = self.dz
+        
+        K, smc, psi = self._constitutive(theta, thetar, thetas, alpha, m, n, l, Ks)
+        
+        # conductivity at the interfaces, no flow through K at the top
+        Kmid = np.empty(K.shape[:-1]+(K.shape[-1]+1,))
+        Kmid[...,0] = 0
+        Kmid[...,1:-1] = self._kmid(K)
+        Kmid[...,-1] = K[...,-1]
+        
+        smc_dt = smc/dt
+        smc_psi_dt = smc*psi/dt
+        if np.ndim(dz) == 0:
+            # coefficients of the internal nodes
+            dz2 = dz**2
+            A = -Kmid[...,:-1]/dz2
+            B = smc_dt+(Kmid[...,1:]+Kmid[...,:-1])/dz2
+            C = 1.0*A
+            D = smc_psi_dt-(Kmid[...,1:]-Kmid[...,:-1])/dz
+            
+            # top bc (flux boundary)
+            A[...,0] = 0
+            D[...,0] = smc_psi_dt[...,0]+(Bvalue-Kmid[...,1])/dz
+            
+            # bottom bc: gravity drainage
+            B[...,-1] = smc_dt[...,-1]+Kmid[...,-1]/dz2
+            C[...,-1] = 0
+            dz_node = dz
+        else:
+            # coef_up and coef_down are zero at the top and bottom, where
+            # the flux is given by Bvalue and the gravity drainage
+            A = -Kmid[...,:-1]*self.coef_up
+            C = -Kmid[...,1:]*self.coef_down
+            B = smc_dt-A-C
+            D = smc_psi_dt-(Kmid[...,1:]-Kmid[...,:-1])/dz
+            D[...,0] = smc_psi_dt[...,0]+(Bvalue-Kmid[...,1])/dz[0]
+            dz_node = self.dz_node[1:-1]
+        
+        u = self._solve_tridiag(A, B, C, D)
+        
+        # flux computation between nodes
+        J = np.empty(Kmid.shape)
+        J[...,1:-1] = Kmid[...,1:-1]*(1-(u[...,1:]-u[...,:-1])/dz_node)
+        J[...,0] = Bvalue
+        J[...,-1] = Kmid[...,-1]
+        
+        # flux updating
+        theta = theta - np.diff(J)*dt/dz
+        theta = np.where(theta>thetas, 0.99*thetas, theta)
+        theta = np.where(theta<thetar, 1.01*thetar, theta)
+        
+        return theta, J
+    
+    def _vg_psi(self, psi, thetar, thetas, alpha, m, n, l, Ks, derivative=False):
+        """
+        van Genuchten functions at the pressure head, used by the mixed 
+        form of the richards equation. The soil is saturated where psi>=0
+        
+        Output:
+            theta: soil moisture
+            Cap: specific moisture capacity, dtheta/dpsi
+            K: conductivity, limited as in theta2kr
+            dK: derivative of the conductivity, dK/dpsi, only if derivative
+            is True, otherwise None
+        """
+        x = np.abs(alpha*np.minimum(psi, 0))
+        xn = pow(x, n)
+        Se = pow(1+xn, -m)
+        dSe = alpha*m*n*pow(x, n-1)*pow(1+xn, -m-1)
+        theta = thetar+(thetas-thetar)*Se
+        Cap = (thetas-thetar)*dSe
+        
+        Se = np.maximum(Se, 1e-4)
+        f = 1-pow(1-pow(Se, 1/m), m)
+        K = Ks*pow(Se, l)*f**2
+        if not derivative:
+            return theta, Cap, K, None
+        
+        # the derivative is zero where the conductivity is limited
+        Se_d = np.minimum(Se, 1-1e-12)
+        df = pow(1-pow(Se_d, 1/m), m-1)*pow(Se_d, 1/m-1)
+        dK = Ks*(l*pow(Se, l-1)*f**2+2*pow(Se, l)*f*df)*dSe
+        dK = np.where(Se > 1e-4, dK, 0.0)
+        return theta, Cap, K, dK
+    
+    def _dkmid(self, K):
+        """
+        derivatives of the conductivity at the interfaces (see _kmid) with 
+        respect to the conductivity of the layer above and below
+        """
+        if self.kmid == 'arithmetic':
+            return self.w_kmid, 1-self.w_kmid
+        else:
+            dz = self.dz_layer
+            Kmid = self._kmid(K)
+            d_up = Kmid**2*dz[:-1]/((dz[1:]+dz[:-1])*K[...,:-1]**2)
+            d_down = Kmid**2*dz[1:]/((dz[1:]+dz[:-1])*K[...,1:]**2)
+            return d_up, d_down
+    
+    def _richards_step_mixed(self, theta, Bvalue, dt, thetar, thetas, alpha, m, n, l, Ks):
+        """
+        one sub-step of the mixed form of the richards equation
+            (theta(psi)-theta_old)/dt + dJ/dz = 0
+        solved for psi by the modified picard iterations of Celia et al. 
+        (1990), or by the newton iterations, which also include the 
+        derivative of the conductivity. When a newton iteration does not 
+        decrease the mass balance error, it is repeated as a picard 
+        iteration, and the rest of the sub-step uses the picard iterations.
+        The iterations stop when the mass
+        balance error of each layer is less than iter_tol (as soil 
+        moisture) and the change of psi is less than iter_psi_tol. The soil
+        moisture is then updated from the fluxes of the last iterate, as in
+        the other solvers, so that the mass is conserved whatever the 
+        length of the sub-step. It differs from theta(psi) by less than 
+        iter_tol, and needs no clipping.
+        
+        Ref:
+        Celia, M. A., Bouloutas, E. T., and Zarba, R. L. (1990), A general
+        mass-conservative numerical solution for the unsaturated flow 
+        equation, Water Resour. Res., 26(7), 1483-1496.
+        
+        theta can also be a 2-D array (n_ens, nz), as in _richards_step_vec
+        """
+        dz = self.dz_layer
+        dz_node = self.dz_node[1:-1]
+        
+        # the iterations start from the pressure head at the start of the 
+        # sub-step, which is limited as in theta2psi
+        psi = self.theta2psi(theta, thetar, thetas, m, n, alpha)
+        psi_min = -(1/alpha)*pow(pow(1e-6, -1/m)-1, 1/n)
+        
+        Kmid = np.zeros(psi.shape[:-1]+(psi.shape[-1]+1,))
+        grad = np.zeros(Kmid.shape)
+        psi_prev = psi
+        psi_change = np.inf
+        R_max_prev = np.inf
+        newton = self.solver == 'newton'
+        self.converged = False
+        self.n_iter = 0
+        while True:
+            theta_m, Cap, K, dK = self._vg_psi(psi, thetar, thetas, alpha, m, 
+                                                n, l, Ks, derivative=newton)
+            
+            # fluxes and the mass balance error of the current iterate
+            Kmid[...,1:-1] = self._kmid(K)
+            Kmid[...,-1] = K[...,-1]
+            grad[...,1:-1] = 1-(psi[...,1:]-psi[...,:-1])/dz_node
+            J = Kmid*grad
+            J[...,0] = Bvalue
+            J[...,-1] = K[...,-1]
+            R = theta_m-theta+np.diff(J)*dt/dz
+            R_max = np.abs(R).max()
+            if self.n_iter == 0 and not np.isfinite(R_max):
+                raise ValueError('The mass balance error of the richards '
+                                 'equation is not finite at the start of the '
+                                 'sub-step, check theta and the soil parameters')
+            
+            if newton and not R_max < R_max_prev:
+                newton = False
+                psi = psi_prev
+                continue
+            if R_max < self.iter_tol and psi_change < self.iter_psi_tol:
+                self.converged = True
+                break
+            if self.n_iter == self.max_iter:
+                break
+            R_max_prev = R_max
+            psi_prev = psi
+            
+            # jacobian of R/dt, without the derivative of the 
+            # conductivity for the picard iterations. A small storage is 
+            # added, which keeps the matrix regular when the column is 
+            # saturated, and does not change the converged solution
+            A = -Kmid[...,:-1]*self.coef_up
+            C = -Kmid[...,1:]*self.coef_down
+            B = (Cap+1e-6)/dt-A-C
+            if dK is not None:
+                d_up, d_down = self._dkmid(K)
+                J_up = d_up*dK[...,:-1]*grad[...,1:-1]
+                J_down = d_down*dK[...,1:]*grad[...,1:-1]
+                A[...,1:] -= J_up/dz[1:]
+                B[...,:-1] += J_up/dz[:-1]
+                B[...,1:] -= J_down/dz[1:]
+                C[...,:-1] += J_down/dz[:-1]
+                B[...,-1] += dK[...,-1]/dz[-1]
+            
+            delta = self._solve_tridiag(A, B, C, -R/dt)
+            psi_new = np.maximum(psi+delta, psi_min)
+            psi_change = (np.abs(psi_new-psi)/np.maximum(np.abs(psi), 1.0)).max()
+            psi = psi_new
+            self.n_iter += 1
+        
+        return theta-np.diff(J)*dt/dz, J
 
 
 class RICHARDS_1D_ENKF(RICHARDS_1D):
@@ -570,25 +1661,98 @@ class RICHARDS_1D_ENKF(RICHARDS_1D):
     and then write the output files
     
     """
+    checkpoint_vars = ['t', 'theta_ens', 'iter_dt', 'soil_par_ens', 'soil_pert']
+    par_keys = ['thetar', 'thetas', 'alpha', 'n', 'Ks', 'l']
+    analysis = 'full'
+    inflation = 1.0
+    obs_std = None
     
-    def __init__(self,input_file):
+    def __init__(self, input_file=None, **kwargs):
         """
         Input:
             input_file: the file which contains all the information
-            including forcing and parameters.
+            including forcing and parameters. If it is None, these are 
+            given as keyword arguments, as for the RICHARDS_1D, except that
+            the soil hydraulic parameters are given by:
+                soil_par_range: dict of (min, max) of each parameter
+                soil_par_ens: dict of (mean, std) of each parameter for the
+                initial ensemble, by default the middle of the range and 
+                one tenth of its width
+            and the measurements by:
+                meas_sm: measured surface soil moisture at each time step,
+                the analysis after the forecast of the time step t uses 
+                meas_sm[t-1] (both the 'full' and the ensemble space one, 
+                at t=0 it is the last measurement)
+                a, b: intercept and slope of the relationship of the 
+                surface soil moisture with the profile soil moisture, one
+                per layer (default 0 and 1)
+            the output file (ofile_name) is needed
+            n_ens: no. of ensemble members (default 10)
+            batch: if True (default) all the ensemble members are advanced 
+            together, otherwise one member at a time
+            solver: the solver used when batch is False, 'loop' (default),
+            'vectorized', 'picard' or 'newton', see RICHARDS_1D
+            the no. of sub-steps is given by the rainfall (dt_control 
+            'fixed'), the other dt_control are not available
+            output_backend, output_buffer, output_dtype, output_complevel:
+            writing of the output file, see RICHARDS_1D
+            checkpoint_file, checkpoint_every, restart_file, initial_state:
+            checkpoints of the state, see RICHARDS_1D
+            profile, profile_output: profiling of the run, see RICHARDS_1D
+            analysis: the analysis step of the filter, 'full' (default) 
+            with the covariance of the full state, or 'etkf' or 'enkf' 
+            computed in the ensemble space (see ambhas.enkf)
+            inflation: multiplicative inflation of the forecast covariance,
+            used by the analysis 'etkf' and 'enkf' (default 1.0)
+            obs_std: error (standard deviation) of the profile soil 
+            moisture given by the measured surface soil moisture, scalar or
+            one per observed layer, used by the analysis 'etkf' and 'enkf'.
+            By default it is 0.005*(i**2+1) for the layer i, as in the 
+            analysis 'full'
+            run: if True (default), the model is run over all the time steps
         """      
         self.input_file = input_file
-        self.n_ens = 10
+        self.n_ens = kwargs.get('n_ens', 10)
+        self.batch = kwargs.get('batch', True)
+        self.analysis = kwargs.get('analysis', self.analysis)
+        self.inflation = kwargs.get('inflation', self.inflation)
+        self.obs_std = kwargs.get('obs_std', self.obs_std)
+        if self.analysis not in ['full', 'etkf', 'enkf']:
+            raise ValueError("The analysis should be one of 'full', 'etkf' or 'enkf'")
+        self._read_options(**kwargs)
+        if self.spinup_days is not None:
+            raise ValueError('The spin-up is not available for the RICHARDS_1D_ENKF')
+        if self.dt_control != 'fixed':
+            raise ValueError("The RICHARDS_1D_ENKF supports only the dt_control 'fixed'")
+        if self.vg_table:
+            # the parameters of the members are perturbed and updated at 
+            # each time step, so a table would not be used twice
+            raise ValueError('The vg_table is not available for the RICHARDS_1D_ENKF')
         # read the input data
-        self._read_input()
+        if input_file is None:
+            self._set_input(**kwargs)
+        else:
+            self._read_input()
         
         # initialize the variables and output file
         self.initialize()
         
         ################ run the model ########################
-        for t in range(self.max_t):
-            self.t = t
-              
+        if kwargs.get('run', True):
+            self.run()
+    
+    def _step_solver(self):
+        """
+        the solver used for the sub-steps, the members advanced together
+        (batch) always use the vectorized one
+        """
+        return 'vectorized' if self.batch else self.solver
+    
+    def run(self):
+        """
+        run the model over all the remaining time steps
+        """
+        while self.t < self.max_t:
             # get forcing data at current time step        
             self._get_forcing()
             
@@ -596,19 +1760,26 @@ class RICHARDS_1D_ENKF(RICHARDS_1D):
             self._perturb_soil_par_ens()
                         
             # call the unsat module with ensemble
-            for ens in range(self.n_ens):
-                self.ens = ens
-                
-                self._unsat_ens()
+            if self.batch:
+                self._unsat_ens_batch()
+            else:
+                for ens in range(self.n_ens):
+                    self.ens = ens
+                    
+                    self._unsat_ens()
                 
             # ensemble kalmfan filter
-            self._enkf_par_depth()
-
+            if self.analysis == 'full':
+                self._enkf_par_depth()
+            else:
+                self._enkf_ens_space()
             
             self._write_output()                
+            
+            self.t += 1
+            self._checkpoint()
                 
-                
-        self.nc_file.close() # close the output file
+        self.close() # close the output file
 
 
     def _enkf(self):
@@ -617,7 +1788,7 @@ class RICHARDS_1D_ENKF(RICHARDS_1D):
         """
         # compute the covariance matrix of the state+par
         x = self.theta_ens
-        x_bar = np.tile(x.mean(axis=0),(10,1))
+        x_bar = np.tile(x.mean(axis=0),(self.n_ens,1))
         x_x_bar = x-x_bar
         cov_xx = np.dot(x_x_bar.T,x_x_bar)        
         
@@ -658,7 +1829,7 @@ class RICHARDS_1D_ENKF(RICHARDS_1D):
         X = np.hstack([x, soil_par])
         
         # compute the covariance matrix of the state+par
-        X_bar = np.tile(X.mean(axis=0),(10,1))
+        X_bar = np.tile(X.mean(axis=0),(self.n_ens,1))
         X_X_bar = X-X_bar
         cov_XX = np.dot(X_X_bar.T,X_X_bar) + 1e-6*np.eye(self.no_layer+6)
         cov_XX = 0.5*(cov_XX + cov_XX.T)
@@ -760,7 +1931,7 @@ class RICHARDS_1D_ENKF(RICHARDS_1D):
         X = np.hstack([x, soil_par])
         
         # compute the covariance matrix of the state+par
-        X_bar = np.tile(X.mean(axis=0),(10,1))
+        X_bar = np.tile(X.mean(axis=0),(self.n_ens,1))
         X_X_bar = X-X_bar
         cov_XX = np.dot(X_X_bar.T,X_X_bar) + 1e-6*np.eye(self.no_layer+6)
         cov_XX = 0.5*(cov_XX + cov_XX.T)
@@ -856,6 +2027,36 @@ class RICHARDS_1D_ENKF(RICHARDS_1D):
         self.K = K
         self.cov_ee = cov_ee
         self.cov_XX = cov_XX
+    
+    def _enkf_ens_space(self):
+        """
+        ensemble kalman filter, with the analysis computed in the ensemble 
+        space (see ambhas.enkf)
+        the state contains the soil moisture at different depths and the 
+        soil parameters. The observations are the soil moisture of the top
+        (up to 20) layers, given by the relationship with the measured 
+        surface soil moisture, at the same time step as in _enkf_par_depth.
+        """
+        n_obs = min(20, self.no_layer, len(self.a))
+        obs = self.a[:n_obs]+self.b[:n_obs]*self.meas_ssm[self.t-1]
+        if self.obs_std is None:
+            obs_std = 0.005*(np.arange(n_obs)**2+1)
+        else:
+            obs_std = self.obs_std*np.ones(n_obs)
+        
+        X = enkf.augment(self.theta_ens, self.soil_par_ens, self.par_keys)
+        HX = enkf.obs_operator(X, np.arange(n_obs))
+        X = enkf.analysis(X, HX, obs, obs_std**2, self.analysis, self.inflation)
+        theta_ens, soil_par = enkf.split(X, self.no_layer, self.par_keys)
+        
+        # check for the range of the updated ensemble, the soil moisture is
+        # limited as in the solver of the richards equation
+        for key in self.par_keys:
+            self.soil_par_ens[key] = np.clip(soil_par[key], getattr(self, key+'_min'),
+                                             getattr(self, key+'_max'))
+        thetar = self.soil_par_ens['thetar'][:,np.newaxis]
+        thetas = self.soil_par_ens['thetas'][:,np.newaxis]
+        self.theta_ens = np.clip(theta_ens, 1.01*thetar, 0.99*thetas)
 
     def initialize(self):
         """
@@ -866,60 +2067,54 @@ class RICHARDS_1D_ENKF(RICHARDS_1D):
         max_t = int(self.final_time/self.dt_flux)
         #max_t = 56
         self.max_t = max_t
+        self.t = 0
         self.iter_dt = 1
+        
+        # generate soil hydraulic parameters
+        self._generate_soil_par_ens()
+        
+        # the state of the restarted run
+        self._load_state()
                         
         # open file for writing
-        file = nc.NetCDFFile(self.ofile_name, 'w')
-        setattr(file, 'title', 'output of the model ambhas.richards')
+        file = self._open_output()
+        file.setncattr('title', 'output of the model ambhas.richards')
         now = datetime.datetime.now()
-        setattr(file, 'description', 'The model was run at %s'%(now.ctime()))
+        file.setncattr('description', 'The model was run at %s'%(now.ctime()))
         file.createDimension('depth', self.no_layer)
         file.createDimension('time', self.max_t+1)
         file.createDimension('ensemble', self.n_ens)
         
         # depth
         varDims = 'depth',
-        depth = file.createVariable('depth', 'd', varDims)
-        depth.units = 'm'
-        depth[:] = np.tile(self.dz,self.no_layer).cumsum()-self.dz/2
+        depth = file.createVariable('depth', varDims, units='m')
+        depth[:] = self.z_node
         
         # time (year and doy)
         varDims = 'time',
-        self.nc_year = file.createVariable('year', 'd', varDims)
-        self.nc_doy = file.createVariable('doy', 'd', varDims)
+        self.nc_year = file.createVariable('year', varDims)
+        self.nc_doy = file.createVariable('doy', varDims)
         
         # soil moisture
         varDims = 'ensemble', 'depth', 'time'
-        self.nc_sm = file.createVariable('sm','d', varDims)
-        self.nc_sm.units = 'v/v'
-        self.nc_sm[:,:,0] = self.theta_ens
+        self.nc_sm = file.createVariable('sm', varDims, units='v/v')
+        self.nc_sm.put(0, self.theta_ens)
         
         # recharge and aet
         varDims = 'time',
-        self.nc_aet = file.createVariable('aet','d',varDims)
-        self.nc_aet.units = 'mm'
-        self.nc_recharge = file.createVariable('recharge','d',varDims)
-        self.nc_recharge.units = 'mm'
+        self.nc_aet = file.createVariable('aet', varDims, units='mm')
+        self.nc_recharge = file.createVariable('recharge', varDims, units='mm')
 
         # recharge and aet
         varDims = 'ensemble','time'
-        self.nc_thetar = file.createVariable('thetar','d',varDims)
-        self.nc_thetar.units = 'v/v'
-        self.nc_thetas = file.createVariable('thetas','d',varDims)
-        self.nc_thetas.units = 'v/v'    
-        self.nc_alpha = file.createVariable('alpha','d',varDims)
-        self.nc_alpha.units = '1/m'
-        self.nc_n = file.createVariable('n','d',varDims)
-        self.nc_n.units = '-' 
-        self.nc_Ks = file.createVariable('Ks','d',varDims)
-        self.nc_Ks.units = 'm/s'
-        self.nc_l = file.createVariable('l','d',varDims)
-        self.nc_l.units = '-' 
+        self.nc_thetar = file.createVariable('thetar', varDims, units='v/v')
+        self.nc_thetas = file.createVariable('thetas', varDims, units='v/v')
+        self.nc_alpha = file.createVariable('alpha', varDims, units='1/m')
+        self.nc_n = file.createVariable('n', varDims, units='-')
+        self.nc_Ks = file.createVariable('Ks', varDims, units='m/s')
+        self.nc_l = file.createVariable('l', varDims, units='-')
         
         self.nc_file = file
-        
-        # generate soil hydraulic parameters
-        self._generate_soil_par_ens()
 
     def _read_input(self):
         """
@@ -968,41 +2163,44 @@ class RICHARDS_1D_ENKF(RICHARDS_1D):
         output_message = 'Input data reading completed sucessfully'
         self._colored_output(output_message, 32)
     
-    def _read_ab(self):
+    def _set_input(self, **kwargs):
         """
-        read the intercept and slope of the relationship of the surface soil 
-        moisture with the profile soil moisture
+        set the forcing, the soil hydraulic parameters and the measurements
+        given as arrays, instead of reading them from the input file
         """
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('ab')
+        for key in ['soil_par_range', 'meas_sm', 'ofile_name']:
+            if key not in kwargs:
+                raise ValueError('%s should be given when there is no input_file'%key)
+        par_range = kwargs['soil_par_range']
+        soil_par = dict((key, 0.5*(par_range[key][0]+par_range[key][1])) 
+                        for key in self.par_keys)
+        kwargs = dict(kwargs, soil_par=soil_par)
+        RICHARDS_1D._set_input(self, **kwargs)
+        self.ind = {}
         
-        data_len = sheet.nrows-1
-        a = np.zeros(data_len)
-        b = np.zeros(data_len)
-               
-        for i in xrange(data_len):
-            a[i] = sheet.cell_value(i+1,1)
-            b[i] = sheet.cell_value(i+1,2)
-                    
-        self.a = a
-        self.b = b
+        shp_ens = {}
+        for key in self.par_keys:
+            setattr(self, key+'_min', par_range[key][0])
+            setattr(self, key+'_max', par_range[key][1])
+            shp_ens[key] = soil_par[key], 0.1*(par_range[key][1]-par_range[key][0])
+        shp_ens.update(kwargs.get('soil_par_ens', {}))
+        self.shp_ens = shp_ens
         
+        self.theta_ens = self.theta + 0.05*np.random.normal(size=(self.n_ens,self.no_layer))
+        self.meas_ssm = np.asarray(kwargs['meas_sm'], dtype=float)
+        self.a = np.zeros(self.no_layer) + kwargs.get('a', 0.0)
+        self.b = np.zeros(self.no_layer) + kwargs.get('b', 1.0)
     
-    def _read_measured(self):
+    def _read_ab(self):
         """
-        read the measured surface soil moisture (ssm) data
+        read the intercept and slope of the relationship of the surface soil 
+        moisture with the profile soil moisture
         """
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('forcing')
+        sheet = self._sheet('ab')
         
-        data_len = sheet.nrows-1
-        meas_ssm = np.zeros(data_len)
-        j = self.ind['meas_sm']
+        self.a = col_array(sheet, 1)
+        self.b = col_array(sheet, 2)
         
-        for i in xrange(data_len):
-            meas_ssm[i] = sheet.cell_value(i+1,3+j)
-                    
-        self.meas_ssm = meas_ssm
     
     def _read_initial_condition(self):
         """
@@ -1011,8 +2209,7 @@ class RICHARDS_1D_ENKF(RICHARDS_1D):
         #get the row number from the ind
         j = self.ind['initial_condition']
         
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('initial_condition')
+        sheet = self._sheet('initial_condition')
         theta_0 = sheet.cell_value(j,1)
         self.theta_ens = theta_0 + 0.05*np.random.normal(size=(self.n_ens,self.no_layer))
     
@@ -1025,8 +2222,7 @@ class RICHARDS_1D_ENKF(RICHARDS_1D):
         #get the row number from the ind
         j = self.ind['soil_hyd_par_ens']
         
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('soil_hyd_par_ens')
+        sheet = self._sheet('soil_hyd_par_ens')
         self.thetar_min, self.thetar_max = sheet.cell_value(j+1,1), sheet.cell_value(j+1,7)
         self.thetas_min, self.thetas_max = sheet.cell_value(j+1,2), sheet.cell_value(j+1,8)
         self.alpha_min, self.alpha_max = sheet.cell_value(j+1,3), sheet.cell_value(j+1,9)
@@ -1183,93 +2379,90 @@ class RICHARDS_1D_ENKF(RICHARDS_1D):
             aet = smi*self.pet_cur
             Bvalue = self.rain_cur-aet
         
-            K = self.theta2kr(theta,thetar,thetas,m,l,Ks)
-            smc = self.smcf(theta,thetar,thetas,alpha,m,n)
-            psi = self.theta2psi(theta,thetar,thetas,m,n,alpha)
-            
-            
-            #flux boundary condition at the top
-            Kmid = np.empty(nz+1)        
-            Kmid[0] = 0
-            for i in range(1,nz):
-                Kmid[i] = 0.5*(K[i]+K[i-1])
-            Kmid[nz] = K[nz-1]
-            
-            #Setting the coefficient for the internal nodes
-            A = np.empty(nz)
-            B = np.empty(nz)
-            C = np.empty(nz)
-            D = np.empty(nz)
-            dz = self.dz
-            dz2 = dz**2
-            
-            for i in range(nz):
-                A[i] = -(Kmid[i]/dz2)
-                B[i] = smc[i]/dt+(Kmid[i+1]+Kmid[i])/dz2
-                C[i] = A[i]
-                D[i] = smc[i]*psi[i]/dt-(Kmid[i+1]-Kmid[i])/dz
-            # setting the coefficient for the top bc (flux boundary)
-            i = 0        
-            A[0] = 0
-            B[0] = smc[i]/dt+(Kmid[1])/dz2
-            D[0] = smc[i]*psi[i]/dt+(Bvalue-Kmid[1])/dz
-            
-            # setting the coefficient for the bottom bc: gravity drainage
-            B[nz-1] = smc[nz-1]/dt+(Kmid[nz])/dz2
-            C[nz-1] = 0
-            D[nz-1] = smc[nz-1]*psi[nz-1]/dt-(Kmid[nz]-Kmid[nz-1])/dz
-            
-            # Solving using the thomas algorithm
-            beta = np.empty(nz)
-            gamma = np.empty(nz)
-            u = np.empty(nz)
-            beta[0] = B[0]
-            gamma[0] = D[0]/beta[0]
-            for i in range(1,nz):
-                beta[i] = B[i]-(A[i]*C[i-1])/(beta[i-1])
-                gamma[i] = (D[i]-A[i]*gamma[i-1])/(beta[i])
-            
-            u[nz-1] = gamma[nz-1]
-            for i in range(nz-2,-1,-1):
-                u[i] = gamma[i]-(C[i]*u[i+1])/beta[i]
-            
-            # flux computation between nodes
-            J = np.empty(nz+1)
-            for i in range(1,nz):
-                J[i] = Kmid[i]*(1-(u[i]-u[i-1])/dz)
-            J[0] = Bvalue
-            J[nz] = Kmid[nz]
-            
-            J[nz] = J[nz]
-            # flux updating
-            flux = np.diff(J)*dt/dz
-            theta = theta - flux
-            
-            theta[theta>thetas] = 0.99*thetas
-            theta[theta<thetar] = 1.01*thetar
-                        
+            # solve the richards equation for the sub-step
+            theta, J = self._richards_step(theta, Bvalue, dt, thetar, thetas,
+                                           alpha, m, n, l, Ks)
+
             aet_day += aet*dt 
             recharge_day += J[nz]*dt           
             
+        if np.any(np.isnan(theta)):
+            raise ValueError('The soil moisture of the member %d became nan at the time step %d'%(ens, self.t))
                             
-        self.theta_ens[ens] = theta        
-        
+        self.theta_ens[ens] = theta
+        if self.profiler is not None:
+            self.profiler.record('n_sub', self.iter_dt)
+
+    def _unsat_ens_batch(self):
+        """
+        top boundary: atmoshpheric
+        bottom boundary: gravity drainage
+
+        same as _unsat_ens, but all the ensemble members are advanced
+        together as (n_ens, nz) arrays, and one sub-step size is used for
+        all the members
+        """
+        # soil hydraulic parameters as column vectors (n_ens,1)
+        thetar = self.soil_par_ens['thetar'][:,np.newaxis]
+        thetas = self.soil_par_ens['thetas'][:,np.newaxis]
+        alpha = self.soil_par_ens['alpha'][:,np.newaxis]
+        n = self.soil_par_ens['n'][:,np.newaxis]
+        l = self.soil_par_ens['l'][:,np.newaxis]
+        Ks = self.soil_par_ens['Ks'][:,np.newaxis]
+        m = 1-1/n
+        evap_0 = self.soil_par_ens['thetar']+0.25*(
+                 self.soil_par_ens['thetas']-self.soil_par_ens['thetar'])
+        evap_1 = self.soil_par_ens['thetar']+0.75*(
+                 self.soil_par_ens['thetas']-self.soil_par_ens['thetar'])
+
+        theta = 1.0*self.theta_ens
+
+        iter_dt = max(24,int(np.ceil(self.rain_cur*self.dt_flux*1000/0.15)))
+        self.iter_dt = int(max(iter_dt,0.75*self.iter_dt))
+
+        recharge_day = np.zeros(self.n_ens)
+        aet_day = np.zeros(self.n_ens)
+
+        dt = self.dt_flux/self.iter_dt
+        for i in range(self.iter_dt):
+            # top boundary value
+            smi = np.clip((theta[:,0]-evap_0)/(evap_1-evap_0), 0, 1)
+            aet = smi*self.pet_cur
+            Bvalue = self.rain_cur-aet
+
+            # solve the richards equation for the sub-step
+            theta, J = self._richards_step_vec(theta, Bvalue, dt, thetar, thetas,
+                                               alpha, m, n, l, Ks)
+
+            aet_day += aet*dt
+            recharge_day += J[:,-1]*dt
+
+        if np.any(np.isnan(theta)):
+            ens = np.nonzero(np.isnan(theta).any(axis=1))[0][0]
+            raise ValueError('The soil moisture of the member %d became nan at the time step %d'%(ens, self.t))
+
+        self.theta_ens = theta
+        self.aet_ens = aet_day
+        self.recharge_ens = recharge_day
+        if self.profiler is not None:
+            self.profiler.record('n_sub', self.iter_dt)
+
     def _write_output(self):
         """
         this functions writes the output at each time step
         """
         # write the output
-        self.nc_year[self.t] = (self.cur_year)
-        self.nc_doy[self.t] = (self.cur_doy)
-        self.nc_sm[:,:,self.t+1] = self.theta_ens
+        self.nc_year.put(self.t, self.cur_year)
+        self.nc_doy.put(self.t, self.cur_doy)
+        self.nc_sm.put(self.t+1, self.theta_ens)
         #self.nc_recharge[self.t] = recharge_day
         #self.nc_aet[self.t] = aet_day
-        self.nc_thetar[:,self.t] = self.soil_par_ens['thetar']
-        self.nc_thetas[:,self.t] = self.soil_par_ens['thetas']
-        self.nc_alpha[:,self.t] = self.soil_par_ens['alpha']
-        self.nc_n[:,self.t] = self.soil_par_ens['n']
-        self.nc_Ks[:,self.t] = self.soil_par_ens['Ks']
-        self.nc_l[:,self.t] = self.soil_par_ens['l']
+        self.nc_thetar.put(self.t, self.soil_par_ens['thetar'])
+        self.nc_thetas.put(self.t, self.soil_par_ens['thetas'])
+        self.nc_alpha.put(self.t, self.soil_par_ens['alpha'])
+        self.nc_n.put(self.t, self.soil_par_ens['n'])
+        self.nc_Ks.put(self.t, self.soil_par_ens['Ks'])
+        self.nc_l.put(self.t, self.soil_par_ens['l'])
 
 
 
@@ -1283,48 +2476,355 @@ class RICHARDS_1D_GLUE(RICHARDS_1D):
     do the processing
     and then write the output files
     
+    when the soil moisture is measured, the likelihood of each member is 
+    computed while it runs. The likelihood measures are the ones of 
+    errlib ('NS', 'L', 'rmse' or 'mae'), which depend on the simulation 
+    only through the sum of the (squared) errors. This sum only grows with
+    time, so the best likelihood that a member can still achieve is known
+    at each time step, and the member is stopped as soon as it can no 
+    longer be behavioural.
+    
+    with summary_stats, the likelihood weighted mean, variance and quantiles
+    of the members are computed as the members finish, so that the memory
+    and the size of the output file do not grow with the no. of members.
+    The output of each member (sm, recharge and aet) is then written only 
+    if output_members is True.
     """
+    likelihood = 'NS'
+    threshold = None
+    meas_layer = 0
+    summary_stats = False
+    quantiles = [0.05, 0.5, 0.95]
+    n_bins = 100
+    quantile_layers = None
+    hist_dtype = 'float64'
     
-    def __init__(self,input_file):
+    def __init__(self, input_file=None, **kwargs):
         """
         Input:
             input_file: the file which contains all the information
-            including forcing and parameters.
+            including forcing and parameters. If it is None, these are 
+            given as keyword arguments, as for the RICHARDS_1D, except that
+            the soil hydraulic parameters are given by their range:
+                soil_par_range: dict of (min, max) of each parameter
+            the output file (ofile_name) is needed
+            n_ens: no. of ensemble members (default 1000)
+            n_proc: no. of processes among which the ensemble members are
+            distributed (default 1)
+            seed: seed of the random numbers, each ensemble member gets its
+            own stream seeded by (seed, ens) (default None)
+            solver: the solver for the sub-steps, 'loop' (default), 
+            'vectorized', 'picard' or 'newton', see RICHARDS_1D
+            dt_control, theta_tol, mb_tol, dt_min, dt_max: control of the 
+            sub-steps, see RICHARDS_1D
+            max_iter, iter_tol, iter_psi_tol: iterations of the solvers 
+            'picard' and 'newton', see RICHARDS_1D
+            vg_table, vg_tol, vg_cache_size: tables of the van Genuchten
+            functions, see RICHARDS_1D. The table of each member is made 
+            from its (m, n, l), unless it is still in the cache
+            output_backend, output_dtype, output_complevel: writing of the
+            output file, see RICHARDS_1D
+            profile, profile_output: profiling of the run, see RICHARDS_1D.
+            With n_proc>1, the members are run in other processes, and only
+            the phases of this process (e.g. output) are profiled
+            meas_sm: measured soil moisture of the layer meas_layer at the 
+            end of each time step, nan when not measured. By default it is 
+            read from the forcing sheet, when the ind sheet gives meas_sm
+            meas_layer: the layer of the measured soil moisture (default 0)
+            likelihood: the likelihood measure, 'NS' (default), 'L', 'rmse'
+            or 'mae', as defined in errlib
+            threshold: the members are behavioural when their likelihood 
+            is at least threshold ('NS', 'L') or at most threshold ('rmse',
+            'mae'). The members which can no longer reach it are stopped. 
+            If None (default), all the members are run till the end
+            summary_stats: if True, the weighted mean and variance of sm, 
+            recharge and aet, and the quantiles of sm are written (default
+            False). The weight of the behavioural members is the likelihood
+            ('L'), max(NS, 0) ('NS') or 1/likelihood ('rmse', 'mae'), and 1
+            without measurements
+            quantiles: quantiles of sm (default [0.05, 0.5, 0.95])
+            n_bins: no. of bins of the histogram of sm between 0 and 1, 
+            used for the quantiles, whose error is at most 1/n_bins 
+            (default 100). The histogram keeps n_bins counts for each layer
+            and time step, i.e. n_bins*no_layer*(max_t+1) counts, e.g. 290
+            MB for 100 bins, 100 layers and 10 years of daily time steps
+            quantile_layers: the layers whose quantiles are computed, by 
+            default (None) all the layers
+            hist_dtype: dtype of the counts of the histogram, 'float64' 
+            (default) or 'float32', which halves its memory
+            output_members: if True, the output of each member is written
+            (default True, False with summary_stats)
         """      
         self.input_file = input_file
-        self.n_ens = 1000
+        self.n_ens = kwargs.get('n_ens', 1000)
+        self.n_proc = kwargs.get('n_proc', 1)
+        self.seed = kwargs.get('seed', None)
+        self.likelihood = kwargs.get('likelihood', self.likelihood)
+        self.threshold = kwargs.get('threshold', self.threshold)
+        self.meas_layer = kwargs.get('meas_layer', self.meas_layer)
+        self.summary_stats = kwargs.get('summary_stats', self.summary_stats)
+        self.quantiles = np.atleast_1d(kwargs.get('quantiles', self.quantiles))
+        self.n_bins = kwargs.get('n_bins', self.n_bins)
+        self.quantile_layers = kwargs.get('quantile_layers', self.quantile_layers)
+        self.hist_dtype = kwargs.get('hist_dtype', self.hist_dtype)
+        self.output_members = kwargs.get('output_members', not self.summary_stats)
+        if np.any(self.quantiles<0) or np.any(self.quantiles>1):
+            raise ValueError('The quantiles should be between 0 and 1')
+        if self.likelihood not in ['NS', 'L', 'rmse', 'mae']:
+            raise ValueError("The likelihood should be one of 'NS', 'L', 'rmse' or 'mae'")
+        if self.hist_dtype not in ['float64', 'float32']:
+            raise ValueError("The hist_dtype should be 'float64' or 'float32'")
+        self._read_options(**kwargs)
+        if self.spinup_days is not None:
+            raise ValueError('The spin-up is not available for the RICHARDS_1D_GLUE')
+        if self.seed is not None:
+            np.random.seed(self.seed)
         
         # read the input data
-        self._read_input()
+        if input_file is None:
+            self._set_input(**kwargs)
+        else:
+            self._read_input()
+        self.max_t = int(self.final_time/self.dt_flux)
+        self._set_measured(kwargs.get('meas_sm', None))
+        # initial condition is same for all the ensemble
+        self.theta_0 = 1.0*self.theta
+        
+        # start the workers before opening the output file, so that they
+        # inherit the forcing and parameters, but not the output file
+        pool = None
+        if self.n_proc>1:
+            pool = multiprocessing.Pool(self.n_proc, _glue_init, (self,))
         
         # initialize the variables and output file
         self.initialize()
         
         ########## run the GLUE ###########################
-        for ens in range(self.n_ens):
-            self.ens = ens
-            
-            self._shp_cur()
-            
-            # read the initial condition for ensemble everytime so that 
-            # initial condition is same for all the ensemble
-            self._read_initial_condition()
-                        
-            ################ run the model ########################
-            for t in range(self.max_t):
-                self.t = t
-                  
-                # get forcing data at current time step        
-                self._get_forcing()
-                
-                # call the unsat module
-                self._unsat()
+        if pool is None:
+            members = (self._run_member(ens) for ens in range(self.n_ens))
+        else:
+            chunksize = max(1, self.n_ens//(4*self.n_proc))
+            members = pool.imap_unordered(_glue_member, range(self.n_ens), chunksize)
+        
+        # all the members are written by this process only
+        n_reject = 0
+        for i, member in enumerate(members):
+            self._write_member(*member)
+            n_reject += member[-1] < self.max_t
             
-            output_message = '%d out of %d ensemble completed'%(ens,self.n_ens)
+            output_message = '%d out of %d ensemble completed'%(i+1,self.n_ens)
             self._colored_output(output_message, 41)
-            
+        
+        if pool is not None:
+            pool.close()
+            pool.join()
+        
+        if self.threshold is not None:
+            output_message = '%d out of %d ensemble rejected early'%(n_reject,self.n_ens)
+            self._colored_output(output_message, 32)
+        
+        if self.summary_stats:
+            self._write_stats()
+        
+        self._write_profile()
         self.nc_file.close() # close the output file
 
+    def _set_measured(self, meas_sm):
+        """
+        set the measured soil moisture, and the terms of the likelihood 
+        which depend only on the measurements
+        """
+        if meas_sm is None and 'meas_sm' in self.ind:
+            self._read_measured()
+            meas_sm = self.meas_ssm
+        if meas_sm is None:
+            if self.threshold is not None:
+                raise ValueError('The measured soil moisture is needed for the threshold')
+            self.meas_sm = None
+            return
+        
+        meas_sm = np.asarray(meas_sm, dtype=float)
+        if len(meas_sm) < self.max_t:
+            raise ValueError('The measured soil moisture should be given for all the time steps')
+        self.meas_sm = meas_sm[:self.max_t]
+        valid = self.meas_sm[~np.isnan(self.meas_sm)]
+        if len(valid) == 0:
+            raise ValueError('The measured soil moisture has no valid data')
+        self.n_meas = len(valid)
+        self.sst = np.sum((valid-valid.mean())**2)
+    
+    def _best_likelihood(self, sse, sae):
+        """
+        the best likelihood that the member can still achieve, given the sum
+        of the squared errors (sse) and of the absolute errors (sae) till 
+        the current time step. At the end of the run, it is the likelihood 
+        of the member.
+        """
+        if self.likelihood == 'NS':
+            return 1-sse/self.sst
+        elif self.likelihood == 'L':
+            return np.exp(-5*sse/self.sst)
+        elif self.likelihood == 'rmse':
+            return np.sqrt(sse/self.n_meas)
+        else:
+            return sae/self.n_meas
+    
+    def _weight(self, likelihood):
+        """
+        weight of the member in the summary statistics
+        """
+        if self.meas_sm is None:
+            return 1.0
+        if np.isnan(likelihood) or (self.threshold is not None 
+                                    and not self._behavioural(likelihood)):
+            return 0.0
+        if self.likelihood == 'L':
+            return likelihood
+        elif self.likelihood == 'NS':
+            return max(likelihood, 0.0)
+        else:
+            return 1.0/likelihood if likelihood > 0 else 0.0
+    
+    def _behavioural(self, likelihood):
+        """
+        check if the likelihood meets the threshold
+        """
+        if self.likelihood in ['NS', 'L']:
+            return likelihood >= self.threshold
+        else:
+            return likelihood <= self.threshold
+
+    def _run_member(self, ens):
+        """
+        run the model for one ensemble member
+        
+        Output:
+            ens: the ensemble member
+            soil_par: soil hydraulic parameters of the member
+            sm: soil moisture (depth, time)
+            recharge: recharge (time)
+            aet: actual evapotranspiration (time)
+            likelihood: likelihood of the member, for the members which are
+            stopped, the best likelihood they could still achieve. nan if 
+            the soil moisture is not measured
+            t_stop: no. of time steps run, less than max_t for the members 
+            which are stopped
+        The outputs of the members which are stopped are nan after t_stop.
+        """
+        self.ens = ens
+        if self.seed is not None:
+            np.random.seed([self.seed, ens])
+        
+        self._shp_cur()
+        
+        self.theta = 1.0*self.theta_0
+        self.iter_dt = 1
+        self.dt_sub = self.dt_flux/24
+        self.n_nonconv = 0
+        self.sm_member = np.tile(np.nan, (self.no_layer, self.max_t+1))
+        self.sm_member[:,0] = self.theta
+        self.recharge_member = np.tile(np.nan, self.max_t)
+        self.aet_member = np.tile(np.nan, self.max_t)
+        
+        ################ run the model ########################
+        sse, sae = 0.0, 0.0
+        t_stop = self.max_t
+        for t in range(self.max_t):
+            self.t = t
+              
+            # get forcing data at current time step        
+            self._get_forcing()
+            
+            # call the unsat module
+            self._unsat()
+            
+            # running likelihood, the member is stopped when it can no 
+            # longer be behavioural
+            if self.meas_sm is not None and not np.isnan(self.meas_sm[t]):
+                err = self.theta[self.meas_layer]-self.meas_sm[t]
+                sse += err**2
+                sae += abs(err)
+                if self.threshold is not None and not self._behavioural(
+                        self._best_likelihood(sse, sae)):
+                    t_stop = t+1
+                    break
+        
+        if self.meas_sm is None:
+            likelihood = np.nan
+        elif t_stop < self.max_t:
+            likelihood = self._best_likelihood(sse, sae)
+        else:
+            sim = self.sm_member[self.meas_layer,1:]
+            likelihood = getattr(errlib, self.likelihood)(sim, self.meas_sm)
+        
+        return (ens, self.soil_par, self.sm_member, self.recharge_member, 
+                self.aet_member, likelihood, t_stop)
+    
+    def _write_member(self, ens, soil_par, sm, recharge, aet, likelihood, t_stop):
+        """
+        write the output of one ensemble member
+        """
+        if self.meas_sm is not None:
+            self.nc_likelihood[ens] = likelihood
+        self.nc_t_stop[ens] = t_stop
+        if self.output_members:
+            self.nc_sm[ens] = sm
+            self.nc_recharge[ens,:self.max_t] = recharge
+            self.nc_aet[ens,:self.max_t] = aet
+        if self.summary_stats:
+            w = self._weight(likelihood)
+            self.stats_sm.add(sm, w)
+            self.hist_sm.add(sm[self.quantile_layers], w)
+            self.stats_recharge.add(recharge, w)
+            self.stats_aet.add(aet, w)
+        
+        self.nc_thetar[ens] = soil_par['thetar']
+        self.nc_thetas[ens] = soil_par['thetas']
+        self.nc_alpha[ens] = soil_par['alpha']
+        self.nc_n[ens] = soil_par['n']
+        self.nc_Ks[ens] = soil_par['Ks']
+        self.nc_l[ens] = soil_par['l']
+
+    def _write_stats(self):
+        """
+        write the summary statistics of the members
+        """
+        file = self.nc_file
+        file.createDimension('quantile', len(self.quantiles))
+        file.setncattr('n_bins', self.n_bins)
+        nc_q = file.createVariable('quantile', ('quantile',))
+        nc_q[:] = self.quantiles
+        
+        varDims = 'depth', 'time'
+        var = file.createVariable('sm_mean', varDims, units='v/v')
+        var[:] = self.stats_sm.mean()
+        var = file.createVariable('sm_var', varDims)
+        var[:] = self.stats_sm.var()
+        # the quantiles of the layers given by quantile_layers, along their
+        # own depth dimension when they are not all the layers
+        if np.array_equal(self.quantile_layers, np.arange(self.no_layer)):
+            varDims = 'quantile', 'depth', 'time'
+        else:
+            file.createDimension('quantile_depth', len(self.quantile_layers))
+            var = file.createVariable('quantile_depth', ('quantile_depth',), units='m')
+            var[:] = self.z_node[self.quantile_layers]
+            varDims = 'quantile', 'quantile_depth', 'time'
+        var = file.createVariable('sm_quantile', varDims, units='v/v')
+        var[:] = self.hist_sm.quantile(self.quantiles)
+        
+        varDims = 'time',
+        for name, moments in [('recharge', self.stats_recharge), 
+                              ('aet', self.stats_aet)]:
+            var = file.createVariable('%s_mean'%name, varDims, units='mm')
+            var[:self.max_t] = moments.mean()
+            var = file.createVariable('%s_var'%name, varDims)
+            var[:self.max_t] = moments.var()
+        
+        # total weight of the members, zero if no member was behavioural
+        file.setncattr('sum_weight', float(self.stats_aet.sum_w.max()))
+        if self.stats_aet.sum_w.max() <= 0:
+            self._colored_output('No ensemble member has a positive weight', 31)
+
     def _read_input(self):
         """
         This checks if all the required input sheets are present in the xls file,
@@ -1379,8 +2879,7 @@ class RICHARDS_1D_GLUE(RICHARDS_1D):
         #get the row number from the ind
         j = self.ind['soil_hyd_par_ens']
 
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('soil_hyd_par_ens')
+        sheet = self._sheet('soil_hyd_par_ens')
         thetar_min, thetar_max = sheet.cell_value(j+1,1), sheet.cell_value(j+1,7)
         thetas_min, thetas_max = sheet.cell_value(j+1,2), sheet.cell_value(j+1,8)
         alpha_min, alpha_max = sheet.cell_value(j+1,3), sheet.cell_value(j+1,9)
@@ -1388,18 +2887,43 @@ class RICHARDS_1D_GLUE(RICHARDS_1D):
         Ks_min, Ks_max = sheet.cell_value(j+1,5), sheet.cell_value(j+1,11)
         l_min, l_max = sheet.cell_value(j+1,6), sheet.cell_value(j+1,12)
 
+        self._sample_shp_ens({'thetar':(thetar_min, thetar_max),
+                              'thetas':(thetas_min, thetas_max),
+                              'alpha':(alpha_min, alpha_max),
+                              'n':(n_min, n_max),
+                              'Ks':(Ks_min, Ks_max),
+                              'l':(l_min, l_max)})
+    
+    def _sample_shp_ens(self, par_range):
+        """
+        generate the ensemble of the soil hydraulic parameters uniformly 
+        within their range (dict of (min, max)) using LHS
+        """
         v = lhs(stats.uniform,[],(6,self.n_ens))
-
+        
         shp_ens = {}
-        shp_ens['thetar'] = thetar_min + (thetar_max-thetar_min)*v[0,:]
-        shp_ens['thetas'] = thetas_min + (thetas_max-thetas_min)*v[1,:]
-        shp_ens['alpha']  = alpha_min + (alpha_max-alpha_min)*v[2,:]
-        shp_ens['n']      = n_min + (n_max-n_min)*v[3,:]
-        shp_ens['Ks']     = Ks_min + (Ks_max-Ks_min)*v[4,:]
-        shp_ens['l']      = l_min + (l_max-l_min)*v[5,:]
+        for i, key in enumerate(['thetar', 'thetas', 'alpha', 'n', 'Ks', 'l']):
+            par_min, par_max = par_range[key]
+            shp_ens[key] = par_min + (par_max-par_min)*v[i,:]
 
         self.shp_ens = shp_ens
     
+    def _set_input(self, **kwargs):
+        """
+        set the forcing and the range of the soil hydraulic parameters given
+        as arrays, instead of reading them from the input file
+        """
+        for key in ['soil_par_range', 'ofile_name']:
+            if key not in kwargs:
+                raise ValueError('%s should be given when there is no input_file'%key)
+        par_range = kwargs['soil_par_range']
+        soil_par = dict((key, 0.5*(par_range[key][0]+par_range[key][1])) 
+                        for key in ['thetar', 'thetas', 'alpha', 'n', 'Ks', 'l'])
+        kwargs = dict(kwargs, soil_par=soil_par)
+        RICHARDS_1D._set_input(self, **kwargs)
+        self.ind = {}
+        self._sample_shp_ens(par_range)
+    
     def _shp_cur(self):
         """
         read the current soil hydraulic parameters
@@ -1422,13 +2946,6 @@ class RICHARDS_1D_GLUE(RICHARDS_1D):
 
         self.soil_par = soil_par
 
-        self.nc_thetar[self.ens] = soil_par['thetar']
-        self.nc_thetas[self.ens] = soil_par['thetas']
-        self.nc_alpha[self.ens] = soil_par['alpha']
-        self.nc_n[self.ens] = soil_par['n']
-        self.nc_Ks[self.ens] = soil_par['Ks']
-        self.nc_l[self.ens] = soil_par['l']
-
     
     def initialize(self):
         """
@@ -1441,46 +2958,72 @@ class RICHARDS_1D_GLUE(RICHARDS_1D):
         self.iter_dt = 1
 
         # open file for writing
-        file = nc.NetCDFFile(self.ofile_name, 'w')
-        setattr(file, 'title', 'output of the model ambhas.richards_glue')
+        file = self._open_output()
+        file.setncattr('title', 'output of the model ambhas.richards_glue')
         now = datetime.datetime.now()
-        setattr(file, 'description', 'The model was run at %s'%(now.ctime()))
+        file.setncattr('description', 'The model was run at %s'%(now.ctime()))
         file.createDimension('depth', self.no_layer)
         file.createDimension('time', self.max_t+1)
         file.createDimension('ensemble', self.n_ens)
 
         # depth
         varDims = 'depth',
-        depth = file.createVariable('depth', 'd', varDims)
-        depth.units = 'm'
-        depth[:] = np.tile(self.dz,self.no_layer).cumsum()-self.dz/2
+        depth = file.createVariable('depth', varDims, units='m')
+        depth[:] = self.z_node
 
         # time (year and doy)
         varDims = 'time',
-        self.nc_year = file.createVariable('year', 'd', varDims)
-        self.nc_doy = file.createVariable('doy', 'd', varDims)
+        self.nc_year = file.createVariable('year', varDims)
+        self.nc_doy = file.createVariable('doy', varDims)
 
         # soil moisture
-        varDims = 'ensemble', 'depth', 'time'
-        self.nc_sm = file.createVariable('sm','d', varDims)
-        self.nc_sm.units = 'v/v'
-        self.nc_sm[:,:,0] = self.theta
+        if self.output_members:
+            varDims = 'ensemble', 'depth', 'time'
+            self.nc_sm = file.createVariable('sm', varDims, units='v/v')
+
+        # rainfall
+        varDims = 'time',
+        self.nc_rain = file.createVariable('rain', varDims, units='mm')
+        self.nc_year[:self.max_t] = self.year[:self.max_t]
+        self.nc_doy[:self.max_t] = self.doy[:self.max_t]
+        self.nc_rain[:self.max_t] = self.rain[:self.max_t]/self.dt_flux
 
         # recharge and aet
-        varDims = 'ensemble','time'
-        self.nc_aet = file.createVariable('aet','d',varDims)
-        self.nc_aet.units = 'mm'
-        self.nc_recharge = file.createVariable('recharge','d',varDims)
-        self.nc_recharge.units = 'mm'
+        if self.output_members:
+            varDims = 'ensemble','time'
+            self.nc_aet = file.createVariable('aet', varDims, units='mm')
+            self.nc_recharge = file.createVariable('recharge', varDims, units='mm')
+        
+        # summary statistics, updated as the members finish
+        if self.summary_stats:
+            self.stats_sm = WeightedMoments((self.no_layer, self.max_t+1))
+            if self.quantile_layers is None:
+                self.quantile_layers = np.arange(self.no_layer)
+            self.quantile_layers = np.atleast_1d(self.quantile_layers).astype(int)
+            if np.any(self.quantile_layers<0) or np.any(self.quantile_layers>=self.no_layer):
+                raise ValueError('The quantile_layers should be between 0 and no_layer-1')
+            self.hist_sm = HistogramSketch((len(self.quantile_layers), self.max_t+1), 
+                                           0.0, 1.0, self.n_bins, self.hist_dtype)
+            self.stats_recharge = WeightedMoments(self.max_t)
+            self.stats_aet = WeightedMoments(self.max_t)
 
         # soil_par
         varDims = 'ensemble',
-        self.nc_thetar = file.createVariable('thetar','d',varDims)
-        self.nc_thetas = file.createVariable('thetas','d',varDims)
-        self.nc_alpha = file.createVariable('alpha','d',varDims)
-        self.nc_n = file.createVariable('n','d',varDims)
-        self.nc_Ks = file.createVariable('Ks','d',varDims)
-        self.nc_l = file.createVariable('l','d',varDims)
+        self.nc_thetar = file.createVariable('thetar', varDims)
+        self.nc_thetas = file.createVariable('thetas', varDims)
+        self.nc_alpha = file.createVariable('alpha', varDims)
+        self.nc_n = file.createVariable('n', varDims)
+        self.nc_Ks = file.createVariable('Ks', varDims)
+        self.nc_l = file.createVariable('l', varDims)
+        
+        # likelihood, and no. of time steps run by the members, which is 
+        # less than the no. of time steps for the members stopped early
+        self.nc_t_stop = file.createVariable('t_stop', varDims)
+        if self.meas_sm is not None:
+            self.nc_likelihood = file.createVariable('likelihood', varDims)
+            file.setncattr('likelihood', self.likelihood)
+            if self.threshold is not None:
+                file.setncattr('threshold', self.threshold)
 
         self.nc_file = file
 
@@ -1491,153 +3034,378 @@ class RICHARDS_1D_GLUE(RICHARDS_1D):
         #get the row number from the ind
         j = self.ind['initial_condition']
 
-        book = xlrd.open_workbook(self.input_file)
-        sheet = book.sheet_by_name('initial_condition')
+        sheet = self._sheet('initial_condition')
+        self.theta = col_array(sheet, j-1)
 
-        data_len = sheet.nrows-1
-        theta = np.zeros(data_len)
-
-        for i in xrange(data_len):
-            theta[i] = sheet.cell_value(i+1,j-1)
-
-        self.theta = theta
 
+    def _top_boundary(self, theta):
+        """
+        flux at the top boundary, all the net rainfall enters the soil
+        
+        Output:
+            aet: actual evapotranspiration (L/T)
+            Bvalue: flux entering the soil at the top (L/T)
+            runoff: infiltration excess runoff (L/T)
+        """
+        smi = (self.theta[0]-self.soil_par['evap_0'])/(self.soil_par['evap_1']-self.soil_par['evap_0'])
+        if smi<0: smi=0
+        if smi>1: smi=1
+        aet = smi*self.pet_cur
+        Bvalue = self.rain_cur-aet
+        return aet, Bvalue, 0
 
     def _unsat(self):
         """
         top boundary: atmoshpheric
         bottom boundary: gravity drainage
         """
+        theta, aet_day, recharge_day = self._advance_day(1.0*self.theta)
+        self.theta = theta
 
-        thetar = self.soil_par['thetar']
-        thetas = self.soil_par['thetas']
-        alpha = self.soil_par['alpha']
-        n = self.soil_par['n']
-        m = self.soil_par['m']
-        l = self.soil_par['l']
-        Ks = self.soil_par['Ks']
-        nz = self.no_layer
-
-        theta = 1.0*self.theta
+        # store the output of the member
+        self.sm_member[:,self.t+1] = theta
+        self.recharge_member[self.t] = recharge_day
+        self.aet_member[self.t] = aet_day
 
-        #delta_theta = (np.abs(flux)).max()
 
-        iter_dt = max(24,int(np.ceil(self.rain_cur*self.dt_flux*1000/0.15)))
-        self.iter_dt = int(max(iter_dt,0.75*self.iter_dt))
+def _glue_init(model):
+    """
+    initializer of the worker processes of the RICHARDS_1D_GLUE
+    the model, along with its forcing and parameters, is shared by all the
+    ensemble members run by the worker
+    """
+    global _glue_model
+    _glue_model = model
 
-        #if self.t == 56:
-        #    self.iter_dt = int(self.iter_dt*6)
-        #print self.iter_dt
+def _glue_member(ens):
+    """
+    run one ensemble member of the RICHARDS_1D_GLUE in the worker process
+    """
+    return _glue_model._run_member(ens)
 
-        recharge_day = 0
-        aet_day = 0
 
-        # check for time step
-        for i in range(self.iter_dt):
-            dt = self.dt_flux/self.iter_dt
-            #print dt
-            # top boundary value
-            smi = (self.theta[0]-self.soil_par['evap_0'])/(self.soil_par['evap_1']-self.soil_par['evap_0'])
-            if smi<0: smi=0
-            if smi>1: smi=1
-            aet = smi*self.pet_cur
-            Bvalue = self.rain_cur-aet
-
-            K = self.theta2kr(theta,thetar,thetas,m,l,Ks)
-            smc = self.smcf(theta,thetar,thetas,alpha,m,n)
-            psi = self.theta2psi(theta,thetar,thetas,m,n,alpha)
-
-            #flux boundary condition at the top
-            Kmid = np.empty(nz+1)        
-            Kmid[0] = 0
-            for i in range(1,nz):
-                Kmid[i] = 0.5*(K[i]+K[i-1])
-            Kmid[nz] = K[nz-1]
-
-            #Setting the coefficient for the internal nodes
-            A = np.empty(nz)
-            B = np.empty(nz)
-            C = np.empty(nz)
-            D = np.empty(nz)
-            dz = self.dz
-            dz2 = dz**2
+class _CellForcing():
+    """
+    forcing of the cells of the RICHARDS_1D_GRID, taken one time step at a
+    time from the forcing as it was given, (n_time,), (n_time, n_cell) or 
+    (n_time, ny, nx), so that it is not copied for all the cells and time
+    steps. An array mapped from a file (numpy.memmap) is read one time step
+    at a time.
+    """
+    
+    def __init__(self, forcing, cell_shape, cells, divisor=1.0):
+        self.forcing = forcing
+        self.cell_shape = cell_shape
+        self.cells = cells
+        self.divisor = divisor
+    
+    def __len__(self):
+        return len(self.forcing)
+    
+    def __getitem__(self, t):
+        """
+        forcing of the cells at the time step t, (n_cell,)
+        """
+        value = np.asarray(self.forcing[t], dtype=float)
+        value = value.reshape(value.shape+(1,)*(len(self.cell_shape)-value.ndim))
+        return np.broadcast_to(value, self.cell_shape).ravel()[self.cells]/self.divisor
+    
+    def __truediv__(self, value):
+        # the conversion of the units, see _set_forcing
+        return _CellForcing(self.forcing, self.cell_shape, self.cells, 
+                            self.divisor*value)
+    __div__ = __truediv__
 
-            for i in range(nz):
-                A[i] = -(Kmid[i]/dz2)
-                B[i] = smc[i]/dt+(Kmid[i+1]+Kmid[i])/dz2
-                C[i] = A[i]
-                D[i] = smc[i]*psi[i]/dt-(Kmid[i+1]-Kmid[i])/dz
-            # setting the coefficient for the top bc (flux boundary)
-            i = 0
-            A[0] = 0
-            B[0] = smc[i]/dt+(Kmid[1])/dz2
-            D[0] = smc[i]*psi[i]/dt+(Bvalue-Kmid[1])/dz
-
-            # setting the coefficient for the bottom bc: gravity drainage
-            B[nz-1] = smc[nz-1]/dt+(Kmid[nz])/dz2
-            C[nz-1] = 0
-            D[nz-1] = smc[nz-1]*psi[nz-1]/dt-(Kmid[nz]-Kmid[nz-1])/dz
-
-            # Solving using the thomas algorithm
-            beta = np.empty(nz)
-            gamma = np.empty(nz)
-            u = np.empty(nz)
-            beta[0] = B[0]
-            gamma[0] = D[0]/beta[0]
-            for i in range(1,nz):
-                beta[i] = B[i]-(A[i]*C[i-1])/(beta[i-1])
-                gamma[i] = (D[i]-A[i]*gamma[i-1])/(beta[i])
-
-            u[nz-1] = gamma[nz-1]
-            for i in range(nz-2,-1,-1):
-                u[i] = gamma[i]-(C[i]*u[i+1])/beta[i]
-
-            # flux computation between nodes
-            J = np.empty(nz+1)
-            for i in range(1,nz):
-                J[i] = Kmid[i]*(1-(u[i]-u[i-1])/dz)
-            J[0] = Bvalue
-            J[nz] = Kmid[nz]
-
-            J[nz] = J[nz]
-            # flux updating
-            flux = np.diff(J)*dt/dz
-            theta = theta - flux
-
-            theta[theta>thetas] = 0.99*thetas
-            theta[theta<thetar] = 1.01*thetar
 
-            aet_day += aet*dt 
-            recharge_day += J[nz]*dt
+class RICHARDS_1D_GRID(RICHARDS_1D):
+    """
+    This is the gridded version of the RICHARDS_1D.
+    It simulates many independent soil columns (cells), e.g. the pixels of
+    a catchment, each with its own soil hydraulic parameters and forcing.
+    
+    All the columns of a tile are advanced together as (n_cell, nz) arrays,
+    the tiles bound the memory used by the solver. The forcing is expanded
+    to the cells one time step at a time. The output of all the cells is
+    written in one netcdf file.
+    
+    Example:
+        grid = RICHARDS_1D_GRID(rain=rain, pet=pet, soil_par=soil_par, 
+                                no_layer=40, dz=0.05, theta_0=0.2, 
+                                ofile_name='grid.nc')
+    """
+    solver = 'vectorized'
+    output_buffer = 1
+    tile_size = 1000
+    
+    def __init__(self, **kwargs):
+        """
+        Input:
+            rain, pet: forcing (L), of shape (n_time,) when it is the same
+            for all the cells, (n_time, n_cell), or (n_time, ny, nx). They
+            are kept as given and expanded to the cells one time step at a
+            time, so a numpy.memmap of the forcing is read one time step at
+            a time
+            soil_par: dict of the soil hydraulic parameters, with the keys 
+            thetar, thetas, alpha, n, Ks, l, evap_0 and evap_1. Each of them
+            is either a scalar, an array (n_cell,), or a raster (ny, nx)
+            mask: for rasters, the cells to be simulated (default, the 
+            cells where all the soil hydraulic parameters are finite)
+            theta_0: initial soil moisture, a scalar, one per layer (nz,),
+            one per cell (n_cell,) or (ny, nx), or one per cell and layer 
+            (n_cell, nz) or (ny, nx, nz)
+            tile_size: no. of cells advanced together (default 1000)
+            year, doy, forcing_units, no_layer, dz, dt_flux, ofile_name,
+            output, run: see RICHARDS_1D
+            output_backend, output_buffer (default 1), output_dtype, 
+            output_complevel: writing of the output file, see RICHARDS_1D
+            spinup_days, spinup_start, spinup_tol, spinup_max_cycles: 
+            spin-up of all the cells together, see RICHARDS_1D
+            profile, profile_output: profiling of the run, see RICHARDS_1D
+        """
+        self.tile_size = kwargs.get('tile_size', self.tile_size)
+        RICHARDS_1D.__init__(self, None, **kwargs)
+    
+    def _set_input(self, **kwargs):
+        """
+        set the forcing and parameters of all the cells
+        """
+        for key in ['rain', 'pet', 'soil_par', 'dz', 'theta_0']:
+            if key not in kwargs:
+                raise ValueError('%s should be given to the RICHARDS_1D_GRID'%key)
+        if self.solver != 'vectorized' or self.dt_control != 'fixed':
+            raise ValueError("The RICHARDS_1D_GRID supports only the solver "
+                             "'vectorized' with the dt_control 'fixed'")
+        if self.vg_table:
+            # each cell has its own parameters
+            raise ValueError('The vg_table is not available for the RICHARDS_1D_GRID')
+        
+        self._set_grid(kwargs['dz'], kwargs.get('no_layer', None))
+        self.dt_flux = kwargs.get('dt_flux', 86400.0)
+        nz = self.no_layer
+        
+        # shape of the cells, either (n_cell,) or the raster (ny, nx)
+        soil_par = dict(kwargs['soil_par'])
+        rain = np.asarray(kwargs['rain'])
+        pet = np.asarray(kwargs['pet'])
+        n_time = rain.shape[0]
+        if pet.shape[0] != n_time:
+            raise ValueError('The rain and pet should be of the same length')
+        cell_shape = np.broadcast(*([np.asarray(par) for par in soil_par.values()]
+                                  + [rain[0], pet[0]])).shape
+        if len(cell_shape) == 2:
+            self.grid_shape = cell_shape
+            mask = kwargs.get('mask', None)
+            if mask is None:
+                mask = np.ones(cell_shape, dtype=bool)
+                for par in soil_par.values():
+                    mask &= np.isfinite(par)
+            self.cells = np.flatnonzero(mask)
+        elif len(cell_shape) <= 1:
+            self.grid_shape = None
+            self.cells = np.arange(int(np.prod(cell_shape)))
+        else:
+            raise ValueError('The soil_par and forcing should be given either per cell or as raster')
+        self.n_cell = len(self.cells)
+        
+        # soil hydraulic parameters of the cells
+        for key in soil_par:
+            soil_par[key] = np.broadcast_to(np.asarray(soil_par[key], dtype=float),
+                                            cell_shape).ravel()[self.cells]
+        soil_par['m'] = 1-1/soil_par['n']
+        self.soil_par = soil_par
+        
+        # forcing of the cells, (n_cell,) at each time step
+        rain = _CellForcing(rain, cell_shape, self.cells)
+        pet = _CellForcing(pet, cell_shape, self.cells)
+        self.final_time = n_time*self.dt_flux
+        year = kwargs.get('year', np.zeros(n_time))
+        doy = kwargs.get('doy', np.arange(1, n_time+1))
+        self.forcing_units = {'rain':'m', 'pet':'m'}
+        self.forcing_units.update(kwargs.get('forcing_units', {}))
+        self._set_forcing(np.asarray(year, dtype=float), 
+                          np.asarray(doy, dtype=float), rain, pet)
+        
+        # initial condition, (n_cell, nz)
+        theta_0 = np.asarray(kwargs['theta_0'], dtype=float)
+        if theta_0.shape == (self.n_cell, nz):
+            self.theta = 1.0*theta_0
+        else:
+            if theta_0.shape == cell_shape and theta_0.shape != (nz,):
+                theta_0 = theta_0[...,np.newaxis]
+            theta_0 = np.broadcast_to(theta_0, cell_shape+(nz,))
+            self.theta = theta_0.reshape(-1,nz)[self.cells]
+        self.ofile_name = kwargs.get('ofile_name', None)
+
+    def _load_state(self):
+        """
+        set the state from the checkpoint, and the variables of each cell
+        """
+        RICHARDS_1D._load_state(self)
+        if np.ndim(self.iter_dt) == 0:
+            # not given by the checkpoint
+            self.iter_dt = np.ones(self.n_cell, dtype=int)
+        self.aet_day = np.zeros(self.n_cell)
+        self.recharge_day = np.zeros(self.n_cell)
+        self.runoff_day = np.zeros(self.n_cell)
+    
+    def _spinup_step(self):
+        """
+        advance all the cells by one time step of the spin-up, without 
+        output
+        """
+        for start in range(0, self.n_cell, self.tile_size):
+            self._advance_tile(slice(start, start+self.tile_size))
 
-        self.theta = theta
+    def _to_grid(self, var):
+        """
+        put the values of the cells (n_cell, ...) on the output grid, the 
+        cells which are not simulated are filled with nan
+        """
+        if self.grid_shape is None:
+            return var
+        out = np.empty((int(np.prod(self.grid_shape)),)+var.shape[1:])
+        out[:] = np.nan
+        out[self.cells] = var
+        return out.reshape(self.grid_shape+var.shape[1:])
+    
+    def _init_output(self):
+        """
+        open the netcdf file for writting
+        """
+        file = self._open_output()
+        file.setncattr('title', 'output of the model ambhas.richards_grid')
+        now = datetime.datetime.now()
+        file.setncattr('description', 'The model was run at %s'%(now.ctime()))
+        file.createDimension('time', self.max_t+1)
+        if self.grid_shape is None:
+            file.createDimension('cell', self.n_cell)
+            cell_dims = 'cell',
+        else:
+            file.createDimension('y', self.grid_shape[0])
+            file.createDimension('x', self.grid_shape[1])
+            cell_dims = 'y', 'x'
+        file.createDimension('depth', self.no_layer)
+        
+        # depth
+        varDims = 'depth',
+        depth = file.createVariable('depth', varDims, units='m')
+        depth[:] = self.z_node
+        
+        # time (year and doy)
+        varDims = 'time',
+        self.nc_year = file.createVariable('year', varDims)
+        self.nc_doy = file.createVariable('doy', varDims)
+        self.nc_year[:self.max_t] = self.year[:self.max_t]
+        self.nc_doy[:self.max_t] = self.doy[:self.max_t]
+        
+        # soil moisture
+        varDims = ('time',) + cell_dims + ('depth',)
+        self.nc_sm = file.createVariable('sm', varDims, units='v/v')
+        self.nc_sm.put(0, self._to_grid(self.theta))
+        
+        # rainfall, recharge and aet
+        varDims = ('time',) + cell_dims
+        self.nc_rain = file.createVariable('rain', varDims, units='mm')
+        self.nc_aet = file.createVariable('aet', varDims, units='mm')
+        self.nc_recharge = file.createVariable('recharge', varDims, units='mm')
+        
+        # soil_par
+        varDims = cell_dims
+        for key in ['thetar', 'thetas', 'alpha', 'n', 'Ks', 'l']:
+            var = file.createVariable(key, varDims)
+            var[:] = self._to_grid(self.soil_par[key])
+        
+        self.nc_file = file
 
+    def _unsat(self):
+        """
+        advance all the cells over one time step, tile by tile
+        top boundary: atmoshpheric
+        bottom boundary: gravity drainage
+        """
+        for start in range(0, self.n_cell, self.tile_size):
+            self._advance_tile(slice(start, start+self.tile_size))
+        if self.profiler is not None:
+            self.profiler.record('n_sub', self.iter_dt.mean())
+        
         # write the output
-        self.nc_year[self.t] = (self.cur_year)
-        self.nc_doy[self.t] = (self.cur_doy)
-        self.nc_sm[self.ens,:,self.t+1] = theta
-        self.nc_recharge[self.ens,self.t] = recharge_day
-        self.nc_aet[self.ens,self.t] = aet_day
-        self.nc_rain[self.t] = self.rain_cur
-
-        # print progress
-        if self.t == int(0.25*self.max_t):
-            output_message = '25 % completed'
-            self._colored_output(output_message, 32)
-
-        elif self.t == int(0.5*self.max_t):
-            output_message = '50 % completed'
-            self._colored_output(output_message, 32)
+        if self.nc_file is not None:
+            self._write_output()
+    
+    def _write_output(self):
+        """
+        write the output of the current time step
+        """
+        self.nc_sm.put(self.t+1, self._to_grid(self.theta))
+        self.nc_rain.put(self.t, self._to_grid(self.rain_cur))
+        self.nc_aet.put(self.t, self._to_grid(self.aet_day))
+        self.nc_recharge.put(self.t, self._to_grid(self.recharge_day))
+
+    def _advance_tile(self, tile):
+        """
+        advance the cells of the tile over one time step of the forcing 
+        (dt_flux) using sub-steps
+        
+        the no. of sub-steps of each cell is given by its rainfall as in the
+        RICHARDS_1D, the cells which need fewer sub-steps are left out of 
+        the last sub-steps of the tile
+        """
+        theta = self.theta[tile]
+        n_tile = theta.shape[0]
+        par = {}
+        for key in ['thetar', 'thetas', 'alpha', 'm', 'n', 'l', 'Ks',
+                    'evap_0', 'evap_1']:
+            par[key] = self.soil_par[key][tile]
+        rain_cur = self.rain_cur[tile]
+        pet_cur = self.pet_cur[tile]
+        
+        # aet is limited by the soil moisture at the start of the time step
+        smi = (theta[:,0]-par['evap_0'])/(par['evap_1']-par['evap_0'])
+        aet = np.clip(smi, 0, 1)*pet_cur
+        net_rain = rain_cur-aet
+        
+        iter_dt = np.maximum(24, np.ceil(rain_cur*self.dt_flux*1000/0.15))
+        iter_dt = np.maximum(iter_dt, 0.75*self.iter_dt[tile]).astype(int)
+        self.iter_dt[tile] = iter_dt
+        dt = self.dt_flux/iter_dt
+        
+        aet_day = aet*dt*iter_dt
+        recharge_day = np.zeros(n_tile)
+        runoff_day = np.zeros(n_tile)
+        
+        for i in range(iter_dt.max()):
+            active = np.flatnonzero(i<iter_dt)
+            if len(active) < n_tile:
+                cur = active
+                theta_cur = theta[cur]
+            else:
+                cur = slice(None)
+                theta_cur = theta
+            
+            # top boundary
+            infiltration = net_rain[cur]*(1-self._top_theta(theta_cur)/
+                                          par['thetas'][cur])
+            Bvalue = np.where(net_rain[cur]>0, infiltration, net_rain[cur])
+            
+            theta_cur, J = self._richards_step_vec(theta_cur, Bvalue, 
+                                dt[cur,np.newaxis], par['thetar'][cur,np.newaxis],
+                                par['thetas'][cur,np.newaxis], 
+                                par['alpha'][cur,np.newaxis], par['m'][cur,np.newaxis],
+                                par['n'][cur,np.newaxis], par['l'][cur,np.newaxis],
+                                par['Ks'][cur,np.newaxis])
+            theta[cur] = theta_cur
+            recharge_day[cur] += J[:,-1]*dt[cur]
+            runoff_day[cur] += (net_rain[cur]-Bvalue)*dt[cur]
+        
+        if np.any(np.isnan(theta)):
+            raise ValueError('The soil moisture became nan at the time step %d'%self.t)
+        
+        self.theta[tile] = theta
+        self.aet_day[tile] = aet_day
+        self.recharge_day[tile] = recharge_day
+        self.runoff_day[tile] = runoff_day
 
-        elif self.t == int(0.75*self.max_t):
-            output_message = '75 % completed'
-            self._colored_output(output_message, 32)
 
-        elif self.t == self.max_t-1:
-            output_message = '100 % completed'
-            self._colored_output(output_message, 32)
-        #print self.t
-        
 if __name__=='__main__':
     ofile_name = '/home/tomers/svn/ambhas/examples/tmp2.nc'
     ind = {}
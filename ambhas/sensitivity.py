@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 02:14:08 2026
+
+@author: Sat Kumar Tomer
+@website: www.ambhas.com
+@email: satkumartomer@gmail.com
+
+Global sensitivity analysis of the soil hydraulic parameters (thetar,
+thetas, alpha, n, Ks, l) of the RICHARDS_1D.
+
+The parameter sets of a design are run as the cells of a RICHARDS_1D_GRID,
+so that a batch of sets is advanced together with the vectorized solver
+against one forcing held in memory, and the batches are run in parallel by
+a pool of processes. The outputs of each set are reduced during the run, so
+that only one value per set and output is kept.
+
+functions:
+    saltelli_sample:    design for the Sobol indices
+    sobol_indices:      first order and total Sobol indices
+    morris_sample:      design of the trajectories of the Morris method
+    morris_indices:     mean, mean of the absolute and standard deviation
+                        of the elementary effects
+    evaluate:           run the model for all the parameter sets of a design
+
+outputs of evaluate:
+    recharge:       total recharge (m)
+    aet:            total actual evapotranspiration (m)
+    runoff:         total runoff (m)
+    root_zone_sm:   mean soil moisture of the root zone (v/v), averaged over
+                    the layers above root_depth and over time
+
+The parameters listed in log_keys (default Ks) are sampled uniformly in log
+space. The base samples of the Saltelli design are a scrambled Sobol
+sequence when scipy.stats.qmc is available, otherwise random.
+
+Ref:
+Saltelli, A., Annoni, P., Azzini, I., Campolongo, F., Ratto, M., and
+Tarantola, S. (2010), Variance based sensitivity analysis of model output.
+Design and estimator for the total sensitivity index, Computer Physics
+Communications, 181(2), 259-270.
+Morris, M. D. (1991), Factorial sampling plans for preliminary computational
+experiments, Technometrics, 33(2), 161-174.
+Campolongo, F., Cariboni, J., and Saltelli, A. (2007), An effective
+screening design for sensitivity analysis of large models, Environmental
+Modelling & Software, 22(10), 1509-1518.
+
+Example:
+    from ambhas import synthetic
+    kwargs = synthetic.model_input(n_day=365, no_layer=40, seed=0)
+    kwargs.pop('soil_par')
+    bounds = synthetic.soil_par_range('loam')
+    par = saltelli_sample(bounds, 1024, seed=0)
+    y = evaluate(par, n_jobs=4, **kwargs)
+    si = sobol_indices(y['recharge'], len(bounds))
+"""
+
+from __future__ import division
+import multiprocessing
+import numpy as np
+from ambhas.richards import RICHARDS_1D_GRID
+from ambhas.synthetic import _psi2theta
+try:
+    from scipy.stats import qmc
+except ImportError:
+    qmc = None
+
+PAR_KEYS = ['thetar', 'thetas', 'alpha', 'n', 'Ks', 'l']
+OUTPUTS = ['recharge', 'aet', 'runoff', 'root_zone_sm']
+
+
+def _keys(bounds):
+    """
+    the parameters of the bounds, in the order of PAR_KEYS
+    """
+    keys = [key for key in PAR_KEYS if key in bounds]
+    keys += sorted(key for key in bounds if key not in PAR_KEYS)
+    return keys
+
+def _scale(unit, bounds, keys, log_keys):
+    """
+    parameters from the unit hypercube (n_run, n_par)
+    """
+    par = {}
+    for i, key in enumerate(keys):
+        low, high = bounds[key]
+        if key in log_keys:
+            par[key] = np.exp(np.log(low) + unit[:,i]*(np.log(high)-np.log(low)))
+        else:
+            par[key] = low + unit[:,i]*(high-low)
+    return par
+
+def _unit(par, bounds, keys, log_keys):
+    """
+    parameters in the unit hypercube (n_run, n_par)
+    """
+    unit = np.empty((len(par[keys[0]]), len(keys)))
+    for i, key in enumerate(keys):
+        low, high = bounds[key]
+        if key in log_keys:
+            unit[:,i] = (np.log(par[key])-np.log(low))/(np.log(high)-np.log(low))
+        else:
+            unit[:,i] = (par[key]-low)/(high-low)
+    return unit
+
+def saltelli_sample(bounds, n, seed=None, log_keys=('Ks',)):
+    """
+    design of Saltelli et al. (2010) for the first order and total Sobol
+    indices, n*(n_par+2) runs: the base samples A and B, and for each
+    parameter A with its column taken from B
+
+    Input:
+        bounds: dict of (min, max) of each parameter, e.g.
+        ambhas.synthetic.soil_par_range
+        n: no. of base samples, a power of 2 for the Sobol sequence
+        seed: seed of the random numbers (default None)
+        log_keys: parameters sampled uniformly in log space
+    Output:
+        par: dict of the parameter sets, arrays of length n*(n_par+2), in
+        the order A, B, AB_1 .. AB_n_par
+    """
+    keys = _keys(bounds)
+    d = len(keys)
+    if qmc is not None:
+        base = qmc.Sobol(2*d, scramble=True, seed=seed).random(n)
+    else:
+        base = np.random.RandomState(seed).uniform(size=(n, 2*d))
+    A = base[:,:d]
+    B = base[:,d:]
+    unit = [A, B]
+    for i in range(d):
+        AB = A.copy()
+        AB[:,i] = B[:,i]
+        unit.append(AB)
+    return _scale(np.vstack(unit), bounds, keys, log_keys)
+
+def sobol_indices(y, n_par, n_boot=0, seed=None):
+    """
+    first order (Saltelli et al., 2010) and total (Jansen) Sobol indices
+
+    Input:
+        y: output of the runs of the saltelli_sample, (n*(n_par+2),) or
+        with more dimensions, e.g. (n*(n_par+2), n_output)
+        n_par: no. of parameters
+        n_boot: no. of bootstrap samples for the confidence intervals
+        (default 0, none)
+        seed: seed of the random numbers of the bootstrap
+    Output:
+        dict of S1 and ST, (n_par,) + y.shape[1:], and with n_boot the 95 %
+        confidence intervals S1_conf and ST_conf
+    """
+    y = np.asarray(y, dtype=float)
+    if y.shape[0]%(n_par+2) != 0:
+        raise ValueError('The length of y should be a multiple of n_par+2')
+    n = y.shape[0]//(n_par+2)
+    y = y.reshape((n_par+2, n)+y.shape[1:])
+
+    def indices(idx):
+        A = y[0][idx]
+        B = y[1][idx]
+        var = np.var(np.concatenate([A, B]), axis=0)
+        S1 = np.empty((n_par,)+A.shape[1:])
+        ST = np.empty((n_par,)+A.shape[1:])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for i in range(n_par):
+                AB = y[2+i][idx]
+                S1[i] = np.mean(B*(AB-A), axis=0)/var
+                ST[i] = 0.5*np.mean((A-AB)**2, axis=0)/var
+        return S1, ST
+
+    S1, ST = indices(slice(None))
+    si = {'S1':S1, 'ST':ST}
+    if n_boot > 0:
+        rng = np.random.RandomState(seed)
+        S1_boot = []
+        ST_boot = []
+        for k in range(n_boot):
+            S1_k, ST_k = indices(rng.randint(n, size=n))
+            S1_boot.append(S1_k)
+            ST_boot.append(ST_k)
+        si['S1_conf'] = 1.96*np.std(S1_boot, axis=0)
+        si['ST_conf'] = 1.96*np.std(ST_boot, axis=0)
+    return si
+
+def morris_sample(bounds, r=10, levels=4, seed=None, log_keys=('Ks',)):
+    """
+    r trajectories of the Morris method, each of n_par+1 points on a grid
+    of levels in the unit hypercube, each point moving one parameter by
+    delta = levels/(2*(levels-1)) from the previous one
+
+    Input:
+        bounds: dict of (min, max) of each parameter
+        r: no. of trajectories
+        levels: no. of levels of the grid (even)
+        seed: seed of the random numbers (default None)
+        log_keys: parameters sampled uniformly in log space
+    Output:
+        par: dict of the parameter sets, arrays of length r*(n_par+1)
+    """
+    keys = _keys(bounds)
+    d = len(keys)
+    rng = np.random.RandomState(seed)
+    delta = levels/(2.0*(levels-1))
+    grid = np.arange(levels)/(levels-1.0)
+    unit = np.empty((r, d+1, d))
+    for j in range(r):
+        x = grid[rng.randint(levels, size=d)]
+        unit[j,0] = x
+        for k, i in enumerate(rng.permutation(d)):
+            x = x.copy()
+            x[i] = x[i]+delta if x[i]+delta <= 1+1e-12 else x[i]-delta
+            unit[j,k+1] = x
+    return _scale(unit.reshape(-1, d), bounds, keys, log_keys)
+
+def morris_indices(par, y, bounds, log_keys=('Ks',)):
+    """
+    statistics of the elementary effects of the Morris method, the effects
+    are computed in the unit hypercube, so they are comparable between the
+    parameters
+
+    Input:
+        par: the parameter sets of the morris_sample
+        y: output of the runs, (r*(n_par+1),) or with more dimensions
+        bounds, log_keys: as given to morris_sample
+    Output:
+        dict of mu, mu_star and sigma, (n_par,) + y.shape[1:]
+    """
+    keys = _keys(bounds)
+    d = len(keys)
+    unit = _unit(par, bounds, keys, log_keys)
+    y = np.asarray(y, dtype=float)
+    if y.shape[0]%(d+1) != 0:
+        raise ValueError('The length of y should be a multiple of n_par+1')
+    r = y.shape[0]//(d+1)
+    unit = unit.reshape(r, d+1, d)
+    y = y.reshape((r, d+1)+y.shape[1:])
+    ee = np.empty((r, d)+y.shape[2:])
+    for j in range(r):
+        step = np.diff(unit[j], axis=0)
+        for k in range(d):
+            i = np.argmax(np.abs(step[k]))
+            ee[j,i] = (y[j,k+1]-y[j,k])/step[k,i]
+    return {'mu':ee.mean(axis=0), 'mu_star':np.abs(ee).mean(axis=0),
+            'sigma':ee.std(axis=0, ddof=1) if r > 1 else np.zeros(ee.shape[1:])}
+
+def _evaluate_batch(args):
+    """
+    run one batch of parameter sets as the cells of a RICHARDS_1D_GRID, and
+    reduce the outputs during the run
+    """
+    soil_par, outputs, root_depth, kwargs = args
+    soil_par = dict(soil_par)
+    if 'evap_0' not in soil_par:
+        soil_par['evap_0'] = _psi2theta(-15, soil_par['thetar'], soil_par['thetas'],
+                                        soil_par['alpha'], soil_par['n'])
+    if 'evap_1' not in soil_par:
+        soil_par['evap_1'] = _psi2theta(-0.33, soil_par['thetar'], soil_par['thetas'],
+                                        soil_par['alpha'], soil_par['n'])
+    n_cell = len(soil_par['thetar'])
+    kwargs = dict(kwargs)
+    kwargs.setdefault('tile_size', n_cell)
+    model = RICHARDS_1D_GRID(soil_par=soil_par, output=False, run=False, **kwargs)
+
+    # weight of the layers of the root zone
+    root = model.dz_layer*(model.z_node <= root_depth)
+    if root.sum() == 0:
+        raise ValueError('The root_depth should include at least one layer')
+    root = root/root.sum()
+
+    total = dict((name, np.zeros(n_cell)) for name in outputs)
+    n_time = 0
+    for state in model.steps():
+        for name in outputs:
+            if name == 'root_zone_sm':
+                total[name] += np.dot(state['theta'], root)
+            else:
+                total[name] += state[name]
+        n_time += 1
+    if 'root_zone_sm' in total:
+        total['root_zone_sm'] /= max(n_time, 1)
+    return total
+
+def evaluate(par, outputs=('recharge', 'aet', 'root_zone_sm'), root_depth=0.5,
+             batch_size=1000, n_jobs=1, **kwargs):
+    """
+    run the model for all the parameter sets, in batches of parameter sets
+    advanced together by the vectorized solver
+
+    Input:
+        par: dict of the parameter sets, e.g. from the saltelli_sample, the
+        soil moisture limiting the evaporation (evap_0 and evap_1) is
+        computed from the parameters when not given
+        outputs: list of the outputs, see OUTPUTS
+        root_depth: depth of the root zone (m) of root_zone_sm
+        batch_size: no. of parameter sets of a batch
+        n_jobs: no. of processes, the batches are run in parallel when
+        greater than 1
+        **kwargs: forcing, grid and initial condition of RICHARDS_1D_GRID
+        (rain, pet, no_layer, dz, theta_0, etc.), e.g. from
+        ambhas.synthetic.model_input, the soil_par is taken from par
+    Output:
+        y: dict of the outputs, arrays of the length of the parameter sets
+    """
+    for name in outputs:
+        if name not in OUTPUTS:
+            raise ValueError('The outputs should be among %s'%', '.join(OUTPUTS))
+    if 'soil_par' in kwargs or 'ofile_name' in kwargs:
+        raise ValueError('The soil_par is given by par, and there is no output file')
+    n_run = len(par[list(par.keys())[0]])
+    batches = []
+    for start in range(0, n_run, batch_size):
+        soil_par = dict((key, np.asarray(par[key], dtype=float)[start:start+batch_size])
+                        for key in par)
+        batches.append((soil_par, list(outputs), root_depth, kwargs))
+
+    if n_jobs > 1 and len(batches) > 1:
+        pool = multiprocessing.Pool(min(n_jobs, len(batches)))
+        try:
+            results = pool.map(_evaluate_batch, batches, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_evaluate_batch(batch) for batch in batches]
+
+    y = {}
+    for name in outputs:
+        y[name] = np.concatenate([result[name] for result in results])
+    return y
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 23:48:12 2026
+
+@author: Sat Kumar Tomer
+@website: www.ambhas.com
+@email: satkumartomer@gmail.com
+
+Synthetic forcing and soil for running the RICHARDS_1D, RICHARDS_1D_ENKF and
+RICHARDS_1D_GLUE without an input file, e.g. for the benchmarks and tests.
+
+The daily rain is generated by a first order Markov chain of the wet days,
+with gamma distributed amounts on the wet days, and the pet by an annual
+cycle with a small noise. The parameters of each regime are monthly:
+    monsoon: about 1000 mm/year, mostly from June to October, as in the
+    semi-arid south India (e.g. the maddur and berambadi watersheds)
+    arid: about 100 mm/year in a few storms, with a high pet
+
+The soil hydraulic parameters are the mean van Genuchten parameters of the
+textures given by Carsel and Parrish (1988).
+
+functions:
+    forcing:            synthetic rain and pet
+    soil_par:           soil hydraulic parameters of a texture
+    soil_par_range:     range of the parameters around those of a texture
+    surface_sm:         synthetic measured surface soil moisture
+    model_input:        keyword arguments of the models for the synthetic
+                        forcing and soil
+
+Ref:
+Carsel, R. F., and Parrish, R. S. (1988), Developing joint probability
+distributions of soil water retention characteristics, Water Resources
+Research, 24(5), 755-769.
+
+Example:
+    from ambhas.richards import RICHARDS_1D
+    kwargs = model_input(n_day=365, no_layer=40, regime='monsoon', seed=0)
+    model = RICHARDS_1D(**kwargs)
+"""
+
+from __future__ import division
+import numpy as np
+
+# monthly probability of a wet day after a dry day (p01) and after a wet day
+# (p11), mean rain on a wet day (mm), and mean pet (mm/day)
+REGIMES = {
+    'monsoon': {'p01': [0.02, 0.02, 0.04, 0.10, 0.20, 0.35, 0.45, 0.45, 0.40, 0.35, 0.15, 0.04],
+                'p11': [0.20, 0.20, 0.30, 0.40, 0.50, 0.65, 0.70, 0.70, 0.65, 0.60, 0.45, 0.25],
+                'rain': [4.0, 4.0, 6.0, 9.0, 11.0, 10.0, 9.0, 9.0, 12.0, 12.0, 9.0, 5.0],
+                'pet': [4.0, 5.0, 6.0, 6.5, 6.0, 4.5, 4.0, 4.0, 4.0, 3.8, 3.6, 3.6]},
+    'arid': {'p01': [0.02, 0.02, 0.03, 0.03, 0.02, 0.01, 0.01, 0.01, 0.02, 0.03, 0.03, 0.02],
+             'p11': [0.15, 0.15, 0.20, 0.20, 0.15, 0.10, 0.10, 0.10, 0.15, 0.20, 0.20, 0.15],
+             'rain': [10.0, 10.0, 12.0, 15.0, 12.0, 8.0, 8.0, 8.0, 12.0, 15.0, 12.0, 10.0],
+             'pet': [4.0, 5.0, 6.5, 8.0, 9.5, 10.0, 10.0, 9.5, 8.5, 6.5, 5.0, 4.0]}}
+
+# thetar, thetas, alpha (1/m), n, Ks (m/s) and l
+TEXTURES = {
+    'sand':       [0.045, 0.43, 14.5, 2.68, 8.25e-5, 0.5],
+    'loamy sand': [0.057, 0.41, 12.4, 2.28, 4.05e-5, 0.5],
+    'sandy loam': [0.065, 0.41, 7.5, 1.89, 1.23e-5, 0.5],
+    'loam':       [0.078, 0.43, 3.6, 1.56, 2.89e-6, 0.5],
+    'silt loam':  [0.067, 0.45, 2.0, 1.41, 1.25e-6, 0.5],
+    'clay loam':  [0.095, 0.41, 1.9, 1.31, 7.22e-7, 0.5]}
+
+PAR_KEYS = ['thetar', 'thetas', 'alpha', 'n', 'Ks', 'l']
+
+
+def forcing(n_day, regime='monsoon', seed=None, start_year=2001):
+    """
+    synthetic daily rain and pet
+
+    Input:
+        n_day: no. of days
+        regime: 'monsoon' (default) or 'arid'
+        seed: seed of the random numbers (default None)
+        start_year: year of the first day (default 2001)
+    Output:
+        dict of year, doy, rain (m) and pet (m), arrays of length n_day
+    """
+    if regime not in REGIMES:
+        raise ValueError('The regime should be one of %s'%', '.join(sorted(REGIMES)))
+    par = REGIMES[regime]
+    rng = np.random.RandomState(seed)
+
+    # calendar of 365 days a year
+    day = np.arange(n_day)
+    year = start_year + day//365
+    doy = day%365 + 1
+    month = np.minimum((doy-1)*12//365, 11)
+
+    # wet days, and the rain on them with a gamma distribution of shape 0.7
+    p01 = np.asarray(par['p01'])[month]
+    p11 = np.asarray(par['p11'])[month]
+    u = rng.uniform(size=n_day)
+    wet = np.zeros(n_day, dtype=bool)
+    for i in range(1, n_day):
+        wet[i] = u[i] < (p11[i] if wet[i-1] else p01[i])
+    amount = rng.gamma(0.7, np.asarray(par['rain'])[month]/0.7)
+    rain = np.where(wet, amount, 0.0)
+
+    # pet is smooth over the year, and smaller on the wet days
+    pet_mean = np.interp(doy, 15.2+30.4*np.arange(-1, 13),
+                         np.r_[par['pet'][-1], par['pet'], par['pet'][0]])
+    pet = pet_mean*(1+0.1*rng.normal(size=n_day))*np.where(wet, 0.6, 1.0)
+    pet = np.maximum(pet, 0.1)
+
+    return {'year':year.astype(float), 'doy':doy.astype(float),
+            'rain':rain/1000.0, 'pet':pet/1000.0}
+
+def _psi2theta(psi, thetar, thetas, alpha, n):
+    """
+    van Genuchten soil moisture at the pressure head psi (< 0)
+    """
+    m = 1-1/n
+    return thetar + (thetas-thetar)*(1+abs(alpha*psi)**n)**-m
+
+def soil_par(texture='loam'):
+    """
+    soil hydraulic parameters of a texture
+
+    Input:
+        texture: one of the keys of TEXTURES (default 'loam')
+    Output:
+        dict of thetar, thetas, alpha, n, Ks, l, and the soil moisture
+        limiting the evaporation, evap_0 and evap_1, computed as in the
+        RICHARDS_1D_GLUE
+    """
+    if texture not in TEXTURES:
+        raise ValueError('The texture should be one of %s'%', '.join(sorted(TEXTURES)))
+    par = dict(zip(PAR_KEYS, TEXTURES[texture]))
+    par['evap_1'] = _psi2theta(-0.33, par['thetar'], par['thetas'], par['alpha'], par['n'])
+    par['evap_0'] = _psi2theta(-15, par['thetar'], par['thetas'], par['alpha'], par['n'])
+    return par
+
+def soil_par_range(texture='loam', spread=0.25):
+    """
+    range of the soil hydraulic parameters around those of a texture, for
+    the ensemble of the RICHARDS_1D_ENKF and RICHARDS_1D_GLUE
+
+    Input:
+        texture: one of the keys of TEXTURES (default 'loam')
+        spread: relative half width of the range (default 0.25), the range
+        of Ks is wider, a factor (1+spread)**4 on either side
+    Output:
+        dict of (min, max) of each parameter
+    """
+    par = soil_par(texture)
+    par_range = {}
+    for key in PAR_KEYS:
+        if key == 'Ks':
+            factor = (1+spread)**4
+            par_range[key] = (par[key]/factor, par[key]*factor)
+        else:
+            par_range[key] = (par[key]*(1-spread), par[key]*(1+spread))
+    # keep the n above 1
+    par_range['n'] = (max(par_range['n'][0], 1.05), par_range['n'][1])
+    return par_range
+
+def surface_sm(rain, par, std=0.01, seed=None):
+    """
+    synthetic measured surface soil moisture, from the antecedent
+    precipitation index (api) with a decay of 0.85 per day, mapped between
+    the wilting point (evap_0) and 0.9 times the saturation
+
+    Input:
+        rain: daily rain (m)
+        par: soil hydraulic parameters, see soil_par
+        std: standard deviation of the error of the measurements
+        seed: seed of the random numbers (default None)
+    Output:
+        sm: surface soil moisture at the end of each day
+    """
+    rng = np.random.RandomState(seed)
+    api = np.zeros(len(rain))
+    for i in range(len(rain)):
+        api[i] = 0.85*api[i-1]*(i > 0) + 1000*rain[i]
+    sm = par['evap_0'] + (0.9*par['thetas']-par['evap_0'])*(1-np.exp(-api/20.0))
+    return sm + std*rng.normal(size=len(rain))
+
+def model_input(n_day=365, no_layer=40, depth=2.0, regime='monsoon',
+                texture='loam', seed=None, ensemble=False, spread=0.25):
+    """
+    keyword arguments of the RICHARDS_1D, RICHARDS_1D_ENKF and
+    RICHARDS_1D_GLUE for the synthetic forcing and soil, with a uniform grid
+
+    Input:
+        n_day: no. of days
+        no_layer: no. of soil layers
+        depth: depth of the soil column (m)
+        regime: regime of the forcing, see forcing
+        texture: texture of the soil, see soil_par
+        seed: seed of the random numbers of the forcing
+        ensemble: if True, soil_par_range and meas_sm are given for the 
+        ensemble models, otherwise soil_par
+        spread: see soil_par_range
+    Output:
+        dict of the keyword arguments
+    """
+    kwargs = forcing(n_day, regime, seed)
+    kwargs['no_layer'] = no_layer
+    kwargs['dz'] = depth/no_layer
+    par = soil_par(texture)
+    # the initial soil moisture is midway between wilting and field capacity
+    kwargs['theta_0'] = 0.5*(par['evap_0']+par['evap_1'])
+    if ensemble:
+        kwargs['soil_par_range'] = soil_par_range(texture, spread)
+        kwargs['meas_sm'] = surface_sm(kwargs['rain'], par, seed=seed)
+    else:
+        kwargs['soil_par'] = par
+    return kwargs
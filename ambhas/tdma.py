@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 10:12:31 2026
+
+@author: Sat Kumar Tomer
+@website: www.ambhas.com
+@email: satkumartomer@gmail.com
+
+Tridiagonal matrix algorithm (TDMA) for the unsaturated zone models.
+
+The system is given by its three diagonals, in the same convention as used
+in the RICHARDS_1D and CSGLM models:
+    a[i]*x[i-1] + b[i]*x[i] + c[i]*x[i+1] = d[i]
+a[0] and c[-1] are not used.
+
+functions:
+    thomas:         Thomas algorithm, vectorized over the leading axes
+    solve_tridiag:  solve the system, using LAPACK for a single column
+    tridiag_dot:    product of a tridiagonal matrix with a vector
+"""
+
+from __future__ import division
+import numpy as np
+
+try:
+    from scipy.linalg import solve_banded
+except ImportError:
+    solve_banded = None
+
+
+def thomas(a, b, c, d):
+    """
+    Thomas algorithm
+    the sweep runs along the last axis, and all the leading axes
+    (e.g. ensemble members or grid cells) are solved together
+
+    Input:
+        a: sub diagonal, shape (..., n)
+        b: main diagonal, shape (..., n)
+        c: super diagonal, shape (..., n)
+        d: right hand side, shape (..., n)
+    Output:
+        x: solution, shape (..., n)
+    """
+    # the sweep axis is moved first, so that each step of the sweep works 
+    # on contiguous memory
+    a, b, c, d = [np.ascontiguousarray(np.moveaxis(var, -1, 0)) for var in
+                  np.broadcast_arrays(a, b, c, d)]
+    n = b.shape[0]
+    beta = np.empty(b.shape)
+    gamma = np.empty(b.shape)
+    x = np.empty(b.shape)
+
+    # forward sweep
+    beta[0] = b[0]
+    gamma[0] = d[0]/beta[0]
+    for i in range(1,n):
+        beta[i] = b[i]-(a[i]*c[i-1])/beta[i-1]
+        gamma[i] = (d[i]-a[i]*gamma[i-1])/beta[i]
+
+    # backward substitution
+    x[n-1] = gamma[n-1]
+    for i in range(n-2,-1,-1):
+        x[i] = gamma[i]-(c[i]*x[i+1])/beta[i]
+
+    return np.moveaxis(x, 0, -1)
+
+def solve_tridiag(a, b, c, d):
+    """
+    solve the tridiagonal system
+    a single system (1-D input) is solved by the LAPACK banded solver,
+    when scipy is available, otherwise the Thomas algorithm is used
+
+    Input:
+        a: sub diagonal
+        b: main diagonal
+        c: super diagonal
+        d: right hand side
+    Output:
+        x: solution
+    """
+    if np.ndim(d) == 1 and solve_banded is not None:
+        n = len(d)
+        ab = np.zeros((3,n))
+        ab[0,1:] = c[:-1]
+        ab[1,:] = b
+        ab[2,:-1] = a[1:]
+        return solve_banded((1,1), ab, d, overwrite_ab=True, check_finite=False)
+    else:
+        return thomas(a, b, c, d)
+
+def tridiag_dot(a, b, c, x):
+    """
+    product of the tridiagonal matrix with x, along the last axis
+
+    Input:
+        a: sub diagonal
+        b: main diagonal
+        c: super diagonal
+        x: vector, shape (..., n)
+    Output:
+        y: product
+    """
+    y = b*x
+    y[...,1:] += a[...,1:]*x[...,:-1]
+    y[...,:-1] += c[...,:-1]*x[...,1:]
+    return y
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:06:31 2026
+
+@author: Sat Kumar Tomer
+@website: www.ambhas.com
+@email: satkumartomer@gmail.com
+
+Tabulated van Genuchten functions for the RICHARDS_1D models.
+
+The hydraulic conductivity (K), the specific moisture capacity (smc) and the
+pressure head (psi) are written as functions of the effective saturation
+(Se) which depend only on the shape parameters (m, n, l):
+    K = Ks*kr(Se)
+    smc = 1e-2 + alpha*(thetas-thetar)*m*n*c(Se)
+    psi = -h(Se)/alpha
+kr, c and h are tabulated once per (m, n, l), and the tables are scaled to
+the parameter set (thetar, thetas, alpha, Ks), which is cheap, so that a
+change of these parameters does not need a new table.
+
+The table is made on the odds of the saturation
+    y = Se/(1-Se) = (theta-thetar)/(thetas-theta)
+which goes as Se at the dry end and as 1/(1-Se) at the wet end. The nodes
+are uniform within each binary octave of y, from 2**-n_octave to 2**n_octave,
+with n_div intervals per octave, so the spacing follows Se at the dry end,
+where psi is steep, and 1-Se at the wet end, where the functions have an
+infinite slope. The index of the interval and the position within it are the
+bits of the exponent and of the mantissa of y, so the look up needs no power
+or logarithm. The values are linearly interpolated in y, which keeps K and
+psi monotone.
+
+n_div is doubled until the relative error of kr, c and h at the mid points
+of the intervals, where the error of the linear interpolation is largest, is
+less than tol. With the default n_octave (20) the table covers Se from
+about 1e-6, the limit of RICHARDS_1D.theta2psi, to 1-1e-6, and Se outside
+this range is taken at the end of the table (the solvers keep theta between
+1.01*thetar and 0.99*thetas). At Se<=0, where the exact K and smc are the
+ones of Se=1e-4, the table gives the ones of its first node.
+
+Example:
+    cache = VGTableCache(maxsize=8)
+    table = cache.get(thetar, thetas, alpha, m, n, l, Ks)
+    K, smc, psi = table(theta)
+"""
+
+from __future__ import division
+import numpy as np
+from collections import OrderedDict
+
+
+def vg_kr(Se, m, l):
+    """
+    relative conductivity, limited as in RICHARDS_1D.theta2kr
+    """
+    Se = np.where(Se<=0, 1e-4, np.minimum(Se, 1.0))
+    return (pow(Se,l))*pow(1-pow(1-pow(Se,1/m),m),2)
+
+def vg_c(Se, m):
+    """
+    specific moisture capacity without the constant and the scaling,
+    limited as in RICHARDS_1D.smcf
+    """
+    Se = np.where(Se<=0, 1e-4, np.minimum(Se, 1.0))
+    return pow(Se,1/m+1)*pow(pow(Se,-1/m)-1,m)
+
+def vg_h(Se, m, n):
+    """
+    pressure head without the sign and the scaling, limited as in
+    RICHARDS_1D.theta2psi
+    """
+    Se = np.clip(Se, 1e-6, 0.999999)
+    return pow(pow(Se,-1/m)-1,1/n)
+
+
+class VGTable():
+    """
+    table of kr, c and h for one (m, n, l)
+    """
+
+    def __init__(self, m, n, l, tol=1e-4, n_octave=20, n_div=16,
+                 max_div=8192):
+        """
+        Input:
+            m, n, l: van Genuchten shape parameters
+            tol: maximum relative error of the tabulated values
+            n_octave: the table covers y from 2**-n_octave to 2**n_octave
+            n_div: no. of intervals per octave of the first table tried, a
+            power of 2
+            max_div: maximum no. of intervals per octave
+        """
+        self.m, self.n, self.l = m, n, l
+        self.n_octave = n_octave
+        while True:
+            y = self._nodes(n_octave, n_div)
+            values = self._exact(y)
+            mid = self._exact(0.5*(y[:-1]+y[1:]))
+            err = np.abs(0.5*(values[:-1]+values[1:])-mid)
+            # the intervals across the limits of Se of the exact functions
+            # are not checked, nor the values less than 1e-12, where the
+            # exact kr and c lose their precision (K is then less than
+            # 1e-12 Ks, and smc is the constant 1e-2)
+            Se = y/(1+y)
+            check = (Se[:-1] >= 1e-6) & (Se[1:] <= 0.999999)
+            check = check[:,np.newaxis] & (np.abs(mid) > 1e-12)
+            self.max_err = (err[check]/np.abs(mid[check])).max()
+            if self.max_err <= tol:
+                break
+            if n_div >= max_div:
+                raise ValueError('The tol of the van Genuchten table is not '
+                                 'reached with %d intervals per octave'%max_div)
+            n_div = 2*n_div
+        self.n_div = n_div
+        self.y_min = y[0]
+        self.y_max = y[-1]
+
+        # values at the nodes, and the slopes of the intervals starting at
+        # the nodes (zero for the last one), side by side so that one look
+        # up gives both
+        slopes = np.zeros(values.shape)
+        slopes[:-1] = np.diff(values, axis=0)
+        self.values = np.ascontiguousarray(np.vstack([values.T, slopes.T]))
+
+        # the bits of y (float64) above shift give the index of the node
+        # below y (after removing the one of y_min), the ones below shift
+        # give the position between the nodes
+        self.shift = 52-int(np.log2(n_div))
+        self.base = np.array(self.y_min).view(np.int64) >> self.shift
+        self.mask = (1 << self.shift)-1
+        self.w_scale = 1.0/(1 << self.shift)
+
+    def _nodes(self, n_octave, n_div):
+        """
+        y at the nodes of the table
+        """
+        start = 2.0**np.arange(-n_octave, n_octave)
+        frac = np.arange(n_div)/n_div
+        return np.append((start[:,np.newaxis]*(1+frac)).ravel(), 2.0**n_octave)
+
+    def _exact(self, y):
+        """
+        exact kr, c and h at y, shape (len(y), 3)
+        """
+        Se = y/(1+y)
+        return np.column_stack([vg_kr(Se, self.m, self.l), vg_c(Se, self.m),
+                                vg_h(Se, self.m, self.n)])
+
+    def __len__(self):
+        """
+        no. of nodes of the table
+        """
+        return self.values.shape[1]
+
+    def scaled(self, thetar, thetas, alpha, Ks):
+        """
+        VGLookup of the parameter set
+        """
+        scale = np.array([Ks, alpha*(thetas-thetar)*self.m*self.n, -1/alpha]*2)
+        values = self.values*scale[:,np.newaxis]
+        values[1] += 1e-2
+        return VGLookup(self, values, thetar, thetas)
+
+
+class VGLookup():
+    """
+    table of K, smc and psi of one parameter set
+    """
+
+    def __init__(self, table, values, thetar, thetas):
+        """
+        Input:
+            table: VGTable of the shape parameters
+            values: values and slopes of K, smc and psi at the nodes, shape
+            (6, no. of nodes), see VGTable.scaled
+            thetar, thetas: residual and saturated soil moisture
+        """
+        self.values = values
+        self.thetar = thetar
+        self.thetas = thetas
+        self.shift = table.shift
+        self.base = table.base
+        self.mask = table.mask
+        self.w_scale = table.w_scale
+        # wettest theta of the table
+        self.theta_max = thetar+(thetas-thetar)*table.y_max/(1+table.y_max)
+
+    def __call__(self, theta):
+        """
+        Input:
+            theta: soil moisture
+        Output:
+            K, smc, psi: conductivity, specific moisture capacity and
+            pressure head, of the same shape as theta
+        """
+        # the values below the table are taken at its first node by the
+        # clipping of the index
+        theta = np.minimum(theta, self.theta_max)
+        y = theta-self.thetar
+        y /= self.thetas-theta
+        bits = y.view(np.int64)
+        ind = bits >> self.shift
+        ind -= self.base
+        bits &= self.mask
+        w = np.multiply(bits, self.w_scale, out=y)
+        var = np.take(self.values, ind, axis=1, mode='clip')
+        out = var[3:]
+        out *= w
+        out += var[:3]
+        return out[0], out[1], out[2]
+
+
+class VGTableCache():
+    """
+    least recently used cache of the tables: the VGTable are kept per
+    (m, n, l), and the VGLookup per parameter set
+    """
+
+    def __init__(self, maxsize=8, **kwargs):
+        """
+        Input:
+            maxsize: maximum no. of tables of each kind kept in memory
+            kwargs: tol, n_octave, n_div and max_div of the VGTable
+        """
+        self.maxsize = maxsize
+        self.kwargs = kwargs
+        self.tables = OrderedDict()
+        self.lookups = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, cache, key, make):
+        """
+        value of the key in the cache, made if it is not in the cache
+        """
+        if key in cache:
+            value = cache.pop(key)
+        else:
+            value = make()
+            while len(cache) >= self.maxsize:
+                cache.popitem(last=False)
+        cache[key] = value
+        return value
+
+    def get(self, thetar, thetas, alpha, m, n, l, Ks):
+        """
+        VGLookup of the parameter set, the table of its (m, n, l) is built if
+        it is not in the cache
+        """
+        key = (float(m), float(n), float(l))
+        if key in self.tables:
+            self.hits += 1
+        else:
+            self.misses += 1
+        table = self._get(self.tables, key,
+                          lambda: VGTable(m, n, l, **self.kwargs))
+        return self._get(self.lookups, key+(float(thetar), float(thetas),
+                                            float(alpha), float(Ks)),
+                         lambda: table.scaled(thetar, thetas, alpha, Ks))
+
+    def clear(self):
+        """
+        remove all the tables
+        """
+        self.tables.clear()
+        self.lookups.clear()
@@ -10,6 +10,57 @@ Created on Fri Nov 11 16:49:46 2011
 import xlrd, xlwt
 import numpy as np
 import os
+from collections import OrderedDict
+
+# parsed workbooks of the input files, see open_input
+_input_books = OrderedDict()
+_input_books_size = 4
+
+
+def open_input(fname):
+    """
+    open the xls input file of the models, i.e. RICHARDS_1D and CSGLM
+    the parsed workbook is kept in memory and returned again, as long as the
+    file has not been modified, so the file is parsed only once even if the 
+    models read many sheets or are run many times with the same input file
+
+    Input:
+        fname: name of the xls file
+    Output:
+        book: the xlrd workbook
+    """
+    fname = os.path.abspath(fname)
+    stat = os.stat(fname)
+    stamp = (stat.st_mtime, stat.st_size)
+    
+    if fname in _input_books:
+        book_stamp, book = _input_books.pop(fname)
+        if book_stamp == stamp:
+            _input_books[fname] = book_stamp, book
+            return book
+    
+    book = xlrd.open_workbook(fname)
+    while len(_input_books) >= _input_books_size:
+        _input_books.popitem(last=False)
+    _input_books[fname] = stamp, book
+    return book
+
+def col_array(sheet, colx, start_rowx=1):
+    """
+    read a column of the sheet in one go, as a numpy array
+    the empty cells are filled with nan
+    
+    Input:
+        sheet: the xlrd sheet
+        colx: index of the column
+        start_rowx: index of the first row (default 1, i.e. without header)
+    Output:
+        data: the column
+    """
+    values = sheet.col_values(colx, start_rowx)
+    return np.array([np.nan if value == '' else value for value in values], 
+                    dtype=float)
+
 
 class xlsread():
     """
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 00:21:37 2026
+
+@author: Sat Kumar Tomer
+@email: satkumartomer@gmail.com
+@website: www.ambhas.com
+
+benchmark of the throughput of the RICHARDS_1D, RICHARDS_1D_ENKF and
+RICHARDS_1D_GLUE with the synthetic forcing and soil of ambhas.synthetic,
+so that no input file is needed
+
+the models are run for all the combinations of the regimes (arid, monsoon),
+no. of layers (nz), no. of days and no. of ensemble members, and the
+simulated days per second, member-days per second and the peak memory are
+reported. The peak memory is measured with tracemalloc in a second run, as
+the tracing slows down the model, and the peak resident memory of the
+process is also stored. The results are written to a json file,
+which can be compared with the results of another version:
+
+    python benchmark_richards.py --output new.json
+    python benchmark_richards.py --output new.json --compare old.json
+    python benchmark_richards.py --models richards --nz 40 80 --days 365
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import datetime
+import tempfile
+import numpy as np
+import ambhas
+from ambhas import synthetic
+from ambhas.richards import RICHARDS_1D, RICHARDS_1D_ENKF, RICHARDS_1D_GLUE
+try:
+    import tracemalloc
+except ImportError:
+    # python 2, the memory is not measured
+    tracemalloc = None
+try:
+    import resource
+except ImportError:
+    resource = None
+
+KEYS = ['model', 'regime', 'nz', 'n_day', 'n_ens', 'solver']
+
+def run_model(config, ofile_name):
+    """
+    run the model for one configuration, the input is generated before the
+    timing starts
+    """
+    ensemble = config['model'] != 'richards'
+    kwargs = synthetic.model_input(config['n_day'], config['nz'],
+                                   regime=config['regime'], seed=0,
+                                   ensemble=ensemble)
+    kwargs['solver'] = config['solver']
+    np.random.seed(0)
+
+    # the progress messages of the models are not shown
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        t0 = time.time()
+        if config['model'] == 'richards':
+            RICHARDS_1D(output=False, **kwargs)
+        elif config['model'] == 'enkf':
+            RICHARDS_1D_ENKF(n_ens=config['n_ens'], ofile_name=ofile_name,
+                             analysis=config['analysis'], **kwargs)
+        else:
+            RICHARDS_1D_GLUE(n_ens=config['n_ens'], ofile_name=ofile_name,
+                             **kwargs)
+        return time.time()-t0
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+def benchmark(config, tmp_dir, memory=True):
+    """
+    time of the run, and its peak memory
+    """
+    ofile_name = os.path.join(tmp_dir, 'benchmark.nc')
+    result = dict(config)
+    result['time'] = run_model(config, ofile_name)
+    n_member = config['n_ens'] if config['model'] != 'richards' else 1
+    result['days_per_s'] = config['n_day']/result['time']
+    result['member_days_per_s'] = n_member*config['n_day']/result['time']
+    if memory and tracemalloc is not None:
+        tracemalloc.start()
+        run_model(config, ofile_name)
+        result['peak_mem_mb'] = tracemalloc.get_traced_memory()[1]/2.0**20
+        tracemalloc.stop()
+    if resource is not None:
+        # peak resident memory of the process so far (kB on linux)
+        result['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0
+    if os.path.exists(ofile_name):
+        os.remove(ofile_name)
+    return result
+
+def configs(args):
+    """
+    all the configurations of the sweep
+    """
+    for model in args.models:
+        n_ens_list = [1] if model == 'richards' else args.n_ens
+        for regime in args.regimes:
+            for nz in args.nz:
+                for n_day in args.days:
+                    for n_ens in n_ens_list:
+                        yield {'model':model, 'regime':regime, 'nz':nz,
+                               'n_day':n_day, 'n_ens':n_ens,
+                               'solver':args.solver, 'analysis':args.analysis}
+
+def environment():
+    """
+    versions of the software and the machine, stored with the results
+    """
+    return {'ambhas':ambhas.__version__, 'python':platform.python_version(),
+            'numpy':np.__version__, 'platform':platform.platform(),
+            'processor':platform.processor(),
+            'date':datetime.datetime.now().isoformat()}
+
+def compare(results, old_file):
+    """
+    print the ratio of the throughput and memory to those of another run
+    """
+    with open(old_file) as f:
+        old = json.load(f)['results']
+    old = dict((tuple(r[key] for key in KEYS), r) for r in old)
+    print('\ncompared with %s (ratio new/old)'%old_file)
+    print('%-10s %-8s %5s %6s %6s %10s %10s'%('model', 'regime', 'nz', 'n_day',
+          'n_ens', 'days/s', 'memory'))
+    for r in results:
+        key = tuple(r[k] for k in KEYS)
+        if key not in old:
+            continue
+        mem = (r['peak_mem_mb']/old[key]['peak_mem_mb']
+               if 'peak_mem_mb' in r and 'peak_mem_mb' in old[key] else np.nan)
+        print('%-10s %-8s %5d %6d %6d %10.2f %10.2f'%(r['model'], r['regime'],
+              r['nz'], r['n_day'], r['n_ens'],
+              r['days_per_s']/old[key]['days_per_s'], mem))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--models', nargs='+', default=['richards', 'enkf', 'glue'],
+                        choices=['richards', 'enkf', 'glue'])
+    parser.add_argument('--regimes', nargs='+', default=['arid', 'monsoon'],
+                        choices=sorted(synthetic.REGIMES))
+    parser.add_argument('--nz', nargs='+', type=int, default=[20, 40, 80])
+    parser.add_argument('--days', nargs='+', type=int, default=[90, 365])
+    parser.add_argument('--n_ens', nargs='+', type=int, default=[10, 50])
+    parser.add_argument('--solver', default='vectorized')
+    parser.add_argument('--analysis', default='etkf',
+                        help='analysis of the RICHARDS_1D_ENKF (default etkf)')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='do not measure the peak memory')
+    parser.add_argument('--output', default='benchmark_richards.json')
+    parser.add_argument('--compare', default=None,
+                        help='json file of another run to compare with')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    results = []
+    print('%-10s %-8s %5s %6s %6s %9s %10s %12s %10s'%('model', 'regime', 'nz',
+          'n_day', 'n_ens', 'time(s)', 'days/s', 'member-day/s', 'mem(MB)'))
+    try:
+        for config in configs(args):
+            r = benchmark(config, tmp_dir, args.memory)
+            results.append(r)
+            print('%-10s %-8s %5d %6d %6d %9.2f %10.1f %12.1f %10.1f'%(r['model'],
+                  r['regime'], r['nz'], r['n_day'], r['n_ens'], r['time'],
+                  r['days_per_s'], r['member_days_per_s'],
+                  r.get('peak_mem_mb', np.nan)))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    with open(args.output, 'w') as f:
+        json.dump({'environment':environment(), 'results':results}, f, indent=1)
+    print('results written to %s'%args.output)
+
+    if args.compare is not None:
+        compare(results, args.compare)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 19:12:40 2026
+
+@author: Sat Kumar Tomer
+@email: satkumartomer@gmail.com
+@website: www.ambhas.com
+
+benchmark of the non-uniform vertical grid of the RICHARDS_1D against the
+uniform grid
+
+all the grids are compared with a fine uniform grid (dz = 0.01 m) for the
+maddur input file. The cost is given for a single column (RICHARDS_1D), and
+per column when many columns are solved together (RICHARDS_1D_GRID), where
+it is proportional to the no. of nodes.
+"""
+import os
+import time
+import numpy as np
+from ambhas.richards import RICHARDS_1D, RICHARDS_1D_GRID, stretched_dz
+
+in_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'maddur.xls')
+depths = np.array([0.05, 0.25, 0.5, 1.0, 1.5])
+n_cell = 256
+n_day = 60
+
+def run_column(**kwargs):
+    """
+    run the single column model, and collect the daily fluxes and the soil
+    moisture at the depths
+    """
+    t0 = time.time()
+    model = RICHARDS_1D(in_file, output=False, run=False, solver='vectorized',
+                        **kwargs)
+    recharge, aet, theta = [], [], []
+    for state in model.steps():
+        recharge.append(state['recharge'])
+        aet.append(state['aet'])
+        theta.append(np.interp(depths, model.z_node, state['theta']))
+    out = {'time':time.time()-t0, 'recharge':np.array(recharge)*1000,
+           'aet':np.array(aet)*1000, 'theta':np.array(theta)}
+    return model, out
+
+def run_batch(model, **kwargs):
+    """
+    cost per column-day of n_cell columns solved together
+    """
+    soil_par = dict(model.soil_par)
+    soil_par.pop('m')
+    grid = RICHARDS_1D_GRID(rain=model.rain[:n_day,np.newaxis]*np.ones(n_cell),
+                            pet=model.pet[:n_day], soil_par=soil_par,
+                            theta_0=model.theta[0], no_layer=model.no_layer,
+                            tile_size=n_cell, run=False, **kwargs)
+    t0 = time.time()
+    grid.run()
+    return (time.time()-t0)/(n_cell*n_day)
+
+grids = [('uniform 0.05 m (xls)', {}),
+         ('uniform 0.05 m', {'dz':np.tile(0.05, 40)}),
+         ('uniform 0.02 m', {'dz':np.tile(0.02, 100)}),
+         ('stretched 0.01 m x1.1, max 0.1 m', {'dz':stretched_dz(2.0, 0.01, 1.1, 0.1)}),
+         ('stretched 0.01 m x1.2, max 0.1 m', {'dz':stretched_dz(2.0, 0.01, 1.2, 0.1)}),
+         ('stretched 0.01 m x1.25, max 0.15 m', {'dz':stretched_dz(2.0, 0.01, 1.25, 0.15)}),
+         ('stretched 0.01 m x1.25, max 0.15 m, harmonic',
+          {'dz':stretched_dz(2.0, 0.01, 1.25, 0.15), 'kmid':'harmonic'})]
+
+ref_model, ref = run_column(dz=np.tile(0.01, 200))
+ref['batch'] = run_batch(ref_model, dz=ref_model.dz)
+print('reference: uniform 0.01 m, 200 nodes, %.2f s, %.1f us per column-day'
+      %(ref['time'], 1e6*ref['batch']))
+print('%-46s %5s %8s %8s %10s %10s %10s %10s'%('grid', 'nodes', 'time(s)',
+      'batch', 'rech_rmse', 'rech_cum', 'aet_max', 'sm_max'))
+for name, kwargs in grids:
+    model, out = run_column(**kwargs)
+    batch = run_batch(model, dz=model.dz, kmid=model.kmid)
+    print('%-46s %5d %8.2f %8.1f %10.2e %10.2e %10.2e %10.2e'%(name,
+          model.no_layer, out['time'], 1e6*batch,
+          np.sqrt(np.mean((out['recharge']-ref['recharge'])**2)),
+          out['recharge'].sum()/ref['recharge'].sum()-1,
+          np.abs(out['aet']-ref['aet']).max(),
+          np.abs(out['theta']-ref['theta']).max()))
+print('batch: us per column-day for %d columns; rech_rmse and aet_max in mm/day'%n_cell)
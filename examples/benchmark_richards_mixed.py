@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 21:02:18 2026
+
+@author: Sat Kumar Tomer
+@email: satkumartomer@gmail.com
+@website: www.ambhas.com
+
+benchmark of the mixed form solvers ('picard' and 'newton') of the
+RICHARDS_1D against the solver linearized once per sub-step ('vectorized')
+
+all the runs are compared with the picard solver using sub-steps of at most
+5 minutes, for the maddur input file. The mass balance error is the change
+in the storage minus the infiltration plus the recharge, summed over the
+absolute daily values.
+"""
+import os
+import time
+import numpy as np
+from ambhas.richards import RICHARDS_1D
+
+in_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'maddur.xls')
+
+def run(**kwargs):
+    """
+    run the model, and collect the daily fluxes, soil moisture, no. of
+    sub-steps and iterations, and mass balance error
+    """
+    t0 = time.time()
+    model = RICHARDS_1D(in_file, output=False, run=False, **kwargs)
+    out = dict((key, []) for key in ['recharge', 'aet', 'theta', 'n_sub',
+                                     'n_iter', 'mb_err'])
+    for state in model.steps():
+        for key in out:
+            out[key].append(state[key])
+    for key in out:
+        out[key] = np.array(out[key])
+    out['time'] = time.time()-t0
+    out['n_nonconv'] = model.n_nonconv
+    return out
+
+runs = [('vectorized, fixed', {'solver':'vectorized'}),
+        ('picard, fixed', {'solver':'picard'}),
+        ('newton, fixed', {'solver':'newton'}),
+        ('picard, iterative, max 1 hour', {'solver':'picard', 'dt_control':'iterative',
+                                           'dt_max':3600.0}),
+        ('picard, iterative, max 1 day', {'solver':'picard', 'dt_control':'iterative'}),
+        ('newton, iterative, max 1 hour', {'solver':'newton', 'dt_control':'iterative',
+                                           'dt_max':3600.0}),
+        ('newton, iterative, max 3 hours', {'solver':'newton', 'dt_control':'iterative',
+                                            'dt_max':10800.0}),
+        ('newton, iterative, max 1 day', {'solver':'newton', 'dt_control':'iterative'})]
+
+ref = run(solver='picard', dt_control='iterative', dt_max=300.0, iter_tol=1e-9)
+print('reference: %.1f s, %d sub-steps, recharge %.1f mm'%(ref['time'],
+      ref['n_sub'].sum(), 1000*ref['recharge'].sum()))
+print('%-32s %7s %7s %7s %8s %10s %10s %10s %8s'%('solver', 'time(s)', 'n_sub',
+      'n_iter', 'nonconv', 'mb_err', 'rech_cum', 'aet_max', 'sm_max'))
+for name, kwargs in runs:
+    out = run(**kwargs)
+    print('%-32s %7.2f %7d %7d %8d %10.2e %10.2e %10.2e %8.4f'%(name, out['time'],
+          out['n_sub'].sum(), out['n_iter'].sum(), out['n_nonconv'],
+          np.abs(out['mb_err']).sum(),
+          out['recharge'].sum()/ref['recharge'].sum()-1,
+          1000*np.abs(out['aet']-ref['aet']).max(),
+          np.abs(out['theta']-ref['theta']).max()))
+print('mb_err in m, aet_max in mm/day, rech_cum is the relative error of the total recharge')
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:42:09 2026
+
+@author: Sat Kumar Tomer
+@email: satkumartomer@gmail.com
+@website: www.ambhas.com
+
+benchmark of the tables of the van Genuchten functions (vg_table) of the
+RICHARDS_1D against the exact functions (theta2kr, smcf and theta2psi)
+
+first the conductivity, specific moisture capacity and pressure head are
+computed by _constitutive, exactly and by the table, for the soils of
+ambhas.synthetic and profiles from the residual to the saturated soil
+moisture, for a single column (nz) and for a batch of columns, and the time
+of one call and the largest relative error are reported. Then the model is
+run with the solvers 'loop' and 'vectorized', with and without the table,
+for the maddur input file and the synthetic soils, and the time of the run,
+the time spent in the constitutive phase of the profiler and the largest
+difference of the soil moisture are reported. The synthetic sand dries the
+top layers to an effective saturation of about 2e-6, where the run is ill
+conditioned: a relative change of Ks by 1e-5 changes the soil moisture of
+the exact run by 3.5e-2, more than the table does.
+"""
+import os
+import time
+import numpy as np
+from ambhas import synthetic
+from ambhas.richards import RICHARDS_1D
+
+in_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'maddur.xls')
+textures = ['sand', 'loam', 'clay loam']
+
+def time_call(f, theta, n_rep):
+    """
+    mean time (us) of one call of f(theta)
+    """
+    f(theta)
+    t0 = time.time()
+    for i in range(n_rep):
+        f(theta)
+    return 1e6*(time.time()-t0)/n_rep
+
+print('%-10s %12s %8s %8s %10s %10s %10s'%('texture', 'shape', 'nodes',
+      'n_div', 'exact(us)', 'table(us)', 'max_err'))
+for texture in textures:
+    model = RICHARDS_1D(None, output=False, run=False,
+                        **synthetic.model_input(10, texture=texture))
+    par = [model.soil_par[key] for key in ['thetar', 'thetas', 'alpha', 'm',
+                                           'n', 'l', 'Ks']]
+    table = RICHARDS_1D(None, output=False, run=False, vg_table=True,
+                        **synthetic.model_input(10, texture=texture))
+    table._constitutive(np.array([0.2]), *par)
+    vg = list(table.vg_cache.tables.values())[0]
+    for shape in [(40,), (200,), (100, 40), (1000, 40)]:
+        thetar, thetas = par[0], par[1]
+        theta = np.linspace(1.01*thetar, 0.99*thetas, np.prod(shape)).reshape(shape)
+        n_rep = max(10, int(2e5/theta.size))
+        t_exact = time_call(lambda x: model._constitutive(x, *par), theta, n_rep)
+        t_table = time_call(lambda x: table._constitutive(x, *par), theta, n_rep)
+        err = 0.0
+        for exact, approx in zip(model._constitutive(theta, *par),
+                                 table._constitutive(theta, *par)):
+            err = max(err, (np.abs(approx-exact)/np.abs(exact)).max())
+        print('%-10s %12s %8d %8d %10.1f %10.1f %10.2e'%(texture, shape,
+              len(vg), vg.n_div, t_exact, t_table, err))
+
+def run(kwargs, input_file=None):
+    """
+    run the model with the profiler, and collect the soil moisture
+    """
+    t0 = time.time()
+    model = RICHARDS_1D(input_file, output=False, run=False, profile=True,
+                        **kwargs)
+    sm = [state['theta'] for state in model.steps()]
+    phases = model.profiler.as_dict()['phases']
+    return time.time()-t0, phases['constitutive']['total'], np.array(sm)
+
+print('')
+print('%-22s %-10s %9s %9s %9s %9s %9s'%('input', 'solver', 'exact(s)',
+      'table(s)', 'c_exact', 'c_table', 'sm_max'))
+inputs = [('maddur', in_file, {})]
+for texture in textures:
+    inputs.append(('synthetic, %s'%texture, None,
+                   synthetic.model_input(365, 40, texture=texture, seed=1)))
+for name, input_file, kwargs in inputs:
+    for solver in ['loop', 'vectorized']:
+        t_exact, c_exact, sm_exact = run(dict(kwargs, solver=solver), input_file)
+        t_table, c_table, sm_table = run(dict(kwargs, solver=solver, vg_table=True),
+                                         input_file)
+        print('%-22s %-10s %9.2f %9.2f %9.2f %9.2f %9.1e'%(name, solver, t_exact,
+              t_table, c_exact, c_table, np.abs(sm_table-sm_exact).max()))
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:12:40 2026
+
+@author: Sat Kumar Tomer
+@email: satkumartomer@gmail.com
+@website: www.ambhas.com
+
+input file of the CSGLM and CSGLM_ENKF for the regression tests, made from
+berambadi.xls, which misses some of the sheets and parameters needed now:
+    the surface_storage_par sheet (a=0.1, b=1.0)
+    the depth scaling (fl=3.0) of the soil hydraulic parameters
+    the measured soil moisture (every 5th day) and aet of the CSGLM_ENKF
+and whose aquifer parameters (F=0.9999, G=120) make the gw level rise 
+without bound, with a time scale 1/(1-F) of 10^4 days (F is set to 0.99 and
+G to 5.0)
+
+and the original time step of the CSGLM (layer by layer soil hydraulic
+properties, dense A and F = I + A*dt), the reference of the regression tests
+of the CSGLM and CSGLM_ENKF forecasts
+"""
+import os
+import numpy as np
+import xlrd
+import xlwt
+
+in_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'berambadi.xls')
+
+def berambadi_input(fname, ofile_name, n_day=1000, seed=0):
+    """
+    write the input file
+
+    Input:
+        fname: name of the input file (.xls)
+        ofile_name: name of the output file, written in the output_par sheet
+        n_day: no. of daily time steps of the run
+        seed: seed of the synthetic measurements
+    """
+    book = xlrd.open_workbook(in_file)
+    wbk = xlwt.Workbook()
+    rng = np.random.RandomState(seed)
+    for sheet in book.sheets():
+        out = wbk.add_sheet(sheet.name)
+        for i in range(sheet.nrows):
+            for j in range(sheet.ncols):
+                value = sheet.cell_value(i, j)
+                if sheet.name == 'output_par' and j == 1:
+                    value = ofile_name
+                elif sheet.name == 'gw_par' and (i, j) == (1, 1):
+                    value = 0.99
+                elif sheet.name == 'gw_par' and (i, j) == (1, 2):
+                    value = 5.0
+                elif sheet.name == 'temporal_info' and (i, j) == (1, 2):
+                    value = n_day*86400.0
+                if value != '':
+                    out.write(i, j, value)
+        if sheet.name == 'ind':
+            out.write(sheet.nrows, 0, 'surface_storage_par')
+            out.write(sheet.nrows, 1, 1)
+        elif sheet.name == 'soil_hyd_par':
+            out.write(0, 10, 'fl')
+            out.write(1, 10, 3.0)
+        elif sheet.name == 'forcing':
+            out.write(0, 6, 'meas_sm_mean')
+            out.write(0, 7, 'meas_sm_std')
+            out.write(0, 8, 'meas_aet')
+            for i in range(1, sheet.nrows):
+                if i%5 == 0:
+                    out.write(i, 6, 0.2+0.05*rng.rand())
+                    out.write(i, 7, 0.02)
+                out.write(i, 8, 1.5+rng.rand())
+    out = wbk.add_sheet('surface_storage_par')
+    for j, value in enumerate(['ind', 'a', 'b']):
+        out.write(0, j, value)
+    for j, value in enumerate([1, 0.1, 1.0]):
+        out.write(1, j, value)
+    wbk.save(fname)
+
+def legacy_step(model, sm, par, fl_scale, zl_scale, rz_wp, rz_fc, sm_min,
+                Pn, E, T, storage, gw_level):
+    """
+    original time step of the CSGLM, for one soil column
+    
+    Input:
+        model: CSGLM or CSGLM_ENKF, gives the time step, the layers, the 
+        root depth, the pumping and the surface storage and aquifer parameters
+        sm: soil moisture of the layers at the current time step
+        par: soil hydraulic parameters (dict of scalars)
+        fl_scale, zl_scale: scaling of the parameters with the depth, 
+        exp(-mid_z/fl) and exp(-mid_z/zl)
+        rz_wp, rz_fc: wilting point and field capacity of the transpiration
+        stress index, per layer
+        sm_min: lower bound of the soil moisture, per layer
+        Pn, E, T: net rain, potential evaporation and transpiration over the
+        time step (L)
+        storage, gw_level: surface storage and gw level at the current time 
+        step
+    Output:
+        sm: soil moisture of the next time step
+        gw_level, storage: of the next time step
+        recharge, actual_evap, actual_trans: of the current time step
+    """
+    t = model.t
+    dt = model.dt
+    z = np.asarray(model.z, dtype=float)
+    mid_z = model.mid_z
+    n = model.no_layer
+    theta_s = par['f']*fl_scale
+    
+    # runoff, chen and dudhia
+    Dx = ((theta_s - sm)*mid_z)[:3].sum()
+    Kdt = 3.0*par['Ks']/2e-6
+    Imax = Pn*(Dx*(1-np.exp(-Kdt)))/(Pn+Dx*(1-np.exp(-Kdt)))
+    
+    # fluxes in L/T
+    runoff = (Pn - Imax)/dt
+    evap = E/dt
+    trans = T/dt
+    net_rain = Pn/dt
+    pumping = model.pumping_cur/dt
+    
+    # soil hydraulic properties, layer by layer
+    K = np.zeros(n)
+    D = np.zeros(n)
+    for i in range(n):
+        theta = 0.5*(sm[i]+sm[i+1]) if i < n-1 else sm[i]
+        qr = par['qr']*fl_scale[i]
+        f = par['f']*fl_scale[i]
+        m = 1-1/par['n']
+        Se = min(max((theta-qr)/(f - qr), 0.01), 0.99)
+        K[i] = par['Ks']*Se**par['l']*(1-(1-Se**(1/m))**m)**2
+        D[i] = K[i]/(par['a']*(f-qr)*m*par['n']*(Se**(1/m+1))*(Se**(-1/m)-1)**m)
+    K = K*zl_scale
+    D = D*zl_scale
+    
+    # stress index, root density and actual evaporation and transpiration
+    SSMI = (sm[0] - par['evap_wp'])/(par['evap_fc'] - par['evap_wp'])
+    SSMI = min(max(SSMI, 0), 1)
+    RZSMI = np.zeros(n)
+    for i in range(n):
+        if sm[i] < rz_wp[i]:
+            RZSMI[i] = 0
+        elif sm[i] > rz_fc[i]:
+            RZSMI[i] = 1
+        else:
+            RZSMI[i] = (sm[i]-rz_wp[i])/(rz_fc[i] - rz_wp[i])
+    Rd = model.Rd[t]
+    r_density = np.zeros(n)
+    for i in range(n):
+        z1 = np.sum(z[:i])
+        z2 = min(np.sum(z[:i+1]), Rd)
+        z1 = min(z1, z2)
+        r_density[i] = np.exp(-z1/model.Lrd) - np.exp(-z2/model.Lrd)
+    if Rd > 0:
+        r_density = r_density/(1 - np.exp(-Rd/model.Lrd))
+    AE = evap*SSMI
+    AT = RZSMI*r_density*trans
+    
+    # dense A and U
+    A = np.zeros((n, n))
+    U = np.zeros(n)
+    for i in range(n):
+        if i == 0:
+            A[0,0] = -D[1]/(0.5*z[1]*(z[1]+z[2]))
+            A[0,1] = D[1]/(0.5*z[1]*(z[1]+z[2]))
+            U[0] = (-AT[0] - K[0] + net_rain - AE - runoff + pumping)/z[0]
+        elif i == n-1:
+            A[i,i] = -D[i-1]/(0.5*z[i]*(z[i-1]+z[i]))
+            A[i,i-1] = D[i-1]/(0.5*z[i]*(z[i-1]+z[i]))
+            U[i] = (-AT[i] + K[i-1] - K[i])/z[i]
+        else:
+            A[i,i-1] = D[i-1]/(0.5*z[i]*(z[i-1]+z[i]))
+            A[i,i+1] = D[i]/(0.5*z[i]*(z[i]+z[i+1]))
+            A[i,i] = -A[i,i-1] - A[i,i+1]
+            U[i] = (-AT[i] + K[i-1] - K[i])/z[i]
+    F = np.eye(n) + A*dt
+    theta_1 = np.dot(F, sm) + np.dot(F, U)*dt
+    
+    # hortonian runoff and range of the soil moisture
+    if theta_1[0] >= par['f']:
+        HR = (theta_1[0]-par['f'])*z[0]
+        theta_1[0] = par['f']
+    else:
+        HR = 0
+    theta_1 = np.maximum(np.minimum(theta_1, theta_s), sm_min)
+    
+    # surface storage and groundwater
+    Re = K[-1]*dt
+    storage = storage + runoff + HR
+    Rep = model.surface_storage_par['a']*storage**model.surface_storage_par['b']
+    F_gw = model.gw_par['F']
+    G = model.gw_par['G']
+    hmin = model.gw_par['hmin']
+    u = Re - pumping + Rep
+    gw_level = F_gw*(gw_level-hmin) + G*u + hmin
+    return theta_1, gw_level, storage - Rep, Re, AE*dt, AT.sum()*dt
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 02:51:30 2026
+
+@author: Sat Kumar Tomer
+@email: satkumartomer@gmail.com
+@website: www.ambhas.com
+
+sensitivity of the recharge, AET and root zone soil moisture simulated by
+the RICHARDS_1D to the soil hydraulic parameters, with the Sobol indices or
+the Morris method of ambhas.sensitivity
+
+the forcing and the range of the parameters are the synthetic ones of
+ambhas.synthetic, the parameter sets are run in batches of batch_size on
+n_jobs processes:
+
+    python sensitivity_richards.py --method sobol --n 1024 --n_jobs 8
+    python sensitivity_richards.py --method morris --n 50 --days 730
+"""
+import time
+import argparse
+from ambhas import synthetic, sensitivity
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--method', default='sobol', choices=['sobol', 'morris'])
+    parser.add_argument('--n', type=int, default=256,
+                        help='no. of base samples (sobol) or trajectories (morris)')
+    parser.add_argument('--regime', default='monsoon', choices=sorted(synthetic.REGIMES))
+    parser.add_argument('--texture', default='loam', choices=sorted(synthetic.TEXTURES))
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--nz', type=int, default=20)
+    parser.add_argument('--root_depth', type=float, default=0.5)
+    parser.add_argument('--outputs', nargs='+', default=['recharge', 'aet', 'root_zone_sm'],
+                        choices=sensitivity.OUTPUTS)
+    parser.add_argument('--batch_size', type=int, default=1000)
+    parser.add_argument('--n_jobs', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    kwargs = synthetic.model_input(args.days, args.nz, regime=args.regime,
+                                   texture=args.texture, seed=args.seed)
+    kwargs.pop('soil_par')
+    bounds = synthetic.soil_par_range(args.texture)
+    keys = [key for key in sensitivity.PAR_KEYS if key in bounds]
+
+    if args.method == 'sobol':
+        par = sensitivity.saltelli_sample(bounds, args.n, seed=args.seed)
+    else:
+        par = sensitivity.morris_sample(bounds, args.n, seed=args.seed)
+    n_run = len(par[keys[0]])
+    print('%d runs of %d days'%(n_run, args.days))
+
+    t0 = time.time()
+    y = sensitivity.evaluate(par, args.outputs, args.root_depth, args.batch_size,
+                             args.n_jobs, **kwargs)
+    print('run in %.1f s, %.0f runs/s'%(time.time()-t0, n_run/(time.time()-t0)))
+
+    for name in args.outputs:
+        print('\n%s'%name)
+        if args.method == 'sobol':
+            si = sensitivity.sobol_indices(y[name], len(keys), n_boot=100, seed=args.seed)
+            print('%-8s %8s %8s %8s %8s'%('par', 'S1', 'conf', 'ST', 'conf'))
+            for i, key in enumerate(keys):
+                print('%-8s %8.3f %8.3f %8.3f %8.3f'%(key, si['S1'][i], si['S1_conf'][i],
+                                                      si['ST'][i], si['ST_conf'][i]))
+        else:
+            si = sensitivity.morris_indices(par, y[name], bounds)
+            print('%-8s %10s %10s %10s'%('par', 'mu', 'mu_star', 'sigma'))
+            for i, key in enumerate(keys):
+                print('%-8s %10.3g %10.3g %10.3g'%(key, si['mu'][i], si['mu_star'][i],
+                                                   si['sigma'][i]))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 11:05:20 2026
+
+@author: Sat Kumar Tomer
+@email: satkumartomer@gmail.com
+@website: www.ambhas.com
+
+regression test of the forecast of the CSGLM_ENKF: the members advanced
+together as (n_ens, ...) arrays give the same state as the members advanced
+one at a time, as in the member loop of the older versions (dense A and
+F = I + A*dt, each member stepped once and the pumping converted once)
+"""
+import os
+import shutil
+import tempfile
+import numpy as np
+from ambhas.csglm import CSGLM_ENKF
+from csglm_input import berambadi_input, legacy_step
+
+def member_forecast(model, ens):
+    """
+    forecast of the member ens over the current time step, from the state
+    of the model before its forecast
+
+    Output:
+        sm: soil moisture of the next time step
+        gw_level, surface_storage: of the next time step
+    """
+    t = model.t
+    terms = model.forcing_terms
+    par = dict((key, model.soil_par_ens[key][ens]) for key in model.soil_par_ens)
+    fl_scale, zl_scale = model._depth_scale(model.shp_ens['fl'], model.shp_ens['zl'])
+    trans_wp = model.ET_par['trans_wp'][ens]*fl_scale
+    trans_fc = model.ET_par['trans_fc'][ens]*fl_scale
+    return legacy_step(model, model.sm_ens[ens], par, fl_scale, zl_scale, 
+                       trans_wp, trans_fc, trans_wp, terms['net_rain'][t], 
+                       terms['evap'][t], terms['trans'][t], 
+                       model.surface_storage_ens[ens,t], 
+                       model.gw_level_ens[ens,t])[:3]
+
+tmp_dir = tempfile.mkdtemp()
+try:
+    in_file = os.path.join(tmp_dir, 'berambadi.xls')
+    berambadi_input(in_file, os.path.join(tmp_dir, 'out.npz'), n_day=200)
+    np.random.seed(0)
+    model = CSGLM_ENKF(in_file, ofile_name=os.path.join(tmp_dir, 'enkf.nc'),
+                       run=False)
+
+    max_err = 0.0
+    for t in range(model.max_t):
+        model.t = t
+        model._get_forcing()
+        model._perturb_soil_par_ens()
+        ref = [member_forecast(model, ens) for ens in range(model.n_ens)]
+        model._forecast()
+        for ens in range(model.n_ens):
+            sm, gw_level, storage = ref[ens]
+            max_err = max(max_err, np.abs(model.sm_ens[ens]-sm).max(),
+                          abs(model.gw_level_ens[ens,t+1]-gw_level),
+                          abs(model.surface_storage_ens[ens,t+1]-storage))
+    assert np.isfinite(model.sm_ens).all()
+    assert max_err < 1e-10, max_err
+    model.nc_file.close()
+finally:
+    shutil.rmtree(tmp_dir)
+
+print('the batched forecast matches the member loop, max. difference %.2e'%max_err)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 12:48:31 2026
+
+@author: Sat Kumar Tomer
+@email: satkumartomer@gmail.com
+@website: www.ambhas.com
+
+regression test of the time step of the CSGLM against the original one:
+the interception and root density computed from the forcing before the run,
+the soil hydraulic properties of all the layers together, and the explicit
+soil scheme with the tridiagonal A give the same state as the layer by layer
+properties and the dense A and F = I + A*dt of the original time step
+"""
+import os
+import shutil
+import tempfile
+import numpy as np
+from ambhas.csglm import CSGLM
+from csglm_input import berambadi_input, legacy_step
+
+def dense_forecast(model):
+    """
+    original time step of the CSGLM, from the state of the model at the
+    current time step
+
+    Output:
+        sm: soil moisture of the next time step
+        gw_level, surface_storage: of the next time step
+        recharge, actual_evap, actual_trans: of the current time step
+    """
+    t = model.t
+    par = model.soil_par
+
+    # interception
+    rain = model.rain[t]
+    pet = model.pet[t]*model.kc[t]
+    In = model.lai[t]*0.2/1000.0
+    soil_cover = np.exp(-0.5*model.lai[t])
+    veg_cover = 1 - soil_cover
+    E_In = np.min([veg_cover*rain, veg_cover*pet, veg_cover*In])
+    T = np.min([veg_cover*pet - 0.2*E_In, 1.2*pet - E_In])
+    E = np.min([soil_cover*pet, 1.2*pet-T-E_In])
+    Pn = rain - E_In
+
+    # transpiration stress between the wp and fc of each layer, the soil 
+    # moisture is kept above the wp scaled with the depth
+    fl_scale = np.exp(-model.mid_z/par['fl'])
+    zl_scale = np.exp(-model.mid_z/par['zl'])
+    wp = model.ET_par['trans_wp']*fl_scale
+    return legacy_step(model, model.sm[:,t], par, fl_scale, zl_scale,
+                       model.ET_par['trans_wp'], model.ET_par['trans_fc'], wp,
+                       Pn, E, T, model.surface_storage[t], model.gw_level[t])
+
+tmp_dir = tempfile.mkdtemp()
+try:
+    in_file = os.path.join(tmp_dir, 'berambadi.xls')
+    berambadi_input(in_file, os.path.join(tmp_dir, 'out.npz'), n_day=400)
+    model = CSGLM(in_file, soil_scheme='explicit')
+
+    # step the model again from the start, the thickness of the last layer
+    # follows the gw level
+    model.z[-1] += model.gw_level[model.max_t]-model.gw_level[0]
+    max_err = 0.0
+    for t in range(model.max_t):
+        model.t = t
+        model._get_forcing()
+        sm, gw_level, storage, Re, AE, AT = dense_forecast(model)
+        model._forecast()
+        max_err = max(max_err, np.abs(model.sm[:,t+1]-sm).max(),
+                      abs(model.gw_level[t+1]-gw_level),
+                      abs(model.surface_storage[t+1]-storage),
+                      abs(model.recharge[t]-Re), abs(model.actual_evap[t]-AE),
+                      abs(model.actual_trans[t]-AT))
+    assert np.isfinite(model.sm).all()
+    assert max_err < 1e-10, max_err
+finally:
+    shutil.rmtree(tmp_dir)
+
+print('the time step matches the original one, max. difference %.2e'%max_err)
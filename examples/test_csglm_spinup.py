@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:31:05 2026
+
+@author: Sat Kumar Tomer
+@email: satkumartomer@gmail.com
+@website: www.ambhas.com
+
+regression test of the spin-up of the CSGLM and CSGLM_ENKF: the run starts
+from the spun-up state, which is an equilibrium of the spin-up window
+the implicit soil scheme is used, the explicit one oscillates between the 
+bounds of the soil moisture with the daily time step of berambadi.xls
+"""
+import os
+import shutil
+import tempfile
+import numpy as np
+from ambhas.csglm import CSGLM, CSGLM_ENKF
+from csglm_input import berambadi_input
+
+tmp_dir = tempfile.mkdtemp()
+try:
+    in_file = os.path.join(tmp_dir, 'berambadi.xls')
+    berambadi_input(in_file, os.path.join(tmp_dir, 'out.npz'), n_day=400)
+
+    for spinup_start in [0, 30]:
+        model = CSGLM(in_file, spinup_days=365, spinup_start=spinup_start,
+                      spinup_tol=1e-3, spinup_gw_tol=1e-2, 
+                      soil_scheme='implicit')
+        change = np.array(model.spinup_change)
+        # the change between the cycles decreases till the tolerance
+        assert model.spinup_cycles > 2
+        assert change[-1,0] < 1e-3 and change[-1,1] < 1e-2
+        assert change[0,0] > change[-1,0]
+        # the run starts from the spun-up state, not the initial one
+        assert np.abs(model.sm[:,0]-model.initial_sm.flatten()).max() > 1e-2
+        assert abs(model.gw_level[0]-model.initial_gwl) > 1e-2
+        # one more cycle of the window from the spun-up state hardly
+        # changes it
+        end = spinup_start+365
+        model._copy_state(spinup_start, 0)
+        for t in range(spinup_start, end):
+            model.t = t
+            model._get_forcing()
+            model._forecast()
+        assert np.abs(model.sm[:,end]-model.sm[:,0]).max() < 1e-3
+
+    np.random.seed(0)
+    model = CSGLM_ENKF(in_file, ofile_name=os.path.join(tmp_dir, 'enkf.nc'),
+                       spinup_days=365, spinup_tol=1e-3, spinup_gw_tol=1e-2,
+                       soil_scheme='implicit', run=False)
+    assert model.spinup_cycles > 2
+    assert np.abs(model.gw_level_ens[:,0]-model.initial_gwl).max() > 1e-2
+    assert np.abs(model.sm_ens-model.initial_sm.flatten()).max() > 1e-2
+    model.nc_file.close()
+finally:
+    shutil.rmtree(tmp_dir)
+
+print('the run starts from the spun-up state')
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 22:15:07 2026
+
+@author: Sat Kumar Tomer
+@email: satkumartomer@gmail.com
+@website: www.ambhas.com
+
+regression test of the analysis in the ensemble space (ambhas.enkf) against
+the Kalman filter written with the covariance of the full state
+"""
+import numpy as np
+from ambhas import enkf
+
+np.random.seed(1)
+n_ens, n_state, n_obs = 15, 50, 4
+X = np.random.normal(size=(n_ens, n_state))
+H = np.random.normal(size=(n_obs, n_state))
+y = np.random.normal(size=n_obs)
+R = np.diag(np.random.uniform(0.5, 2, n_obs))
+HX = enkf.obs_operator(X, H)
+
+# kalman gain and analysis covariance in the state space
+A = X-X.mean(axis=0)
+P = np.dot(A.T, A)/(n_ens-1)
+K = np.dot(np.dot(P, H.T), np.linalg.inv(np.dot(np.dot(H, P), H.T)+R))
+x_mean = X.mean(axis=0) + np.dot(K, y-HX.mean(axis=0))
+Pa = np.dot(np.eye(n_state)-np.dot(K, H), P)
+
+# the etkf gives the mean and covariance of the kalman filter
+Xa = enkf.etkf(X, HX, y, R)
+assert np.allclose(Xa.mean(axis=0), x_mean, rtol=0, atol=1e-10)
+assert np.allclose(np.cov(Xa.T), Pa, rtol=0, atol=1e-10)
+assert np.allclose(enkf.etkf(X, HX, y, np.diag(R)), Xa, rtol=0, atol=1e-12)
+
+# the enkf updates each member with its perturbed observations
+np.random.seed(2)
+Xa = enkf.enkf(X, HX, y, R)
+np.random.seed(2)
+v = np.random.normal(size=HX.shape)
+v = np.dot(v-v.mean(axis=0), np.linalg.cholesky(R).T)
+assert np.allclose(Xa, X+np.dot(K, (y+v-HX).T).T, rtol=0, atol=1e-10)
+
+# the missing observations are not used
+y[1] = np.nan
+Xa = enkf.etkf(X, HX, y, np.diag(R))
+Xb = enkf.etkf(X, HX[:,[0,2,3]], y[[0,2,3]], np.diag(R)[[0,2,3]])
+assert np.allclose(Xa, Xb, rtol=0, atol=1e-12)
+
+# augmentation of the state with the parameters
+x, par = enkf.split(enkf.augment(X[:,:3], {'Ks':X[:,3]}, ['Ks']), 3, ['Ks'])
+assert np.all(x == X[:,:3]) and np.all(par['Ks'] == X[:,3])
+
+print('the analysis in the ensemble space matches the kalman filter')
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 12:20:14 2026
+
+@author: Sat Kumar Tomer
+@email: satkumartomer@gmail.com
+@website: www.ambhas.com
+
+regression test of the decimated output of the RICHARDS_1D: the output
+written with output_every, output_depths, output_zones and output_vars is
+the same as the reduction of the full output
+"""
+import os
+import numpy as np
+from ambhas.richards import RICHARDS_1D
+from scipy.io import netcdf as nc
+
+in_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'maddur.xls')
+
+def read_output(**kwargs):
+    """
+    run the model and read its output file
+    """
+    ofile_name = 'richards_output.nc'
+    model = RICHARDS_1D(in_file, ofile_name=ofile_name, **kwargs)
+    output_file = nc.NetCDFFile(ofile_name, 'r')
+    out = dict((name, output_file.variables[name][:].copy())
+               for name in output_file.variables)
+    output_file.close()
+    os.remove(ofile_name)
+    return model, out
+
+model, full = read_output()
+max_t = model.max_t
+every = 7
+n_out = -(-max_t//every)
+start = np.arange(n_out)*every
+end = np.minimum(start+every, max_t)
+
+# the fluxes are summed over the output periods, the year and doy are the
+# ones of the first time step, and sm is sampled at the end of the periods,
+# or averaged over them
+for aggregate in ['sample', 'mean']:
+    dec = read_output(output_every=every, output_aggregate=aggregate)[1]
+    for name in ['rain', 'aet', 'recharge', 'n_iter', 'mb_err']:
+        assert np.allclose(dec[name][:n_out], np.add.reduceat(full[name][:max_t], start),
+                           rtol=1e-10, atol=1e-15), name
+    for name in ['year', 'doy']:
+        assert np.array_equal(dec[name][:n_out], full[name][start])
+    assert np.array_equal(dec['sm'][:,0], full['sm'][:,0])
+    if aggregate == 'sample':
+        sm = full['sm'][:,end]
+    else:
+        sm = np.array([full['sm'][:,i+1:j+1].mean(axis=1) for i, j in zip(start, end)]).T
+    assert np.allclose(dec['sm'][:,1:], sm, rtol=1e-10, atol=1e-15)
+
+# sm at the layers nearest to the depths, and the mean over the zones
+z_node = full['depth']
+depths = [0.05, 0.3, 1.0]
+layer = np.abs(np.array(depths)[:,np.newaxis]-z_node).argmin(axis=1)
+dec = read_output(output_depths=depths)[1]
+assert np.array_equal(dec['sm'], full['sm'][layer])
+assert np.allclose(dec['depth'], z_node[layer])
+
+dz = model.dz_layer
+bottom = dz.cumsum()
+top = bottom-dz
+zones = [(0.0, 0.3), (0.3, 1.0)]
+dec = read_output(output_zones=zones)[1]
+for i, (zone_top, zone_bottom) in enumerate(zones):
+    overlap = np.maximum(np.minimum(bottom, zone_bottom)-np.maximum(top, zone_top), 0)
+    sm = np.dot(overlap, full['sm'])/overlap.sum()
+    assert np.allclose(dec['sm'][i], sm, rtol=1e-10, atol=1e-15)
+
+# only the selected variables are written, with the same values (the
+# fluxes of the last time of the time dimension are not written)
+dec = read_output(output_vars=['sm', 'recharge'])[1]
+assert 'rain' not in dec and 'aet' not in dec
+assert np.array_equal(dec['sm'], full['sm'])
+assert np.array_equal(dec['recharge'][:max_t], full['recharge'][:max_t])
+
+print('decimated output matches the reduction of the full output')
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 11:05:42 2026
+
+@author: Sat Kumar Tomer
+@email: satkumartomer@gmail.com
+@website: www.ambhas.com
+
+regression test of the vectorized solver of the RICHARDS_1D against the
+loop solver, and of the tables of the van Genuchten functions (vg_table)
+against the exact functions
+"""
+import os
+import numpy as np
+from ambhas.richards import RICHARDS_1D
+from scipy.io import netcdf as nc
+
+in_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'maddur.xls')
+
+sm = {}
+for solver in ['loop', 'vectorized']:
+    ofile_name = 'richards_%s.nc'%solver
+    maddur = RICHARDS_1D(in_file, ofile_name=ofile_name, solver=solver)
+    output_file = nc.NetCDFFile(ofile_name, 'r')
+    sm[solver] = output_file.variables['sm'][:].copy()
+    output_file.close()
+    os.remove(ofile_name)
+
+# compare both the solvers over the full run
+assert np.allclose(sm['loop'], sm['vectorized'], rtol=1e-10, atol=1e-12)
+
+# compare both the solvers for a single sub-step for random profiles
+soil_par = maddur.soil_par
+par = (soil_par['thetar'], soil_par['thetas'], soil_par['alpha'],
+       soil_par['m'], soil_par['n'], soil_par['l'], soil_par['Ks'])
+for Bvalue in [-5e-8, 0.0, 1e-6]:
+    theta = soil_par['thetar'] + (soil_par['thetas']-soil_par['thetar'])*\
+            np.random.uniform(0.05, 0.95, maddur.no_layer)
+    theta_loop, J_loop = maddur._richards_step_loop(theta, Bvalue, 3600.0, *par)
+    theta_vec, J_vec = maddur._richards_step_vec(theta, Bvalue, 3600.0, *par)
+    assert np.allclose(theta_loop, theta_vec, rtol=1e-10, atol=1e-12)
+    assert np.allclose(J_loop, J_vec, rtol=1e-10, atol=1e-15)
+
+print('vectorized solver matches the loop solver')
+
+# the tables of the van Genuchten functions, for random profiles and over
+# the full run
+table = RICHARDS_1D(in_file, solver='vectorized', vg_table=True, output=False)
+theta = soil_par['thetar'] + (soil_par['thetas']-soil_par['thetar'])*\
+        np.random.uniform(0.001, 0.999, (100, maddur.no_layer))
+for exact, approx in zip(maddur._constitutive(theta, *par),
+                         table._constitutive(theta, *par)):
+    assert np.allclose(approx, exact, rtol=table.vg_tol, atol=0)
+assert np.allclose(table.theta, sm['vectorized'][:,-1], rtol=0, atol=1e-5)
+
+print('vg_table matches the exact van Genuchten functions')